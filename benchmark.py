@@ -0,0 +1,208 @@
+"""
+Times each stage of an import separately (discovery, EXIF parsing, raw decoding, each sharpness
+feature, the predictor, volume planning and copying) on synthetic files, so it runs anywhere without
+real NEFs, and writes the results as json named after the commit so runs can be compared
+"""
+# pylint: disable=C0103
+import os
+import json
+import shutil
+import tempfile
+
+import numpy as np
+import exifread
+
+import python_batch_processing
+import image_sharpness
+import generic_predictor
+import photo_import
+
+
+def main(args):
+    """
+        The main function of the program. Orchestrates the work
+    """
+    benchmark = photo_import.Benchmark(args.repeat)
+    os.makedirs(args.out[0], exist_ok=True)
+    workDirectory = tempfile.mkdtemp(prefix=".benchmark-", dir=args.out[0])
+    try:
+        print("Writing synthetic files...")
+        folders = max(1, (args.files + 99) // 100)
+        files = photo_import.makeSyntheticTree(os.path.join(workDirectory, "card"), folders, (args.files + folders - 1) // folders)
+
+        print("Discovery")
+        benchmarkDiscovery(benchmark, os.path.join(workDirectory, "card"), len(files))
+        print("EXIF parsing")
+        benchmarkTags(benchmark, files)
+        print("Raw decoding")
+        benchmarkDecode(benchmark, args.input)
+        print("Sharpness features")
+        benchmarkFeatures(benchmark)
+        print("Predictor")
+        benchmarkPredictor(benchmark)
+        print("Volume planning")
+        benchmarkPlanning(benchmark, files, os.path.join(workDirectory, "planned"))
+        print("Copying")
+        benchmarkCopy(benchmark, os.path.join(workDirectory, "copy"), args.copy_files, args.copy_size * 1024 * 1024)
+    finally:
+        shutil.rmtree(workDirectory, ignore_errors=True)
+
+    report = benchmark.getReport()
+    print("Wrote", photo_import.writeReport(report, args.out[0]))
+    if args.compare != None:
+        with open(args.compare[0]) as baselineFile:
+            baseline = json.load(baselineFile)
+        print("Compared with", baseline['commit'])
+        for name, before, after, speedup in photo_import.compareReports(report, baseline):
+            print("\t%s: %.4fs -> %.4fs, %.2fx" % (name, before, after, speedup))
+
+
+def benchmarkDiscovery(benchmark, root, count):
+    """
+    Times finding the files of a synthetic card
+    """
+    benchmark.time("discovery.walkSorted", lambda: list(photo_import.walkSorted(root)), count)
+    benchmark.time("discovery.Discovery", lambda: list(photo_import.Discovery([root])), count)
+
+
+def benchmarkTags(benchmark, files):
+    """
+    Times reading the date and camera model of the synthetic files with exifread and with the TIFF
+    tag reader used for grouping
+    """
+    def readWithExifread(details):
+        for file in files:
+            with open(file, 'rb') as tiffFile:
+                exifread.process_file(tiffFile, details=details)
+
+    benchmark.time("exif.exifread", lambda: readWithExifread(True), len(files))
+    benchmark.time("exif.exifread details=False", lambda: readWithExifread(False), len(files))
+    benchmark.time("exif.readBasicMetadata", lambda: [image_sharpness.readBasicMetadata(file) for file in files], len(files))
+
+
+def benchmarkDecode(benchmark, inputLocations):
+    """
+    Times reading the full metadata and decoding real NEFs, if any were given with --input; the
+    synthetic files have no raw data to decode
+    """
+    files = [path for _, path, _ in photo_import.Discovery(inputLocations)] if inputLocations else []
+    if not files:
+        for name in ["exif.readMetadata"] + ["decode.%s" % source for source in image_sharpness.SOURCES]:
+            benchmark.skip(name, "no NEFs given with --input")
+        return
+
+    metadata = {}
+    benchmark.time("exif.readMetadata", lambda: metadata.update((file, image_sharpness.readMetadata(file)) for file in files),
+                   len(files), repeat=1)
+    for source in image_sharpness.SOURCES:
+        benchmark.time("decode.%s" % source, lambda source=source: [image_sharpness.Image(file, metadata[file], source).decode() for file in files],
+                       len(files), repeat=1)
+
+
+def benchmarkFeatures(benchmark):
+    """
+    Times each of the sharpness feature methods of image_sharpness.Image on a synthetic image which
+    is put in place of the decoded photo, so no decoder is needed
+    """
+    rgb = photo_import.makeSyntheticImage()
+    photo = image_sharpness.Image("synthetic.nef", image_sharpness.Metadata("2021:05:06 10:11:12", "NIKON D610", focalLength=50))
+    photo.afPointScale = 1.0
+    afPointIndex = 1
+
+    def reset(*layers):
+        photo.releaseLayers()
+        photo.layers['rgb'] = rgb
+        for layer in layers:
+            photo.getLayer(layer)
+
+    benchmark.time("image.lumoImage", lambda: photo.getLayer('l'), setup=reset)
+    benchmark.time("image.lumoGradient", lambda: photo.getLayer('grad'), setup=lambda: reset('l'))
+    benchmark.time("image.getWholeImageVarianceSharpness", photo.getWholeImageVarianceSharpness, setup=lambda: reset('l'))
+    benchmark.time("image.getVarianceSharpnessForPrimaryAfPoint", lambda: photo.getVarianceSharpnessForPrimaryAfPoint(afPointIndex),
+                   setup=lambda: reset('l'))
+    benchmark.time("image.getGradientSharpnessForPrimaryAfPoint", lambda: photo.getGradientSharpnessForPrimaryAfPoint(afPointIndex),
+                   setup=lambda: reset('l'))
+    benchmark.time("image.getFourierValues", lambda: photo.getFourierValues(afPointIndex), setup=lambda: reset('l'))
+    benchmark.time("image.getWholeImageGradientSharpness", photo.getWholeImageGradientSharpness, setup=lambda: reset('l'))
+    benchmark.time("image.getFeaturesForImage", lambda: image_sharpness.getFeaturesForImage(photo, afPointIndex), setup=reset)
+    photo.releaseLayers()
+
+    lumoImage = np.asarray(photo_import.makeSyntheticImage()[:, :, 1])
+    blockRows = photo.getBlockRows(lumoImage)
+    benchmark.time("pyramid.gradientMagnitude", lambda: image_sharpness.gradientMagnitude(lumoImage, blockRows))
+    for level in range(4):
+        benchmark.time("pyramid.pyramidStatistics level=%d" % level, lambda level=level: image_sharpness.pyramidStatistics(lumoImage, level, blockRows))
+
+
+def benchmarkPredictor(benchmark, samples=1000, degree=3):
+    """
+    Times a polynomial RuntimePredictor, like the ones sharpness-train.py fits, on random features
+    """
+    featureCount = len(image_sharpness.FEATURE_NAMES)
+    terms = ['1']
+    for power in range(1, degree + 1):
+        terms.extend(["x%d^%d" % (feature, power) for feature in range(featureCount)])
+    terms.extend(["x%d x%d" % (a, b) for a in range(featureCount) for b in range(a + 1, featureCount)])
+    generator = np.random.default_rng(0)
+    predictor = generic_predictor.RuntimePredictor(terms, generator.normal(size=len(terms)), 1.0)
+    features = generator.random((samples, featureCount))
+
+    benchmark.time("predictor.predict", lambda: [predictor.predict(row) for row in features], samples)
+    benchmark.time("predictor.predict_batch", lambda: predictor.predict_batch(features), samples)
+
+
+def benchmarkPlanning(benchmark, files, out):
+    """
+    Times splitting the synthetic files into volumes, both into an empty photos tree and into one
+    which already has volumes on disk
+    """
+    names = [os.path.basename(file) for file in files]
+    basePaths = ["sharp/2021/05/%02d/NIKON_D610" % (1 + i % 2) for i in range(len(files))]
+
+    def plan(planner):
+        return [planner.plan(basePath, name, file) for basePath, name, file in zip(basePaths, names, files)]
+
+    benchmark.time("volumes.VolumePlanner", lambda: plan(photo_import.VolumePlanner()), len(files))
+
+    for basePath in set(basePaths):
+        directory = os.path.join(out, basePath, "1")
+        os.makedirs(directory, exist_ok=True)
+        for number in range(photo_import.VOLUME_SIZE // 2):
+            open(os.path.join(directory, "OLD_%04d.NEF" % number), 'wb').close()
+    benchmark.time("volumes.VolumePlanner with DestinationIndex",
+                   lambda: plan(photo_import.VolumePlanner(destinationIndex=photo_import.DestinationIndex(out))), len(files))
+
+
+def benchmarkCopy(benchmark, root, count, size):
+    """
+    Times copying synthetic files with the CopyEngine, into a folder on the same disk as --out
+    """
+    sources = []
+    os.makedirs(os.path.join(root, "source"), exist_ok=True)
+    for number in range(count):
+        path = os.path.join(root, "source", "DSC_%04d.NEF" % number)
+        photo_import.writeSyntheticTiff(path, padding=size)
+        sources.append(path)
+    destination = os.path.join(root, "destination")
+
+    def copy():
+        copyEngine = photo_import.CopyEngine()
+        for source in sources:
+            copyEngine.submit(source, os.path.join(destination, os.path.basename(source)))
+        copyEngine.close()
+        return copyEngine
+
+    def clear():
+        shutil.rmtree(destination, ignore_errors=True)
+        os.makedirs(destination)
+
+    copyEngine = benchmark.time("copy.CopyEngine", copy, count, setup=clear)
+    print("\t" + copyEngine.getSummary())
+
+
+if __name__ == "__main__":
+    parser = python_batch_processing.StandardisedArguments.create_basic_parser(
+        "Benchmark each stage of importing photos on synthetic files")
+    parser = photo_import.StandardisedArguments.add_benchmark_arguments(parser)
+    arguments = parser.parse_args()
+    main(arguments)
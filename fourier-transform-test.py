@@ -2,7 +2,6 @@ import tkinter
 from PIL import Image as pilImage
 from PIL import ImageTk as tkImage
 import csv
-import numpy as np
 
 import image_sharpness
 import python_batch_processing
@@ -11,31 +10,21 @@ import python_batch_processing
 
 
 
-labelFft = None
-labelClr = None
-photoImageFft = None
-photoImageClr = None
-filesIterator = None
 files = None
-nefImage = None
 lastIndex = 1
-currentRecord = []
-results = [["filename", "a0", "a1", "a2", "a3"]]
+results = [["filename"] + image_sharpness.FOURIER_FEATURE_NAMES]
 
 
 def main(args):
-    global files, filesIterator, photoImageFft, photoImageClr, labelFft, labelClr, lastIndex
+    global files, lastIndex
     print("Finding NEF files...")
     files = getAllNefFiles(args.input)
-    filesIterator = iter(files)
 
-    while True:
-        try:
-            nextImage()
+    chunks = image_sharpness.iterFeatureChunks(files, featureNames=image_sharpness.FOURIER_FEATURE_NAMES, lastIndex=lastIndex)
+    for chunkFiles, featureMatrix, _ in chunks:
+        for nefImagePath, row in zip(chunkFiles, featureMatrix):
+            results.append([nefImagePath] + list(row.tolist()))
             print(".")
-            
-        except StopIteration:
-            break
     
     writeCsv()
 
@@ -48,33 +37,6 @@ def writeCsv():
         w.writerows(results)
 
 
-
-
-def nextImage():
-    global files, filesIterator, lastIndex, currentRecord
-    nefImagePath = next(filesIterator)
-    isImage = image_sharpness.Image(nefImagePath)
-    
-    tileArray = isImage.getPrimaryAfPointTile('l', lastIndex)
-    fftArray = np.fft.fft2(tileArray, [512,512])
-    
-    r2 = fftArray.real ** 2
-    i2 = fftArray.imag ** 2
-    a = np.sqrt(np.add(r2, i2))[0:256, 0:256]
-    a0 = a[0:128, 0:128]
-    a1 = a[128:256, 0:128]
-    a2 = a[0:128, 128:256]
-    a3 = a[128:256, 128:256]
-
-    avg0 = np.average(a0)
-    avg1 = np.average(a1)
-    avg2 = np.average(a2)
-    avg3 = np.average(a3)
-
-    currentRecord = [nefImagePath, avg0, avg1, avg2, avg3]
-    results.append(currentRecord)
-
-
 def getAllNefFiles(inputLocations):
     """
     Uses the recursive search functionality to return a list of NEF files
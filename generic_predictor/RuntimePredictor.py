@@ -1,63 +1,109 @@
-"""
-Takes feature names and coefficients, and allows the user to predict values
-"""
-import re
-
-
-from . import Functions
-
-
-fetchRe = re.compile(r'^x(\d+)$')
-powerRe = re.compile(r'^x(\d+)\^(\d+)$')
-
-class RuntimePredictor:
-    """
-    Takes feature names and coefficients, and allows the user to predict values
-    """
-
-    def __init__(self, featureNames, coefficients, intercept):
-        """
-        Constructs a chain of lambdas
-        """
-        self.terms = []
-        self.coefficients = coefficients
-        self.intercept = intercept
-        
-        for term in featureNames:
-            self.terms.append(processTerm(term))
-    
-    def predict(self, x):
-        result = self.intercept
-        for i, term in enumerate(self.terms):
-            coef = self.coefficients[i]
-            termValue = term(x)
-            resultValue = coef * termValue
-            result += resultValue
-        
-        return result
-
-
-def processTerm(term):
-    """
-    Processes a feature name into a lambda to calculate that term
-    """
-    parts = term.split(' ')
-    if len(parts) == 1:
-        m = fetchRe.match(parts[0])
-        n = powerRe.match(parts[0])
-        if parts[0] == '1':
-            return Functions.one()
-        if m != None:
-            return Functions.fetch(int(m.group(1)))
-        elif n != None:
-            a = Functions.fetch(int(n.group(1)))
-            return Functions.power(a, int(n.group(2)))
-    else:
-        result = Functions.one()
-        terms = map(processTerm, parts)
-        for term in terms:
-            result = Functions.mul(term, result)
-        return result
-
-
-        
\ No newline at end of file
+"""
+Takes feature names and coefficients, and allows the user to predict values
+"""
+import re
+
+import numpy as np
+
+
+fetchRe = re.compile(r'^x(\d+)$')
+powerRe = re.compile(r'^x(\d+)\^(\d+)$')
+
+class RuntimePredictor:
+    """
+    Takes feature names and coefficients, and allows the user to predict values
+    """
+
+    def __init__(self, featureNames, coefficients, intercept):
+        """
+        Compiles the feature names into a matrix of exponents, with a row per term and a column per
+        input feature, so that predictions are a couple of numpy operations
+
+        featureNames:- the name of each term of the polynomial (see buildExponentMatrix)
+        coefficients:- the coefficient of each term
+        intercept:- the constant added to every prediction
+        """
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        self.intercept = intercept
+        self.exponents = buildExponentMatrix(featureNames)
+        self.maxPower = int(self.exponents.max()) if self.exponents.size > 0 else 0
+
+    def predict(self, x):
+        """
+        Predicts the value for a single sample
+
+        x:- the input vector
+        returns:- the predicted value
+        """
+        return self.predict_batch(np.asarray([x], dtype=np.float64))[0]
+
+    def predict_batch(self, X):
+        """
+        Predicts the values for many samples in one vectorised call
+
+        X:- an (n_samples x n_features) array; extra trailing columns are ignored
+        returns:- a numpy array of n_samples predictions
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        nFeatures = self.exponents.shape[1]
+        if X.shape[1] < nFeatures:
+            raise ValueError("Expected at least %d features, got %d" % (nFeatures, X.shape[1]))
+
+        termValues = np.ones((X.shape[0], self.exponents.shape[0]), dtype=np.float64)
+        for feature in range(nFeatures):
+            powers = self.exponents[:, feature]
+            if not powers.any():
+                continue
+            # powerTable[:, k] is the feature raised to the power k
+            powerTable = np.ones((X.shape[0], self.maxPower + 1), dtype=np.float64)
+            for k in range(1, self.maxPower + 1):
+                powerTable[:, k] = powerTable[:, k - 1] * X[:, feature]
+            termValues *= powerTable[:, powers]
+
+        return termValues @ self.coefficients + self.intercept
+
+
+def buildExponentMatrix(featureNames):
+    """
+    Turns the feature names of a polynomial model (eg '1', 'x0', 'x0^2', 'x0 x1^2') into a matrix
+    of exponents
+
+    featureNames:- the list of term names
+    returns:- an (n_terms x n_features) integer numpy array
+    """
+    terms = [parseTerm(term) for term in featureNames]
+    nFeatures = 0
+    for term in terms:
+        for feature in term:
+            nFeatures = max(nFeatures, feature + 1)
+
+    exponents = np.zeros((len(terms), nFeatures), dtype=np.int64)
+    for i, term in enumerate(terms):
+        for feature, power in term.items():
+            exponents[i, feature] += power
+    return exponents
+
+
+def parseTerm(term):
+    """
+    Processes a feature name into the powers of each input feature in that term
+
+    term:- the feature name
+    returns:- a dictionary of <feature index, power>
+    """
+    powers = {}
+    for part in term.split(' '):
+        m = fetchRe.match(part)
+        n = powerRe.match(part)
+        if part == '1':
+            continue
+        if m != None:
+            feature, power = int(m.group(1)), 1
+        elif n != None:
+            feature, power = int(n.group(1)), int(n.group(2))
+        else:
+            raise ValueError("Can't parse term '%s'" % term)
+        powers[feature] = powers.get(feature, 0) + power
+    return powers
@@ -0,0 +1,144 @@
+# pylint: disable=C0103
+"""
+Works on the undemosaiced sensor data of a raw file, so that just the parts of a photo the features
+look at can be demosaiced at full quality, and the rest only at a quarter of the resolution
+"""
+import numpy as np
+
+# the channel of the output rgb image each colour of a raw file's color_desc goes in
+CHANNELS = {'R': 0, 'G': 1, 'B': 2}
+
+# BT.709, which is the gamma curve LibRaw applies by default
+GAMMA_POWER = 0.45
+GAMMA_SLOPE = 4.5
+GAMMA_KNEE = 0.018
+
+# weights of a pixel's neighbours in bilinear demosaicing; normalising by the weights of the neighbours
+# which have a channel gives the average of the closest two or four of them
+BILINEAR_WEIGHTS = np.array([[1, 2, 1], [2, 4, 2], [1, 2, 1]], dtype=np.float32)
+
+
+class Mosaic:
+    """
+    The sensor data of a raw file, with what is needed to turn it into an 8 bit rgb image the way
+    LibRaw's postprocess roughly would: which colour each position of the 2x2 Bayer pattern is, and a
+    lookup table per channel that takes off the black level, applies the white balance and the gamma
+    curve
+    """
+    def __init__(self, raw, pattern, blackLevels, whiteLevel, whiteBalance):
+        """
+        Constructs a mosaic
+
+        raw:- a 2d uint16 numpy array of the visible sensor data
+        pattern:- a 2x2 array of the channel (0, 1 or 2 for r, g or b) of each position of the
+            Bayer pattern, starting at the top left of raw
+        blackLevels:- the black level of each channel
+        whiteLevel:- the value a saturated photosite reads
+        whiteBalance:- the multiplier of each channel
+        """
+        self.raw = raw
+        self.pattern = np.asarray(pattern)
+        self.lookups = np.stack([makeLookup(blackLevels[channel], whiteLevel, whiteBalance[channel] / whiteBalance[1])
+                                 for channel in range(3)])
+
+    @classmethod
+    def fromRaw(cls, rawImage):
+        """
+        Copies the sensor data out of an open rawpy image, so that it can be closed
+
+        rawImage:- an open rawpy image
+        returns:- a Mosaic
+        """
+        colorDesc = rawImage.color_desc.decode('ascii')
+        colors = rawImage.raw_colors_visible[:2, :2]
+        pattern = [[CHANNELS[colorDesc[color]] for color in row] for row in colors]
+        blackLevels = [0, 0, 0]
+        whiteBalance = [1.0, 1.0, 1.0]
+        # the second green of RGBG shares the first's levels
+        for color in range(3):
+            blackLevels[CHANNELS[colorDesc[color]]] = rawImage.black_level_per_channel[color]
+            whiteBalance[CHANNELS[colorDesc[color]]] = rawImage.daylight_whitebalance[color] or 1.0
+        return cls(np.array(rawImage.raw_image_visible, dtype=np.uint16), pattern, blackLevels, rawImage.white_level, whiteBalance)
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    def getBinned(self):
+        """
+        Turns each 2x2 Bayer quad into one rgb pixel, averaging the two greens. Nothing is
+        interpolated, so this is a cheap way to a half resolution image.
+
+        returns:- a (height / 2 x width / 2 x 3) uint8 numpy array
+        """
+        height = self.raw.shape[0] // 2
+        width = self.raw.shape[1] // 2
+        quads = self.raw[:2 * height, :2 * width].reshape(height, 2, width, 2)
+        sums = np.zeros((3, height, width), dtype=np.uint32)
+        counts = [0, 0, 0]
+        for row in range(2):
+            for column in range(2):
+                channel = self.pattern[row, column]
+                sums[channel] += quads[:, row, :, column]
+                counts[channel] += 1
+        rgbImage = np.empty((height, width, 3), dtype=np.uint8)
+        for channel in range(3):
+            rgbImage[:, :, channel] = self.lookups[channel][sums[channel] // max(counts[channel], 1)]
+        return rgbImage
+
+    def demosaicRegion(self, top, bottom, left, right):
+        """
+        Bilinearly demosaics a region of the sensor at full resolution. The region is moved out to
+        even rows and columns so it starts on a whole Bayer quad, and the pixels along its edges are
+        interpolated from reflected neighbours, so callers should ask for a little margin.
+
+        top, bottom, left, right:- the region, in sensor pixels; it is clipped to the sensor
+        returns:- (top, left, a (bottom - top x right - left x 3) uint8 numpy array), where top and
+            left are where the region actually starts
+        """
+        top = max(top - top % 2, 0)
+        left = max(left - left % 2, 0)
+        bottom = min(bottom, self.raw.shape[0])
+        right = min(right, self.raw.shape[1])
+        block = self.raw[top:bottom, left:right].astype(np.float32)
+        channels = np.tile(self.pattern, ((block.shape[0] + 1) // 2, (block.shape[1] + 1) // 2))[:block.shape[0], :block.shape[1]]
+
+        rgbImage = np.empty(block.shape + (3,), dtype=np.uint8)
+        for channel in range(3):
+            mask = (channels == channel).astype(np.float32)
+            interpolated = weightedNeighbourSum(block * mask) / np.maximum(weightedNeighbourSum(mask), 1e-6)
+            values = np.where(mask > 0, block, interpolated)
+            rgbImage[:, :, channel] = self.lookups[channel][np.clip(np.rint(values), 0, len(self.lookups[channel]) - 1).astype(np.uint16)]
+        return top, left, rgbImage
+
+
+def makeLookup(blackLevel, whiteLevel, multiplier):
+    """
+    Builds a table mapping every 16 bit raw value of a channel to its 8 bit output value
+
+    blackLevel:- the value of a photosite which got no light
+    whiteLevel:- the value of a saturated photosite
+    multiplier:- the white balance multiplier of the channel, relative to green
+    returns:- a uint8 numpy array with 65536 entries
+    """
+    linear = (np.arange(65536, dtype=np.float64) - blackLevel) * multiplier / max(whiteLevel - blackLevel, 1)
+    linear = np.clip(linear, 0.0, 1.0)
+    curved = np.where(linear < GAMMA_KNEE, GAMMA_SLOPE * linear, 1.099 * np.power(linear, GAMMA_POWER) - 0.099)
+    return np.clip(np.rint(curved * 255), 0, 255).astype(np.uint8)
+
+
+def weightedNeighbourSum(plane):
+    """
+    Sums each pixel's 3x3 neighbourhood with BILINEAR_WEIGHTS. The edges are reflected without
+    repeating the edge pixel, which keeps the Bayer pattern of the reflected pixels intact.
+
+    plane:- a 2d float32 numpy array
+    returns:- a numpy array the same shape
+    """
+    padded = np.pad(plane, 1, mode='reflect')
+    height, width = plane.shape
+    total = np.zeros_like(plane)
+    for row in range(3):
+        for column in range(3):
+            total += BILINEAR_WEIGHTS[row, column] * padded[row:row + height, column:column + width]
+    return total
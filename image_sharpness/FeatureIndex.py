@@ -0,0 +1,184 @@
+# pylint: disable=C0103
+"""
+A persistent index of per-file metadata and sharpness features, so that files which haven't changed
+are never parsed or decoded twice
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from .Metadata import fromDict
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'photo-import', 'index.sqlite')
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS files (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime INTEGER NOT NULL,
+        metadata TEXT,
+        lastSeen REAL NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS features (
+        path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+        featureKey TEXT NOT NULL,
+        features TEXT NOT NULL,
+        PRIMARY KEY (path, featureKey))"""
+]
+
+def locked(method):
+    """
+    Makes a FeatureIndex method hold the index's lock while it runs
+    """
+    def lockedMethod(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    lockedMethod.__doc__ = method.__doc__
+    lockedMethod.__name__ = method.__name__
+    return lockedMethod
+
+class FeatureIndex:
+    """
+    An SQLite backed store of Metadata records and feature vectors. Entries are keyed by the absolute
+    path of the file, and are only returned while the size and modification time of the file still
+    match what they were when the entry was written. It may be shared between threads.
+    """
+    def __init__(self, indexPath=DEFAULT_INDEX_PATH):
+        """
+        Opens (creating if needed) the index at the given path
+
+        indexPath:- the SQLite file to keep the index in
+        """
+        directory = os.path.dirname(indexPath)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(indexPath, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    @locked
+    def getMetadata(self, path, stat=None):
+        """
+        Looks up the Metadata record for a file. A stale entry (the file has changed since it was
+        indexed) is invalidated and treated as missing.
+
+        path:- the file to look up
+        stat:- the os.stat_result for the file, if the caller already has it
+        returns:- a Metadata object, or None if the file isn't indexed
+        """
+        key = os.path.abspath(path)
+        size, mtime = fileSignature(path, stat)
+        row = self.connection.execute("SELECT size, mtime, metadata FROM files WHERE path = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[0] != size or row[1] != mtime:
+            self.invalidate(path)
+            return None
+        self.connection.execute("UPDATE files SET lastSeen = ? WHERE path = ?", (time.time(), key))
+        if row[2] is None:
+            return None
+        return fromDict(json.loads(row[2]))
+
+    @locked
+    def putMetadata(self, path, metadata, stat=None):
+        """
+        Stores the Metadata record for a file, replacing anything indexed for an older version of it
+
+        path:- the file the record belongs to
+        metadata:- the Metadata object to store
+        stat:- the os.stat_result for the file, if the caller already has it
+        """
+        key = os.path.abspath(path)
+        size, mtime = fileSignature(path, stat)
+        row = self.connection.execute("SELECT size, mtime FROM files WHERE path = ?", (key,)).fetchone()
+        if row is not None and (row[0] != size or row[1] != mtime):
+            self.invalidate(path)
+        self.connection.execute(
+            """INSERT INTO files (path, size, mtime, metadata, lastSeen) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(path) DO UPDATE SET metadata = excluded.metadata, lastSeen = excluded.lastSeen""",
+            (key, size, mtime, json.dumps(metadata.toDict()), time.time()))
+
+    @locked
+    def getFeatures(self, path, featureKey):
+        """
+        Looks up a feature vector for a file. Call getMetadata (or putMetadata) first, which is what
+        checks that the file hasn't changed.
+
+        path:- the file to look up
+        featureKey:- a string describing how the features were computed (eg which AF point was used)
+        returns:- the list of features, or None if they aren't indexed
+        """
+        row = self.connection.execute(
+            "SELECT features FROM features WHERE path = ? AND featureKey = ?",
+            (os.path.abspath(path), featureKey)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    @locked
+    def putFeatures(self, path, featureKey, features):
+        """
+        Stores a feature vector for a file which already has its metadata indexed
+
+        path:- the file the features belong to
+        featureKey:- a string describing how the features were computed
+        features:- a list of numbers
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO features (path, featureKey, features) VALUES (?, ?, ?)",
+            (os.path.abspath(path), featureKey, json.dumps([float(f) for f in features])))
+
+    @locked
+    def invalidate(self, path):
+        """
+        Forgets everything indexed for a file
+
+        path:- the file to forget
+        """
+        self.connection.execute("DELETE FROM files WHERE path = ?", (os.path.abspath(path),))
+
+    @locked
+    def prune(self, maxAgeDays):
+        """
+        Removes entries for files which haven't been looked up or stored in the given number of days
+
+        maxAgeDays:- how many days an entry may go unused before it is removed
+        returns:- the number of files removed from the index
+        """
+        cutoff = time.time() - maxAgeDays * 24 * 60 * 60
+        cursor = self.connection.execute("DELETE FROM files WHERE lastSeen < ?", (cutoff,))
+        self.connection.commit()
+        return cursor.rowcount
+
+    @locked
+    def commit(self):
+        """
+        Writes any outstanding changes to disk
+        """
+        self.connection.commit()
+
+    @locked
+    def close(self):
+        """
+        Commits and closes the index
+        """
+        self.connection.commit()
+        self.connection.close()
+
+
+def fileSignature(path, stat=None):
+    """
+    Returns the (size, modification time in ns) pair used to tell whether a file has changed
+
+    path:- the file to check
+    stat:- the os.stat_result for the file, if the caller already has it
+    """
+    if stat is None:
+        stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
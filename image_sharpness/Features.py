@@ -0,0 +1,189 @@
+# pylint: disable=C0103
+"""
+Extracts the sharpness features of many files at once, as a numpy matrix with named columns
+"""
+import itertools
+import numpy as np
+
+from .Image import Image, DEFAULT_MEMORY_BUDGET, getPeakMemory, resolveAfPointIndices
+from .Pyramid import LEGACY_FEATURE_SET, LEGACY_FEATURE_SET_VERSION
+from .Metadata import readMetadata
+from .Parallel import WorkerPool, limitJobsToMemory
+
+# The features the sharpness model is trained on, in the order it expects them. The names match the
+# columns of the training csv written by sharpness-train.py.
+FEATURE_NAMES = ['wv', 'pv', 'wg', 'pg', 'f', 'd', 'a0', 'a1', 'a2', 'a3']
+FOURIER_FEATURE_NAMES = ['a0', 'a1', 'a2', 'a3']
+
+DEFAULT_CHUNK_SIZE = 64
+
+
+def featureDtype(featureNames=FEATURE_NAMES):
+    """
+    Returns the structured numpy dtype for a feature matrix with the given columns
+    """
+    return np.dtype([(name, np.float64) for name in featureNames])
+
+
+def featureArray(featureMatrix):
+    """
+    Converts a structured feature matrix into a plain (n_files x n_features) float array, eg for
+    passing to RuntimePredictor.predict_batch
+
+    featureMatrix:- a structured array returned by extractFeatures or iterFeatureChunks
+    returns:- a 2d numpy array
+    """
+    names = featureMatrix.dtype.names
+    result = np.empty((len(featureMatrix), len(names)), dtype=np.float64)
+    for i, name in enumerate(names):
+        result[:, i] = featureMatrix[name]
+    return result
+
+
+def getFeaturesForImage(photo, afPointIndex, featureNames=FEATURE_NAMES):
+    """
+    Extracts features from an already constructed Image. Only the requested features are computed,
+    in an order that builds the whole image gradient last.
+
+    photo:- an image_sharpness.Image
+    afPointIndex:- the AF point to use for the tile based features
+    featureNames:- which of FEATURE_NAMES to compute
+    returns:- a list with the value of each requested feature, in the order requested
+    """
+    wanted = set(featureNames)
+    values = {}
+    if 'wv' in wanted:
+        values['wv'] = photo.getWholeImageVarianceSharpness()
+    if 'pv' in wanted:
+        values['pv'] = photo.getVarianceSharpnessForPrimaryAfPoint(afPointIndex)
+    if 'pg' in wanted:
+        values['pg'] = photo.getGradientSharpnessForPrimaryAfPoint(afPointIndex)
+    if wanted.intersection(FOURIER_FEATURE_NAMES):
+        values['a0'], values['a1'], values['a2'], values['a3'] = photo.getFourierValues(afPointIndex)
+    if 'wg' in wanted:
+        values['wg'] = photo.getWholeImageGradientSharpness()
+    values['f'] = photo.getFocalLength()
+    values['d'] = photo.getFocalDistance()
+    return [values[name] for name in featureNames]
+
+
+def getFeatures(filename, metadata, afPointIndex, source='full', memoryBudget=DEFAULT_MEMORY_BUDGET, featureNames=FEATURE_NAMES,
+                data=None, featureSet=LEGACY_FEATURE_SET):
+    """
+    Decodes an image and extracts its features. This is the expensive part of scoring, and is what
+    gets run in the worker processes.
+
+    filename:- the image to extract features from
+    metadata:- the Metadata record for the file, or None to read it from the file
+    afPointIndex:- the AF point to use for the tile based features
+    source:- what to compute the features from, one of SOURCES
+    memoryBudget:- roughly how many bytes of temporaries the image may use
+    featureNames:- which of FEATURE_NAMES to compute
+    data:- the contents of the file as bytes, if it has already been read
+    featureSet:- the FeatureSet to compute
+    returns:- a list with the value of each requested feature
+    """
+    photo = Image(filename, metadata, source, memoryBudget, data, featureSet)
+    if set(featureNames) - {'f', 'd'}:
+        photo.getLayer('l')
+        photo.releaseLayers('rgb')
+    features = getFeaturesForImage(photo, afPointIndex, featureNames)
+    photo.releaseLayers()
+    return features
+
+
+def getFeatureKey(afPointIndex, source, featureSet=LEGACY_FEATURE_SET):
+    """
+    Describes how a set of features was computed, so the index never returns features computed
+    a different way. Version 1 features keep the keys they had before there were versions.
+
+    afPointIndex:- the AF point used for the tile based features
+    source:- what the features were computed from
+    featureSet:- the FeatureSet that was computed
+    returns:- a string key
+    """
+    if featureSet.version == LEGACY_FEATURE_SET_VERSION:
+        return "%s:af=%d" % (source, afPointIndex)
+    return "%s:af=%d:v%d:level=%d" % (source, afPointIndex, featureSet.version, featureSet.pyramidLevel)
+
+
+def iterFeatureChunks(files, metadata=None, featureNames=FEATURE_NAMES, lastIndex=1, source='full',
+                      jobs=1, memoryBudget=DEFAULT_MEMORY_BUDGET, index=None, chunkSize=DEFAULT_CHUNK_SIZE, featureSet=LEGACY_FEATURE_SET):
+    """
+    Extracts the features of many files, a chunk at a time, so that a whole card never has to be held
+    in memory. The AF point carry-over (see resolveAfPointIndices) runs across chunk boundaries, so the
+    result doesn't depend on the chunk size or on the number of jobs.
+
+    files:- the files to extract features from, in order
+    metadata:- a dictionary of <file, Metadata>; files not in it (or all files, if None) are looked up
+        in the index or read
+    featureNames:- which of FEATURE_NAMES to compute
+    lastIndex:- the AF point to use until a file with a primary AF point is seen
+    source:- what to compute the features from, one of SOURCES
+    jobs:- the number of worker processes to spread the work across
+    memoryBudget:- roughly how many bytes of temporaries each worker may use; fewer than jobs workers
+        are used if that many wouldn't fit in memory with the photos they hold (see getPeakMemory)
+    index:- a FeatureIndex to reuse features from (and store new ones in), or None
+    chunkSize:- how many files to yield at a time
+    featureSet:- the FeatureSet to compute
+    yields:- (files, featureMatrix, afPointIndices) for each chunk, where featureMatrix is a structured
+        array with a column per feature name
+    """
+    dtype = featureDtype(featureNames)
+    columns = [FEATURE_NAMES.index(name) for name in featureNames]
+    with WorkerPool(limitJobsToMemory(jobs, getPeakMemory(source, memoryBudget))) as pool:
+        for start in range(0, len(files), chunkSize):
+            chunkFiles = files[start:start + chunkSize]
+            chunkMetadata = [metadata.get(file) if metadata is not None else None for file in chunkFiles]
+            if index is not None:
+                chunkMetadata = [record if record is not None else index.getMetadata(file) for file, record in zip(chunkFiles, chunkMetadata)]
+            unread = [i for i, record in enumerate(chunkMetadata) if record is None]
+            for i, record in zip(unread, pool.map(readMetadata, [chunkFiles[i] for i in unread])):
+                chunkMetadata[i] = record
+
+            afPointIndices = resolveAfPointIndices([m.getPrimaryAfPointIndex() for m in chunkMetadata], lastIndex)
+            lastIndex = afPointIndices[-1]
+
+            featureKeys = [getFeatureKey(afPointIndex, source, featureSet) for afPointIndex in afPointIndices]
+            featureSets = [None] * len(chunkFiles)
+            if index is not None:
+                for i, file in enumerate(chunkFiles):
+                    allFeatures = index.getFeatures(file, featureKeys[i])
+                    if allFeatures is not None:
+                        featureSets[i] = [allFeatures[column] for column in columns]
+
+            missing = [i for i, features in enumerate(featureSets) if features is None]
+            computed = pool.map(getFeatures,
+                [chunkFiles[i] for i in missing], [chunkMetadata[i] for i in missing], [afPointIndices[i] for i in missing],
+                itertools.repeat(source), itertools.repeat(memoryBudget), itertools.repeat(featureNames), itertools.repeat(None),
+                itertools.repeat(featureSet))
+            for i, features in zip(missing, computed):
+                featureSets[i] = features
+                if index is not None and list(featureNames) == FEATURE_NAMES:
+                    index.putMetadata(chunkFiles[i], chunkMetadata[i])
+                    index.putFeatures(chunkFiles[i], featureKeys[i], features)
+            if index is not None:
+                index.commit()
+
+            featureMatrix = np.empty(len(chunkFiles), dtype=dtype)
+            for i, features in enumerate(featureSets):
+                featureMatrix[i] = tuple(features)
+            yield chunkFiles, featureMatrix, afPointIndices
+
+
+def extractFeatures(files, metadata=None, featureNames=FEATURE_NAMES, lastIndex=1, source='full',
+                    jobs=1, memoryBudget=DEFAULT_MEMORY_BUDGET, index=None, chunkSize=DEFAULT_CHUNK_SIZE, featureSet=LEGACY_FEATURE_SET):
+    """
+    Extracts the features of many files into a single feature matrix. Takes the same arguments as
+    iterFeatureChunks.
+
+    returns:- featureMatrix, afPointIndices; a structured array with a row per file and a column per
+        feature name, and the AF point that was used for each row
+    """
+    matrices = [np.empty(0, dtype=featureDtype(featureNames))]
+    afPointIndices = []
+    for _, featureMatrix, chunkAfPointIndices in iterFeatureChunks(files, metadata, featureNames, lastIndex, source,
+                                                                   jobs, memoryBudget, index, chunkSize, featureSet):
+        matrices.append(featureMatrix)
+        afPointIndices += chunkAfPointIndices
+    return np.concatenate(matrices), afPointIndices
@@ -3,12 +3,14 @@
 An object which has functions to test whether an image is sharp
 """
 import os
-import exifread
+import io
 import numpy as np
 import rawpy
 from PIL import Image as pilImage
 import imageio
-from . import NefDecrypt
+from .Metadata import readMetadata, readMetadataFromBuffer
+from .Bayer import Mosaic
+from .Pyramid import LEGACY_FEATURE_SET, LEGACY_FEATURE_SET_VERSION, gradientMagnitude, pyramidStatistics
 
 AfPointLookup = [[0,0],
 [3015,2014],
@@ -51,41 +53,96 @@ AfPointLookup = [[0,0],
 [1845,1674],
 [1845,2354]]
 
-AFINFO2_TAG = "MakerNote AFInfo2"
-FOCALLENGTH_TAG = "EXIF FocalLengthIn35mmFilm"
-SHUTTERCOUNT_TAG = "MakerNote TotalShutterReleases"
-SERIAL_TAG = "MakerNote SerialNumber"
-LENSDATA_TAG =  "MakerNote LensData"
+SOURCES = ['full', 'preview', 'region']
+
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# the size of photo the memory estimates are made for, a D610 NEF
+EXPECTED_PIXELS = 6016 * 4016
+
+# the bytes per sensor pixel of the full size layers an Image holds at its peak, which the memory budget
+# doesn't cover: for 'full', LibRaw's raw data (2) and working image (8) while the rgb image (3) is made;
+# for 'preview', the rgb (3), grayscale (1) and float32 gradient (4) layers of a full size preview; and
+# for 'region', the sensor data (2), with LibRaw's copy of it while it is read (2)
+LAYER_BYTES_PER_PIXEL = {'full': 13, 'preview': 8, 'region': 4}
+
+FFT_SIZE = 512
+
+# how far past an AF point box the 'region' source demosaics, so that neither the interpolation at the
+# edge of the region nor the gradient at the edge of the box runs out of neighbours
+REGION_MARGIN = 4
+
+def getPeakMemory(source='full', memoryBudget=DEFAULT_MEMORY_BUDGET, pixels=EXPECTED_PIXELS):
+    """
+    Estimates the most memory scoring one photo takes: its full size layers, which are the same
+    whatever the budget, and the temporaries the budget limits
+
+    source:- what the features are computed from, one of SOURCES
+    memoryBudget:- the memory budget the Image is given
+    pixels:- how many pixels the photo's sensor has
+    returns:- a number of bytes
+    """
+    return LAYER_BYTES_PER_PIXEL[source] * pixels + memoryBudget
 
 class Image:
     """
     An object which has functions to test whether an image is sharp
     """
-    def __init__(self, filename):
+    def __init__(self, filename, metadata=None, source='full', memoryBudget=DEFAULT_MEMORY_BUDGET, data=None, featureSet=LEGACY_FEATURE_SET):
         """
-        Constructs a new Image object which extracts the rgb, grayscale and gradient layers of itself, 
-        and grabs the AFInfo2 header from the image
+        Constructs a new Image object. The rgb, grayscale and gradient layers are only extracted the
+        first time something needs them, and are then cached until releaseLayers is called.
 
         filename:- the file to load
+        metadata:- the Metadata record for the file, if the caller has already read it
+        source:- 'full' to demosaic the raw data, 'preview' to use the embedded JPEG preview, which is
+            much faster to decode but gives features on a smaller image, or 'region' to demosaic only
+            the AF point tiles from the sensor data, with the whole image statistics worked out on the
+            sensor data binned to half resolution
+        memoryBudget:- roughly how many bytes the temporaries of this image may use; whole image
+            statistics are worked out in blocks of rows so that they stay well inside it. The full
+            size layers come on top of it (see getPeakMemory)
+        data:- the contents of the file as bytes, if the caller has already read it, so that the file
+            isn't read again
+        featureSet:- the FeatureSet saying how the gradient and the whole image statistics are worked out
         """
-        with rawpy.imread(filename) as rawImage:
-            self.rgbImage = rawImage.postprocess()
-            lumoImage = pilImage.fromarray(self.rgbImage).convert('L')
-            
-            self.lumoImage = np.asarray(lumoImage, dtype=np.int32)
-            self.lumoGradient = gradientFromLumo(lumoImage)
-        
-
-        tags = getTagsFromFile(filename)
-        self.AFInfo2 = tags[AFINFO2_TAG]
-        self.FocalLength = tags[FOCALLENGTH_TAG]
-        self.SerialNumber = tags[SERIAL_TAG]
-        self.ShutterCount = tags[SHUTTERCOUNT_TAG]
-
-        lensDataCipher = tags[LENSDATA_TAG].values[4:]
-        lensDataClear = NefDecrypt.Decrypt(lensDataCipher, int(self.SerialNumber.values), int(self.ShutterCount.values[0]))
-        lensDataFocalDistance = lensDataClear[6]
-        self.FocalDistance = (0.01 * pow(10, lensDataFocalDistance / 40))
+        self.filename = filename
+        self.data = data
+        self.source = source
+        self.featureSet = featureSet
+        self.memoryBudget = memoryBudget
+        self.layers = {}
+        self.afPointScale = None
+
+        if metadata is None:
+            metadata = readMetadata(filename) if data is None else readMetadataFromBuffer(data)
+        self.metadata = metadata
+        self.FocalLength = metadata.focalLength
+        self.FocalDistance = metadata.focalDistance
+
+    @property
+    def rgbImage(self):
+        return self.getLayer('rgb')
+
+    @property
+    def lumoImage(self):
+        return self.getLayer('l')
+
+    @property
+    def lumoGradient(self):
+        return self.getLayer('grad')
+
+    def releaseLayers(self, *layers):
+        """
+        Drops cached layers so their memory can be reclaimed. They are rebuilt if they are needed again.
+
+        layers:- the names of the layers to drop ('rgb', 'l', 'grad', 'mosaic' or 'pyramid'), or nothing
+            to drop them all
+        """
+        if len(layers) == 0:
+            layers = list(self.layers.keys())
+        for layer in layers:
+            self.layers.pop(layer, None)
 
     def getPrimaryAfPointIndex(self, lastIndex):
         """
@@ -93,7 +150,7 @@ class Image:
 
         lastIndex:- the previous index retrieved. This allows the caller to reuse the last focus point
         """
-        index = self.AFInfo2.values[7]
+        index = self.metadata.getPrimaryAfPointIndex()
         if index == 0:
             index = lastIndex
         return index
@@ -110,54 +167,151 @@ class Image:
     
     def getAfPointTile(self, afPointIndex, layer):
         """
-        Returns the tile corresponding to the primary AF Point for the image, from the selected layer
+        Returns the tile corresponding to the primary AF Point for the image, from the selected layer.
+        If the whole image gradient hasn't been built, the gradient tile is computed from just the
+        luminance around the tile.
 
         afPointIndex:- the index of the AF point to retrieve the tile for
         layer:- as string with one of 'rgb', 'l' or 'grad', selects which layer the tile comes from
         returns:- a numpy array with the requested tile
         """
-        top, bottom, left, right = determineAfPointBox(afPointIndex)
-        if layer == 'rgb':
-            return self.rgbImage[top:bottom, left:right, :]
-        elif layer == 'l':
-            return self.lumoImage[top:bottom, left:right]
-        elif layer == 'grad':
-            return self.lumoGradient[top:bottom, left:right]
-        else:
-            return np.asarry([[0]], dtype=np.int32)
+        if self.source == 'region':
+            return self.getRegionTile(afPointIndex, layer)
+
+        if layer == 'grad' and 'grad' not in self.layers:
+            lumoImage = self.getLayer('l')
+            top, bottom, left, right = determineAfPointBox(afPointIndex, self.afPointScale)
+            marginTop = max(top - 1, 0)
+            marginLeft = max(left - 1, 0)
+            tileGradient = self.getGradient(lumoImage[marginTop:bottom + 1, marginLeft:right + 1], self.getBlockRows(lumoImage))
+            return tileGradient[top - marginTop:bottom - marginTop, left - marginLeft:right - marginLeft]
+
+        if layer not in ('rgb', 'l', 'grad'):
+            return np.asarray([[0]], dtype=np.uint8)
+        image = self.getLayer(layer)
+        top, bottom, left, right = determineAfPointBox(afPointIndex, self.afPointScale)
+        return image[top:bottom, left:right]
+
+    def getRegionTile(self, afPointIndex, layer):
+        """
+        Returns the tile for an AF point demosaiced at full resolution from just the sensor data around
+        it, which is how the 'region' source gets full quality tiles without decoding the whole image.
+        The rgb, grayscale and gradient tiles are all cached the first time any of them is asked for.
+
+        afPointIndex:- the index of the AF point to retrieve the tile for
+        layer:- as string with one of 'rgb', 'l' or 'grad', selects which layer the tile comes from
+        returns:- a numpy array with the requested tile
+        """
+        if layer not in ('rgb', 'l', 'grad'):
+            return np.asarray([[0]], dtype=np.uint8)
+        name = "%s:af=%d" % (layer, afPointIndex)
+        if name not in self.layers:
+            top, bottom, left, right = determineAfPointBox(afPointIndex)
+            regionTop, regionLeft, rgbRegion = self.getLayer('mosaic').demosaicRegion(
+                top - REGION_MARGIN, bottom + REGION_MARGIN, left - REGION_MARGIN, right + REGION_MARGIN)
+            lumoRegion = np.asarray(pilImage.fromarray(rgbRegion).convert('L'), dtype=np.uint8)
+            regions = {'rgb': rgbRegion, 'l': lumoRegion, 'grad': self.getGradient(lumoRegion)}
+            for regionLayer, region in regions.items():
+                self.layers["%s:af=%d" % (regionLayer, afPointIndex)] = region[top - regionTop:bottom - regionTop, left - regionLeft:right - regionLeft]
+        return self.layers[name]
 
     def getLayer(self, layer):
         """
-        Gets the given layer from the image
+        Gets the given layer from the image, building (and caching) it and the layers it depends on
+        if needed
 
-        layer:- as string with one of 'rgb', 'l' or 'grad', selects which layer to retrieve
+        layer:- as string with one of 'rgb', 'l' or 'grad', selects which layer to retrieve; 'mosaic' gives
+            the sensor data for the 'region' source, and 'pyramid' the (variance, gradient) whole image
+            statistics of a version 2 feature set
         """
+        if layer in self.layers:
+            return self.layers[layer]
+
         if layer == 'rgb':
-            return self.rgbImage
+            self.layers['rgb'] = self.decode()
         elif layer == 'l':
-            return self.lumoImage
+            lumoImage = pilImage.fromarray(self.getLayer('rgb')).convert('L')
+            self.layers['l'] = np.asarray(lumoImage, dtype=np.uint8)
         elif layer == 'grad':
-            return self.lumoGradient
+            lumoImage = self.getLayer('l')
+            self.layers['grad'] = self.getGradient(lumoImage, self.getBlockRows(lumoImage))
+        elif layer == 'pyramid':
+            lumoImage = self.getLayer('l')
+            self.layers['pyramid'] = pyramidStatistics(lumoImage, self.featureSet.pyramidLevel, self.getBlockRows(lumoImage))
+        elif layer == 'mosaic':
+            with self.openRaw() as rawImage:
+                self.layers['mosaic'] = Mosaic.fromRaw(rawImage)
         else:
-            return np.asarry([[0]], dtype=np.int32)
+            return np.asarray([[0]], dtype=np.uint8)
+        return self.layers[layer]
+
+    def decode(self):
+        """
+        Decodes the rgb image from the file, according to the source the Image was created with
+
+        returns:- a numpy array with the rgb image
+        """
+        if self.source == 'region':
+            self.afPointScale = 0.5
+            return self.getLayer('mosaic').getBinned()
+        with self.openRaw() as rawImage:
+            if self.source == 'preview':
+                rgbImage = decodePreview(rawImage)
+                self.afPointScale = max(rgbImage.shape[:2]) / max(rawImage.sizes.width, rawImage.sizes.height)
+            else:
+                rgbImage = rawImage.postprocess()
+                self.afPointScale = 1.0
+        return rgbImage
+
+    def openRaw(self):
+        """
+        Opens the raw file (or the contents of it the Image was given) with rawpy
+
+        returns:- an open rawpy image, to be used in a with statement
+        """
+        return rawpy.imread(self.filename if self.data is None else io.BytesIO(self.data))
+
+    def getGradient(self, lumoImage, blockRows=None):
+        """
+        Works out the gradient of a grayscale image the way the feature set says to: the x gradient
+        only for version 1, and the true gradient magnitude after that
+        """
+        if self.featureSet.version == LEGACY_FEATURE_SET_VERSION:
+            return gradientFromLumo(lumoImage, blockRows)
+        return gradientMagnitude(lumoImage, blockRows)
+
+    def getBlockRows(self, image):
+        """
+        Works out how many rows of an image can be processed at once while keeping the (8 byte per
+        pixel) temporaries inside an eighth of the memory budget
+
+        image:- the image that will be processed in blocks
+        returns:- a number of rows
+        """
+        rowBytes = 8 * max(image.size // max(image.shape[0], 1), 1)
+        return max(1, (self.memoryBudget // 8) // rowBytes)
     
     def getWholeImageGradientSharpness(self):
         """
         Average the entire image gradient to give overall 'sharpness'
         """
-        return np.average(self.lumoGradient)
+        if self.featureSet.version != LEGACY_FEATURE_SET_VERSION:
+            return self.getLayer('pyramid')[1]
+        return np.mean(self.getLayer('grad'), dtype=np.float64)
 
     def getGradientSharpnessForPrimaryAfPoint(self, lastIndex):
         """
         Average the primary af point tile gradient to give 'sharpness' of the tile
         """
-        return np.average(self.getPrimaryAfPointTile('grad', lastIndex))
+        return np.mean(self.getPrimaryAfPointTile('grad', lastIndex), dtype=np.float64)
 
     def getWholeImageVarianceSharpness(self):
         """
         Get variance measure for whole image
         """
-        return self.getVarianceSharpnessForImage(self.lumoImage)
+        if self.featureSet.version != LEGACY_FEATURE_SET_VERSION:
+            return self.getLayer('pyramid')[0]
+        return self.getVarianceSharpnessForImage(self.getLayer('l'))
     
     
     def getVarianceSharpnessForImage(self, image):
@@ -165,13 +319,7 @@ class Image:
         Uses the variance method (http://www.csl.cornell.edu/~cbatten/pdfs/batten-image-processing-sem-slides-scanning2001.pdf)
         to calculate image sharpness
         """
-        normImage = image / 255
-        meanIntensity = np.average(normImage)
-        diff = normImage - meanIntensity
-        diffSq = diff**2
-        sharpnessVector = np.add.reduce(diffSq)
-        sharpness = np.add.reduce(sharpnessVector) / normImage.size
-        return sharpness
+        return normalisedVariance(image, self.getBlockRows(image))
 
     def getVarianceSharpnessForPrimaryAfPoint(self, lastIndex):
         """
@@ -197,66 +345,134 @@ class Image:
         Uses a 2D fourier transofrm to give average values in four frequency bands
         """
         tileArray = self.getPrimaryAfPointTile('l', lastIndex)
-        fftArray = np.fft.fft2(tileArray, [512,512])
-    
-        r2 = fftArray.real ** 2
-        i2 = fftArray.imag ** 2
-        a = np.sqrt(np.add(r2, i2))[0:256, 0:256]
-        a0 = a[0:128, 0:128]
-        a1 = a[128:256, 0:128]
-        a2 = a[0:128, 128:256]
-        a3 = a[128:256, 128:256]
+        return tuple(fourierValuesForTiles(tileArray[np.newaxis])[0])
 
-        avg0 = np.average(a0)
-        avg1 = np.average(a1)
-        avg2 = np.average(a2)
-        avg3 = np.average(a3)
+    def getFourierValuesForAfPoints(self, afPointIndices):
+        """
+        Gives the four fourier band averages for several AF points at once, using a single stacked FFT
+
+        afPointIndices:- the AF points to use
+        returns:- an (n x 4) numpy array with avg0..avg3 for each AF point
+        """
+        tiles = np.stack([self.getAfPointTile(afPointIndex, 'l') for afPointIndex in afPointIndices])
+        return fourierValuesForTiles(tiles)
 
-        return avg0, avg1, avg2, avg3
 
 
 
 
+def fourierValuesForTiles(tiles):
+    """
+    Computes the average magnitude of the low frequency quadrant of the 512x512 zero padded spectrum of
+    each tile, in four 128x128 frequency bands. The tiles are real, so a real input FFT is used, which
+    only computes the half of the spectrum we look at, and many tiles are transformed in one call.
+
+    tiles:- an (n x height x width) array of grayscale tiles
+    returns:- an (n x 4) numpy array with avg0, avg1, avg2, avg3 for each tile
+    """
+    spectrum = np.fft.rfft2(np.asarray(tiles, dtype=np.float64), s=(FFT_SIZE, FFT_SIZE), axes=(-2, -1))
+    half = FFT_SIZE // 2
+    band = half // 2
+    magnitude = np.abs(spectrum[:, :half, :half]).reshape(-1, 2, band, 2, band)
+    bands = magnitude.mean(axis=(2, 4))
+    # avg0 is the low/low band, avg1 is high rows/low columns, avg2 low rows/high columns, avg3 high/high
+    return np.stack([bands[:, 0, 0], bands[:, 1, 0], bands[:, 0, 1], bands[:, 1, 1]], axis=1)
+
 
 def fromFile(filename):
     return Image(filename)
 
 
-def gradientFromLumo(lumoImage):
+def resolveAfPointIndices(afPointIndices, lastIndex=1):
+    """
+    Applies the AF point carry-over rule to a sequence of primary AF point indices. A frame without a
+    primary AF point (index 0) reuses the primary point of the closest preceding frame that has one,
+    and frames before the first such frame use lastIndex. Because the rule only depends on the order
+    of the files, serial and parallel scoring of the same sorted file list always agree.
+
+    afPointIndices:- the primary AF point indices, in file order, as read from AFInfo2
+    lastIndex:- the index to use until a frame with a primary AF point is seen
+    returns:- a list of AF point indices with no zeros in it
+    """
+    resolved = []
+    for index in afPointIndices:
+        if index != 0:
+            lastIndex = index
+        resolved.append(lastIndex)
+    return resolved
+
+
+def normalisedVariance(image, blockRows):
+    """
+    Calculates the variance of an 8 bit image scaled to 0-1, in a single pass over blocks of rows so
+    that no full size temporaries are needed. Integer images are summed exactly.
+
+    image:- a numpy array with a grayscale image
+    blockRows:- how many rows to process at once
+    returns:- the variance
+    """
+    if image.size == 0:
+        return 0.0
+    isInteger = np.issubdtype(image.dtype, np.integer)
+    shift = 0.0 if isInteger else float(np.mean(image[:blockRows], dtype=np.float64))
+    total = 0
+    totalSq = 0
+    for start in range(0, image.shape[0], blockRows):
+        if isInteger:
+            block = image[start:start + blockRows].astype(np.int64)
+        else:
+            block = image[start:start + blockRows].astype(np.float64) - shift
+        total += block.sum()
+        totalSq += np.einsum('ij,ij->', block, block)
+    mean = float(total) / image.size
+    return (float(totalSq) / image.size - mean * mean) / (255 * 255)
+
+
+def gradientFromLumo(lumoImage, blockRows=None):
     """
-    Converts a grayscale image into the 2d gradient of that image
+    Converts a grayscale image into the 2d gradient of that image. This has always been the magnitude
+    of the x gradient only, because the y gradient was passed to np.sqrt as its output array; that is
+    kept so existing models stay valid, without working out the unused y gradient.
 
     lumoImage:- a grayscale image
-    returns:- a numpy array containing the gradient data
+    blockRows:- how many rows to process at once, or None to do the whole image in one go
+    returns:- a float32 numpy array containing the gradient data
     """
-    luminosityData = np.asarray(lumoImage, dtype=np.int32)
-    yGradient, xGradient = np.gradient(luminosityData)
-    normGradient = np.sqrt(xGradient**2, yGradient**2)
+    luminosityData = np.asarray(lumoImage)
+    if blockRows is None:
+        blockRows = max(luminosityData.shape[0], 1)
+    normGradient = np.empty(luminosityData.shape, dtype=np.float32)
+    for start in range(0, luminosityData.shape[0], blockRows):
+        block = luminosityData[start:start + blockRows].astype(np.float32)
+        normGradient[start:start + blockRows] = np.abs(np.gradient(block, axis=1))
     return normGradient
 
 
-def getTagsFromFile(nefFilePath):
+def decodePreview(rawImage):
     """
-    Retrieve the tags from an NEF file
+    Decodes the preview image embedded in a raw file
 
-    nefFilePath:- the path of the file to read
-    returns:= a list of the EXIF tags in the file
+    rawImage:- an open rawpy image
+    returns:- a numpy array with the rgb preview
     """
-    tags = []
-    with open(nefFilePath, 'rb') as nefFile:
-        tags = exifread.process_file(nefFile)
-    return tags
+    thumb = rawImage.extract_thumb()
+    if thumb.format == rawpy.ThumbFormat.JPEG:
+        return np.asarray(pilImage.open(io.BytesIO(thumb.data)).convert('RGB'))
+    return thumb.data
 
-def determineAfPointBox(afPointIndex):
+def determineAfPointBox(afPointIndex, scale=1.0):
     """
     Extracts the coordinates of the primary AF point
 
-    file:- the raw image to process
+    afPointIndex:- the index of the AF point
+    scale:- the size of the image the box is for, relative to the full size image (eg for a preview)
     returns: = top, bottom, left, right
     """
     afPointCentre = AfPointLookup[afPointIndex]
-    top = afPointCentre[1] - 128
-    bottom = afPointCentre[1] + 127
-    left = afPointCentre[0] - 128
-    right = afPointCentre[0] + 127
+    centreX = int(round(afPointCentre[0] * scale))
+    centreY = int(round(afPointCentre[1] * scale))
+    top = centreY - int(round(128 * scale))
+    bottom = centreY + int(round(127 * scale))
+    left = centreX - int(round(128 * scale))
+    right = centreX + int(round(127 * scale))
     return top, bottom, left, right
@@ -0,0 +1,121 @@
+# pylint: disable=C0103
+"""
+The EXIF metadata that the importer and the sharpness tests need from an NEF, read once per file
+"""
+import io
+import exifread
+from . import NefDecrypt
+
+CAMERA_TAG = "Image Model"
+DATE_TAG = "Image DateTime"
+AFINFO2_TAG = "MakerNote AFInfo2"
+FOCALLENGTH_TAG = "EXIF FocalLengthIn35mmFilm"
+SHUTTERCOUNT_TAG = "MakerNote TotalShutterReleases"
+SERIAL_TAG = "MakerNote SerialNumber"
+LENSDATA_TAG = "MakerNote LensData"
+
+class Metadata:
+    """
+    A plain record of the tags we care about from one file. It only holds python values (no exifread
+    objects) so that it is cheap to pass to worker processes and to store.
+    """
+    def __init__(self, dateTime, model, afInfo2=None, focalLength=None, serialNumber=None, shutterCount=None, lensData=None):
+        """
+        Constructs a new metadata record
+
+        dateTime:- the 'Image DateTime' tag, as a string
+        model:- the 'Image Model' tag, as a string
+        afInfo2:- the values of the AFInfo2 MakerNote tag, or None
+        focalLength:- the 35mm equivalent focal length, or None
+        serialNumber:- the camera serial number, or None
+        shutterCount:- the total shutter releases of the camera, or None
+        lensData:- the (still encrypted) LensData MakerNote bytes, or None
+        """
+        self.dateTime = dateTime
+        self.model = model
+        self.afInfo2 = afInfo2
+        self.focalLength = focalLength
+        self.serialNumber = serialNumber
+        self.shutterCount = shutterCount
+        self.lensData = lensData
+        self.focalDistance = None
+        if lensData is not None and serialNumber is not None and shutterCount is not None:
+            lensDataClear = NefDecrypt.Decrypt(lensData, serialNumber, shutterCount)
+            self.focalDistance = (0.01 * pow(10, lensDataClear[6] / 40))
+
+    def getPrimaryAfPointIndex(self):
+        """
+        Returns the index of the primary af point, or 0 if the camera did not record one
+        """
+        if self.afInfo2 is None:
+            return 0
+        return self.afInfo2[7]
+
+    def toDict(self):
+        """
+        Returns the record as a dictionary which can be serialised to json
+        """
+        return {
+            'dateTime': self.dateTime,
+            'model': self.model,
+            'afInfo2': self.afInfo2,
+            'focalLength': self.focalLength,
+            'serialNumber': self.serialNumber,
+            'shutterCount': self.shutterCount,
+            'lensData': self.lensData
+        }
+
+
+def fromDict(values):
+    """
+    Rebuilds a record from the output of Metadata.toDict
+    """
+    return Metadata(**values)
+
+
+def fromTags(tags):
+    """
+    Builds a record out of the tags returned by exifread. Only the date and model are required, the
+    MakerNote fields are left as None when they are missing.
+
+    tags:- the tags extracted from the image
+    returns:- a Metadata object
+    """
+    def values(tag):
+        return tags[tag].values if tag in tags else None
+
+    afInfo2 = values(AFINFO2_TAG)
+    focalLength = values(FOCALLENGTH_TAG)
+    serialNumber = values(SERIAL_TAG)
+    shutterCount = values(SHUTTERCOUNT_TAG)
+    lensData = values(LENSDATA_TAG)
+    return Metadata(
+        str(tags[DATE_TAG]),
+        str(tags[CAMERA_TAG]),
+        list(afInfo2) if afInfo2 is not None else None,
+        focalLength[0] if focalLength is not None else None,
+        int(serialNumber) if serialNumber is not None else None,
+        int(shutterCount[0]) if shutterCount is not None else None,
+        list(lensData[4:]) if lensData is not None else None)
+
+
+def readMetadata(filename):
+    """
+    Parses the EXIF data of a file, once, into a Metadata record
+
+    filename:- the file to read
+    returns:- a Metadata object
+    """
+    with open(filename, 'rb') as nefFile:
+        tags = exifread.process_file(nefFile)
+    return fromTags(tags)
+
+
+def readMetadataFromBuffer(data):
+    """
+    Parses the EXIF data of a file which has already been read into memory
+
+    data:- the contents of the file, as bytes
+    returns:- a Metadata object
+    """
+    return fromTags(exifread.process_file(io.BytesIO(data)))
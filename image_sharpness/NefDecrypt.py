@@ -1,6 +1,8 @@
 """
 Decrypts encrypted NEF fields
 """
+import functools
+import numpy as np
 
 xlat = [
   [ 0xc1,0xbf,0x6d,0x0d,0x59,0xc5,0x13,0x9d,0x83,0x61,0x6b,0x4f,0xc7,0x7f,0x3d,0x3d,
@@ -39,19 +41,91 @@ xlat = [
 
 
 def Decrypt(cipherText, serial, shutterCount):
-    maxLen = len(cipherText)
+    """
+    Decrypts an encrypted NEF field (eg MakerNote LensData) by XORing it with its keystream
+
+    cipherText:- the encrypted bytes, as a sequence of ints, bytes or a numpy array
+    serial:- the camera serial number
+    shutterCount:- the total shutter releases of the camera when the photo was taken
+    returns:- a numpy uint8 array with the decrypted bytes
+    """
+    data = np.asarray(bytearray(cipherText) if isinstance(cipherText, (bytes, bytearray)) else cipherText, dtype=np.uint8)
+    return data ^ Keystream(serial, shutterCount, len(data))
+
+
+def DecryptMany(items):
+    """
+    Decrypts a field for many files at once, eg the lens data of a whole card. Fields of the same
+    length are decrypted together with a keystream matrix.
+
+    items:- a list of (cipherText, serial, shutterCount) tuples
+    returns:- a list of numpy uint8 arrays, in the same order as items
+    """
+    results = [None] * len(items)
+    byLength = {}
+    for i, (cipherText, _, _) in enumerate(items):
+        byLength.setdefault(len(cipherText), []).append(i)
+
+    for length, indices in byLength.items():
+        data = np.array([list(items[i][0]) for i in indices], dtype=np.uint8).reshape(len(indices), length)
+        seeds = np.array([KeystreamSeeds(items[i][1], items[i][2]) for i in indices], dtype=np.int64).reshape(len(indices), 2)
+        ci = seeds[:, 0:1]
+        cj = seeds[:, 1:2]
+        streams = ((cj + ci * KeystreamSteps(length)[np.newaxis, :]) & 0xff).astype(np.uint8)
+        clear = data ^ streams
+        for row, i in enumerate(indices):
+            results[i] = clear[row]
+    return results
+
+
+def KeystreamSeeds(serial, shutterCount):
+    """
+    Works out the two starting values of the keystream
+
+    returns:- ci, cj
+    """
     key = 0
     for i in range(0, 3):
         key ^= (shutterCount >> (i * 8)) & 0xff
-    ci = xlat[0][serial & 0xff]
-    cj = xlat[1][key]
-    ck = 0x60
-    result = []
-    for dataByte in cipherText:
-        cj = (cj + ci * ck) & 0xff
-        ck = (ck + 1) & 0xff
-        b = dataByte ^ cj
-        result.append(b)
-    
-
-    return result
\ No newline at end of file
+    return xlat[0][serial & 0xff], xlat[1][key]
+
+
+@functools.lru_cache(maxsize=64)
+def KeystreamSteps(length):
+    """
+    The running total of the ck counter, which starts at 0x60 and goes up by one per byte. The n-th
+    keystream byte is (cj + ci * steps[n]) & 0xff, which is what the byte by byte loop
+    cj = (cj + ci * ck) & 0xff; ck = (ck + 1) & 0xff works out to.
+
+    length:- the number of bytes in the keystream
+    returns:- a read only int64 numpy array
+    """
+    steps = np.cumsum(np.arange(0x60, 0x60 + length, dtype=np.int64) & 0xff)
+    steps.setflags(write=False)
+    return steps
+
+
+@functools.lru_cache(maxsize=1024)
+def KeystreamForSeeds(ci, cj, length):
+    """
+    Builds (and caches) the keystream for a pair of starting values
+
+    returns:- a read only numpy uint8 array
+    """
+    stream = ((cj + ci * KeystreamSteps(length)) & 0xff).astype(np.uint8)
+    stream.setflags(write=False)
+    return stream
+
+
+def Keystream(serial, shutterCount, length):
+    """
+    Returns the keystream for a camera serial number and shutter count. It only depends on the low
+    byte of the serial and a byte derived from the shutter count, so it is cached on those.
+
+    serial:- the camera serial number
+    shutterCount:- the total shutter releases of the camera when the photo was taken
+    length:- the number of bytes in the keystream
+    returns:- a read only numpy uint8 array
+    """
+    ci, cj = KeystreamSeeds(serial, shutterCount)
+    return KeystreamForSeeds(ci, cj, length)
@@ -0,0 +1,71 @@
+# pylint: disable=C0103
+"""
+Helpers for spreading per-file work across a pool of worker processes
+"""
+import os
+import concurrent.futures
+
+
+class WorkerPool:
+    """
+    A pool of worker processes which maps functions over inputs in order. With a single job the work
+    is done in the calling process, so nothing needs to be picklable and tracebacks stay simple.
+    """
+    def __init__(self, jobs=1):
+        """
+        Constructs the pool; the processes are started when the pool is entered
+
+        jobs:- the number of worker processes to use
+        """
+        self.jobs = jobs
+        self.executor = None
+
+    def __enter__(self):
+        if self.jobs > 1:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs)
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def map(self, function, *iterables):
+        """
+        Maps a function over some inputs
+
+        function:- a module level function to call for each set of inputs
+        iterables:- the arguments for each call, as in the builtin map
+        returns:- a list of the results, in the same order as the inputs
+        """
+        if self.executor is None:
+            return list(map(function, *iterables))
+        return list(self.executor.map(function, *iterables))
+
+
+def mapInWorkers(function, jobs, *iterables):
+    """
+    Maps a function over some inputs, using a pool of worker processes when more than one job is allowed
+
+    function:- a module level function to call for each set of inputs
+    jobs:- the number of worker processes to use
+    iterables:- the arguments for each call, as in the builtin map
+    returns:- a list of the results, in the same order as the inputs
+    """
+    with WorkerPool(jobs) as pool:
+        return pool.map(function, *iterables)
+
+
+def limitJobsToMemory(jobs, workerMemory):
+    """
+    Caps a number of workers so that they fit in physical memory at their peaks
+
+    jobs:- the number of workers asked for
+    workerMemory:- roughly how many bytes each worker uses at its peak (see getPeakMemory)
+    returns:- the number of workers to use
+    """
+    try:
+        physicalMemory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return jobs
+    return max(1, min(jobs, physicalMemory // workerMemory))
@@ -0,0 +1,176 @@
+# pylint: disable=C0103
+"""
+Whole image sharpness statistics worked out on a decimated copy of the image, with a true gradient
+magnitude, and the versions of the feature set that say how the features were computed
+"""
+import collections
+import numpy as np
+
+# version 1 is the original features: the whole image statistics on the full size image, and the
+# gradient being the x gradient only. Version 2 is the pyramid: whole image statistics on the image
+# decimated to a pyramid level, and the gradient being the magnitude of both gradients everywhere.
+LEGACY_FEATURE_SET_VERSION = 1
+PYRAMID_FEATURE_SET_VERSION = 2
+FEATURE_SET_VERSIONS = [LEGACY_FEATURE_SET_VERSION, PYRAMID_FEATURE_SET_VERSION]
+
+DEFAULT_PYRAMID_LEVEL = 1
+
+FeatureSet = collections.namedtuple('FeatureSet', ['version', 'pyramidLevel'])
+
+
+def makeFeatureSet(version=LEGACY_FEATURE_SET_VERSION, pyramidLevel=DEFAULT_PYRAMID_LEVEL):
+    """
+    Describes how a set of features is computed, so that a model is always given features computed
+    the way the ones it was trained on were
+
+    version:- one of FEATURE_SET_VERSIONS
+    pyramidLevel:- how many times the image is halved before the whole image statistics are worked
+        out; ignored for version 1, which always uses the full size image
+    returns:- a FeatureSet
+    """
+    if version not in FEATURE_SET_VERSIONS:
+        raise ValueError("Unknown feature set version %s, expected one of %s" % (version, FEATURE_SET_VERSIONS))
+    if version == LEGACY_FEATURE_SET_VERSION:
+        return FeatureSet(version, 0)
+    if pyramidLevel < 0:
+        raise ValueError("The pyramid level can't be negative")
+    return FeatureSet(version, int(pyramidLevel))
+
+
+LEGACY_FEATURE_SET = makeFeatureSet()
+
+
+def describeFeatureSet(featureSet):
+    """
+    returns:- a short description of a FeatureSet for messages, eg 'version 2 at pyramid level 1'
+    """
+    if featureSet.version == LEGACY_FEATURE_SET_VERSION:
+        return "version %d" % featureSet.version
+    return "version %d at pyramid level %d" % (featureSet.version, featureSet.pyramidLevel)
+
+
+def gradientBlocks(image, blockRows):
+    """
+    Works out the x and y gradients of an image a block of rows at a time. Each block is given the
+    rows either side of it for its y gradient, so the gradients are the same as for the whole image
+    in one go.
+
+    image:- a 2d numpy array
+    blockRows:- how many rows to process at once
+    yields:- (first row, block, x gradient, y gradient) for each block, as float32 arrays
+    """
+    height = image.shape[0]
+    for start in range(0, height, blockRows):
+        stop = min(start + blockRows, height)
+        top = max(start - 1, 0)
+        bottom = min(stop + 1, height)
+        context = image[top:bottom].astype(np.float32)
+        block = context[start - top:stop - top]
+        xGradient = np.gradient(block, axis=1) if block.shape[1] > 1 else np.zeros_like(block)
+        yGradient = np.gradient(context, axis=0)[start - top:stop - top] if context.shape[0] > 1 else np.zeros_like(block)
+        yield start, block, xGradient, yGradient
+
+
+def gradientMagnitude(lumoImage, blockRows=None):
+    """
+    Converts a grayscale image into the magnitude of its 2d gradient, sqrt(gx^2 + gy^2)
+
+    lumoImage:- a grayscale image
+    blockRows:- how many rows to process at once, or None to do the whole image in one go
+    returns:- a float32 numpy array containing the gradient magnitude
+    """
+    image = np.asarray(lumoImage)
+    if blockRows is None:
+        blockRows = max(image.shape[0], 1)
+    magnitude = np.empty(image.shape, dtype=np.float32)
+    for start, block, xGradient, yGradient in gradientBlocks(image, blockRows):
+        magnitude[start:start + block.shape[0]] = np.sqrt(xGradient * xGradient + yGradient * yGradient)
+    return magnitude
+
+
+def halve(image, blockRows, dtype):
+    """
+    Sums each 2x2 square of pixels of an image, by adding its four strided phases (the even and odd
+    rows and columns), so no pixel is read more than once. A row or column which doesn't fill a
+    square is dropped.
+
+    image:- a 2d numpy array
+    blockRows:- roughly how many rows of the image to process at once
+    dtype:- the type to sum in, which has to be big enough to hold four pixels
+    returns:- a numpy array of dtype, half the size of the image each way
+    """
+    height = image.shape[0] // 2
+    width = image.shape[1] // 2
+    halved = np.empty((height, width), dtype=dtype)
+    rows = max(blockRows // 2, 1)
+    for start in range(0, height, rows):
+        stop = min(start + rows, height)
+        block = image[2 * start:2 * stop, :2 * width]
+        out = halved[start:stop]
+        np.add(block[0::2, 0::2], block[0::2, 1::2], out=out, dtype=dtype)
+        out += block[1::2, 0::2]
+        out += block[1::2, 1::2]
+    return halved
+
+
+def decimate(image, level, blockRows):
+    """
+    Shrinks an image to a level of its pyramid, each level being half the size of the one before,
+    by averaging each 2^level x 2^level square of pixels. Each level is made from the one below by
+    adding up 2x2 squares; for integer images the sums are kept as integers and only divided into
+    averages at the end, so the result is the same as averaging the squares directly. Rows and
+    columns which don't fill a square are dropped.
+
+    image:- a 2d numpy array
+    level:- the pyramid level, 0 being the image itself
+    blockRows:- roughly how many rows of the image to process at once
+    returns:- the decimated image, as a float32 numpy array (or the image itself for level 0)
+    """
+    if level == 0:
+        return image
+    if image.dtype.kind == 'u':
+        # the smallest integer type which holds the sum of a whole 2^level x 2^level square
+        dtype = np.promote_types(np.min_scalar_type(np.iinfo(image.dtype).max * 4 ** level), image.dtype)
+    else:
+        dtype = np.float32
+    sums = image
+    for _ in range(level):
+        sums = halve(sums, blockRows, dtype)
+    return np.multiply(sums, np.float32(0.25 ** level), dtype=np.float32)
+
+
+def levelStatistics(image, blockRows):
+    """
+    Works out the variance (of the image scaled to 0-1, like normalisedVariance) and the mean gradient
+    magnitude of an image, in a single pass over blocks of rows
+
+    image:- a 2d numpy array of 8 bit grayscale values
+    blockRows:- how many rows to process at once
+    returns:- (variance, mean gradient magnitude)
+    """
+    if image.size == 0:
+        return 0.0, 0.0
+    total = 0.0
+    totalSq = 0.0
+    gradientTotal = 0.0
+    for _, block, xGradient, yGradient in gradientBlocks(image, blockRows):
+        values = block.astype(np.float64)
+        total += values.sum()
+        totalSq += np.einsum('ij,ij->', values, values)
+        gradientTotal += np.sqrt(xGradient * xGradient + yGradient * yGradient).sum(dtype=np.float64)
+    mean = total / image.size
+    return (totalSq / image.size - mean * mean) / (255 * 255), gradientTotal / image.size
+
+
+def pyramidStatistics(lumoImage, level, blockRows):
+    """
+    Works out the whole image variance and gradient sharpness of a grayscale image at a level of its
+    pyramid. Each level up has a quarter of the pixels, so the statistics cost about a quarter as
+    much, but making the first level reads the whole image, so the total doesn't fall as fast.
+
+    lumoImage:- a grayscale image
+    level:- the pyramid level, 0 being the image itself
+    blockRows:- how many rows to process at once
+    returns:- (variance, mean gradient magnitude)
+    """
+    return levelStatistics(decimate(np.asarray(lumoImage), level, blockRows), blockRows)
@@ -5,6 +5,10 @@ Functions which help standardise how commandline arguments are structured
 """
 import argparse
 
+from .FeatureIndex import DEFAULT_INDEX_PATH
+from .Image import SOURCES, DEFAULT_MEMORY_BUDGET
+from .Pyramid import FEATURE_SET_VERSIONS, LEGACY_FEATURE_SET_VERSION, DEFAULT_PYRAMID_LEVEL
+
 def create_basic_parser(description):
     """
     Creates a basic argument parser with in and out arguments
@@ -27,3 +31,53 @@ def add_sharpness_arguments(parser):
     parser.add_argument('--sharpness', action='store_true', help="If this argument is present, we determine image sharpness")
     
     return parser
+
+def add_parallel_arguments(parser):
+    """
+    Adds extra arguments to a parser for controlling how many processes do the work
+
+    parser:- an argparse parser object to add the arguments to
+    Return value:- the parser object that was passed in
+    """
+    parser.add_argument('--jobs', type=int, default=1, help="The number of worker processes to use when scoring sharpness")
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET // (1024 * 1024), help="Roughly how many MB of temporaries each scoring worker may use while working out the whole image statistics. The decoded photo itself (around 300MB for a 24MP NEF) comes on top, and fewer workers than --jobs are started if they wouldn't fit in memory with it")
+
+    return parser
+
+def add_index_arguments(parser):
+    """
+    Adds extra arguments to a parser for controlling the persistent metadata and feature index
+
+    parser:- an argparse parser object to add the arguments to
+    Return value:- the parser object that was passed in
+    """
+    parser.add_argument('--index', nargs=1, default=[DEFAULT_INDEX_PATH], help="The SQLite file to keep already extracted metadata and features in")
+    parser.add_argument('--no-index', action='store_true', help="If this argument is present, the metadata and feature index is not used")
+    parser.add_argument('--prune-index', type=float, default=None, help="Remove index entries which haven't been used in this many days")
+
+    return parser
+
+def add_source_arguments(parser):
+    """
+    Adds extra arguments to a parser for choosing what the sharpness features are computed from
+
+    parser:- an argparse parser object to add the arguments to
+    Return value:- the parser object that was passed in
+    """
+    parser.add_argument('--sharpness-source', choices=SOURCES, default='full', help="Compute sharpness from the full raw decode, from the (much faster) embedded preview, or from the raw data around the AF point with the whole image binned to half resolution")
+    parser.add_argument('--compare-sharpness-sources', nargs=1, required=False, help="Score every file from each sharpness source, write a csv report comparing them to this path, and exit without copying")
+    parser.add_argument('--cascade-margin', nargs=1, type=float, required=False, help="Score each file from its embedded preview first, and only score it again from --sharpness-source if the preview score is within this much of a bucket threshold")
+
+    return parser
+
+def add_feature_set_arguments(parser):
+    """
+    Adds extra arguments to a parser for choosing which version of the sharpness features is computed
+
+    parser:- an argparse parser object to add the arguments to
+    Return value:- the parser object that was passed in
+    """
+    parser.add_argument('--feature-set-version', type=int, choices=FEATURE_SET_VERSIONS, default=LEGACY_FEATURE_SET_VERSION, help="Which version of the sharpness features to compute: 1 is the original features, 2 works out the whole image statistics on an image pyramid with a true gradient magnitude. It has to match the version the model was trained on")
+    parser.add_argument('--pyramid-level', type=int, default=DEFAULT_PYRAMID_LEVEL, help="For version 2 features, how many times to halve the image before working out the whole image statistics; level 1 is about three times faster than the full size image and level 2 about twice as fast again, while higher levels gain little more since making the pyramid reads the whole image. It has to match the level the model was trained on")
+
+    return parser
@@ -0,0 +1,121 @@
+# pylint: disable=C0103
+"""
+A minimal reader for the text tags in the first IFD of a TIFF based raw file (eg an NEF). It reads
+the header and the one IFD it needs with a few small reads, instead of walking every IFD and the
+MakerNote like exifread does, which is all that grouping photos by day and camera needs.
+"""
+import io
+import struct
+
+from .Metadata import Metadata
+
+MODEL_TAG = 0x0110
+DATETIME_TAG = 0x0132
+
+ASCII_TYPE = 2
+ENTRY_SIZE = 12
+
+# the most IFD entries we believe; anything more means the file isn't what we think it is
+MAX_ENTRIES = 4096
+
+
+class TiffFormatError(ValueError):
+    """
+    Raised when a file doesn't look like a TIFF
+    """
+
+
+def readTiffTags(filename, tags=(MODEL_TAG, DATETIME_TAG)):
+    """
+    Reads some ASCII tags from the first IFD of a TIFF file
+
+    filename:- the file to read
+    tags:- the numeric ids of the tags to read
+    returns:- a dictionary of <tag id, string> for the tags which were found
+    """
+    with open(filename, 'rb') as tiffFile:
+        return readTiffTagsFromFile(tiffFile, filename, tags)
+
+
+def readTiffTagsFromFile(tiffFile, name, tags=(MODEL_TAG, DATETIME_TAG)):
+    """
+    Reads some ASCII tags from the first IFD of an open TIFF file
+
+    tiffFile:- a seekable binary file object
+    name:- what to call the file in errors
+    tags:- the numeric ids of the tags to read
+    returns:- a dictionary of <tag id, string> for the tags which were found
+    """
+    header = tiffFile.read(8)
+    if len(header) != 8 or header[:2] not in (b'II', b'MM'):
+        raise TiffFormatError("%s is not a TIFF file" % name)
+    order = '<' if header[:2] == b'II' else '>'
+    magic, ifdOffset = struct.unpack(order + 'HI', header[2:])
+    if magic != 42:
+        raise TiffFormatError("%s is not a TIFF file" % name)
+
+    tiffFile.seek(ifdOffset)
+    countBytes = tiffFile.read(2)
+    if len(countBytes) != 2:
+        raise TiffFormatError("%s has a truncated IFD" % name)
+    count = struct.unpack(order + 'H', countBytes)[0]
+    if count > MAX_ENTRIES:
+        raise TiffFormatError("%s has an implausible IFD" % name)
+    entries = tiffFile.read(count * ENTRY_SIZE)
+
+    wanted = set(tags)
+    values = {}
+    for start in range(0, len(entries) - ENTRY_SIZE + 1, ENTRY_SIZE):
+        tag, fieldType, length = struct.unpack(order + 'HHI', entries[start:start + 8])
+        if tag not in wanted or fieldType != ASCII_TYPE:
+            continue
+        if length <= 4:
+            raw = entries[start + 8:start + 8 + length]
+        else:
+            tiffFile.seek(struct.unpack(order + 'I', entries[start + 8:start + 12])[0])
+            raw = tiffFile.read(length)
+        values[tag] = decodeAscii(raw)
+    return values
+
+
+def decodeAscii(raw):
+    """
+    Turns the bytes of an ASCII tag into a string the same way exifread does, dropping everything
+    from the first null
+    """
+    raw = raw.split(b'\x00', 1)[0]
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('latin-1')
+
+
+def readBasicMetadata(filename):
+    """
+    Reads just the date and camera model of a file, which is all grouping needs. The MakerNote isn't
+    parsed, so the AF point, focal length and focus distance fields of the record are None.
+
+    filename:- the file to read
+    returns:- a Metadata object
+    """
+    return basicMetadataFromTags(readTiffTags(filename), filename)
+
+
+def basicMetadataFromTags(values, name):
+    """
+    Builds a Metadata record out of the tags returned by readTiffTags
+    """
+    if MODEL_TAG not in values or DATETIME_TAG not in values:
+        raise KeyError("%s has no Model or DateTime tag in its first IFD" % name)
+    return Metadata(values[DATETIME_TAG], values[MODEL_TAG])
+
+
+def readBasicMetadataFromBuffer(data, name="buffer"):
+    """
+    Reads just the date and camera model of a file which has already been read into memory
+
+    data:- the contents of the file, as bytes
+    name:- what to call the file in errors
+    returns:- a Metadata object
+    """
+    return basicMetadataFromTags(readTiffTagsFromFile(io.BytesIO(data), name), name)
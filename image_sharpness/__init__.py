@@ -2,4 +2,10 @@
 Some helpers to determine the sharpness of an NEF image (from a D610)
 """
 from . import StandardisedArguments
-from .Image import Image
\ No newline at end of file
+from .Image import Image, SOURCES, DEFAULT_MEMORY_BUDGET, getPeakMemory, resolveAfPointIndices, fourierValuesForTiles
+from .Metadata import Metadata, readMetadata, readMetadataFromBuffer
+from .TiffTags import readTiffTags, readBasicMetadata, readBasicMetadataFromBuffer
+from .FeatureIndex import FeatureIndex
+from .Features import FEATURE_NAMES, FOURIER_FEATURE_NAMES, featureArray, getFeatures, getFeaturesForImage, getFeatureKey, iterFeatureChunks, extractFeatures
+from .Pyramid import FeatureSet, makeFeatureSet, describeFeatureSet, gradientMagnitude, pyramidStatistics, FEATURE_SET_VERSIONS, LEGACY_FEATURE_SET, LEGACY_FEATURE_SET_VERSION, PYRAMID_FEATURE_SET_VERSION, DEFAULT_PYRAMID_LEVEL
+from .Parallel import WorkerPool, mapInWorkers, limitJobsToMemory
\ No newline at end of file
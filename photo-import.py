@@ -6,22 +6,35 @@ browser implementation on iOS.
 """
 # pylint: disable=C0103
 import os
-import shutil
 import re
+import csv
 import json
+import time
+import concurrent.futures
 
-import exifread
 import numpy as np
 
 
 import python_batch_processing
 import image_sharpness
 import generic_predictor
+import photo_import
 
-CAMERA_TAG = "Image Model"
-DATE_TAG = "Image DateTime"
+DEFAULT_AF_POINT_INDEX = 1
 
-lastIndex = 1
+# The "crappy" built in model, used when no model file is supplied. The coefficients line up
+# with image_sharpness.FEATURE_NAMES.
+DEFAULT_COEFFICIENTS = np.array([-3.88599991e+00, 0, 0, 2.86841821e-01, -4.75593447e-03, 0, 9.47094800e-05, -8.92048122e-04, 0, -7.00857457e-04])
+DEFAULT_INTERCEPT = 3.3100968292972452
+
+# scores below UNSHARP_THRESHOLD are unsharp, scores from it up to SHARP_THRESHOLD are questionable
+UNSHARP_THRESHOLD = 2.5
+SHARP_THRESHOLD = 3.0
+
+# the cheap source the cascade scores from first, and the margins compareSharpnessSources reports
+# the cascade for
+CASCADE_SOURCE = 'preview'
+CASCADE_MARGINS = [0.1, 0.25, 0.5, 1.0]
 
 #RELEVANT_TAGS = ['Image DateTime', 'Image Model'],
 
@@ -32,172 +45,962 @@ def main(args):
     """
         The main function of the program. Orchestrates the work
     """
-    print("Finding NEF files...")
-    files = getAllNefFiles(args.input)
-    
+    index = None
+    if not args.no_index:
+        index = image_sharpness.FeatureIndex(args.index[0])
+        if args.prune_index is not None:
+            print("Pruned", index.prune(args.prune_index), "files from the index")
+
+    try:
+        return importPhotos(args, index)
+    finally:
+        if index is not None:
+            index.close()
+
+def importPhotos(args, index):
+    """
+    Finds, sorts and copies the photos
+
+    index:- the FeatureIndex to reuse metadata and features from, or None
+    """
+    if args.compare_sharpness_sources != None:
+        print("Finding NEF files...")
+        files = getAllNefFiles(args.input)
+        print("Reading EXIF data (slow)...")
+        metadata = readAllMetadata(files, args.jobs, index)
+        predictor = loadPredictor(args)
+        print("Comparing sharpness sources...")
+        compareSharpnessSources(files, metadata, predictor, args.compare_sharpness_sources[0], args.jobs, index, getMemoryBudget(args),
+                                getFeatureSet(args))
+        return 0
+
+    if args.execute != None:
+        return executePlan(args)
+
+    predictor = None
     if args.sharpness == True:
-        modelPath = 'model.json'
-        if args.model != None:
-            modelPath = args.model[0]
-        
-
-        predictor = None
-        with open(modelPath, 'r') as modelFile:
-            s = modelFile.read()
-            modelObj = json.loads(s)
-            predictor = generic_predictor.RuntimePredictor(modelObj['featureNames'], modelObj['coefficients'], modelObj['intercept'])
-
-
-        print("Sorting sharp from unsharp...")
-        sharp, questionable, unsharp = sortSharpFromUnsharp(files, predictor)
-        print("Processing sharp files...")
-        processGroupOfPhotos(sharp, "sharp", args.out[0])
-        print("Processing questionable files...")
-        processGroupOfPhotos(questionable, "questionable", args.out[0])
-        print("Processing unsharp files...")
-        processGroupOfPhotos(unsharp, "unsharp", args.out[0])
-    else:
-        processGroupOfPhotos(files, "sharp", args.out[0])
+        predictor = loadPredictor(args)
+
+    if args.plan_only != None:
+        return planImport(args, index, predictor)
+
+    journal = openJournal(args, getImportOptions(args))
+    hashIndex = openHashIndex(args)
+    profiler = openProfiler(args)
+    finished = False
+    print("Importing files...")
+    copyEngine = photo_import.CopyEngine(args.copy_jobs_per_source, args.copy_jobs_per_destination, not args.no_sync)
+    if profiler is not None:
+        profiler.watchCopies(copyEngine)
+    progress = openProgress(args, copyEngine)
+    try:
+        try:
+            discovery = photo_import.Discovery(args.input, ordered=False)
+            items = runImportPipeline(discovery, args, index, predictor, copyEngine, journal, hashIndex, profiler=profiler,
+                                      progress=progress)
+            progress.message("Waiting for copies to finish...")
+        finally:
+            copyEngine.close()
+        finished = all(item.reached('verified') or item.copied is None for item in items)
+    finally:
+        progress.close()
+        journal.close(finished)
+        if hashIndex is not None:
+            hashIndex.close()
+    print(copyEngine.getSummary())
+    if profiler is not None:
+        print("Wrote the profile to", profiler.writeReport(items, copyEngine))
+
+    return 0
+
+def planImport(args, index, predictor):
+    """
+    Works out where every photo goes, the same way an import would, and writes it to a plan instead
+    of copying anything
+
+    index:- the FeatureIndex to reuse metadata and features from, or None
+    predictor:- the model to score the images with, or None
+    """
+    hashIndex = openHashIndex(args)
+    profiler = openProfiler(args)
+    planWriter = photo_import.PlanWriter(args.plan_only[0], getImportOptions(args))
+    finished = False
+    print("Planning the import...")
+    progress = openProgress(args)
+    try:
+        discovery = photo_import.Discovery(args.input, ordered=False)
+        items = runImportPipeline(discovery, args, index, predictor, None, None, hashIndex, planWriter, profiler, progress)
+        finished = True
+    finally:
+        progress.close()
+        planWriter.close(finished)
+        if hashIndex is not None:
+            hashIndex.close()
+    print("Planned", planWriter.count, "files into", args.plan_only[0])
+    if profiler is not None:
+        print("Wrote the profile to", profiler.writeReport(items))
+
+    return 0
+
+def executePlan(args):
+    """
+    Copies the photos to where a plan written by --plan-only says they go. Photos which have changed
+    since the plan was made are left alone.
+    """
+    planOptions, items = photo_import.readPlan(args.execute[0], args.out[0])
+    print("Executing the plan for", len(items), "files, made with", planOptions)
+    journal = openJournal(args, {'out': os.path.abspath(args.out[0]), 'plan': os.path.abspath(args.execute[0])})
+    hashIndex = openHashIndex(args)
+    destinationIndex = photo_import.DestinationIndex(args.out[0])
+    profiler = openProfiler(args)
+    finished = False
+    copyEngine = photo_import.CopyEngine(args.copy_jobs_per_source, args.copy_jobs_per_destination, not args.no_sync)
+    if profiler is not None:
+        profiler.watchCopies(copyEngine)
+    progress = openProgress(args, copyEngine)
+    try:
+        try:
+            pipeline = photo_import.Pipeline(args.queue_size, profiler, progress)
+            pipeline.addStage("check", lambda items: checkPlanStage(items, progress, destinationIndex, journal))
+            pipeline.addStage("copy", lambda items: copyStage(items, progress, copyEngine, destinationIndex, journal, hashIndex))
+            items = list(pipeline.run(items))
+            progress.message("Waiting for copies to finish...")
+        finally:
+            copyEngine.close()
+        finished = all(item.reached('verified') or item.copied is None for item in items)
+    finally:
+        progress.close()
+        journal.close(finished)
+        if hashIndex is not None:
+            hashIndex.close()
+    print(copyEngine.getSummary())
+    if profiler is not None:
+        print("Wrote the profile to", profiler.writeReport(items, copyEngine))
 
     return 0
 
-def processGroupOfPhotos(photos, prefix, out):
+def getImportOptions(args):
+    """
+    Gets the settings which decide where each photo ends up; a journal written with others can't be
+    resumed
+
+    returns:- a dictionary of the settings
+    """
+    return {
+        'out': os.path.abspath(args.out[0]),
+        'sharpness': args.sharpness == True,
+        'sharpnessSource': args.sharpness_source,
+        'featureSetVersion': getFeatureSet(args).version,
+        'pyramidLevel': getFeatureSet(args).pyramidLevel,
+        'cascadeMargin': args.cascade_margin[0] if args.cascade_margin != None else None,
+        'model': args.model[0] if args.model != None else None
+    }
+
+def openJournal(args, options):
+    """
+    Opens the journal of the import given on the command line, resuming it unless told not to
+
+    options:- the settings the import is being run with, which have to match for it to be resumed
+    returns:- a photo_import.Journal
+    """
+    journalPath = os.path.join(args.out[0], photo_import.JOURNAL_NAME)
+    if args.journal != None:
+        journalPath = args.journal[0]
+    journal = photo_import.Journal(journalPath, options, not args.no_resume)
+    if journal.entries:
+        print("Resuming the import recorded in", journalPath)
+    return journal
+
+def openHashIndex(args):
+    """
+    Opens the index of the content hashes of the photos tree if duplicates are to be skipped,
+    bringing it up to date with the tree first. Only files which are new or have changed since it
+    was last brought up to date are hashed, which picks up photos imported without --dedup or put
+    there by other means.
+
+    returns:- a photo_import.HashIndex, or None
     """
-    Does the full work on a group of photos
+    if not args.dedup:
+        return None
+    hashIndex = photo_import.HashIndex(os.path.join(args.out[0], photo_import.HASH_INDEX_NAME), args.out[0])
+    if args.rebuild_dedup_index:
+        hashIndex.clear()
+    print("Hashing new photos in the photos tree...")
+    print("Hashed", hashIndex.build(args.copy_jobs_per_destination), "files")
+    return hashIndex
+
+def openProgress(args, copyEngine=None):
+    """
+    Starts reporting progress as asked to on the command line, logging the per-photo detail to
+    the log file
+
+    copyEngine:- the CopyEngine whose copies to show, or None
+    returns:- a photo_import.Progress
     """
-    print("Grouping files based on EXIF data (slow)...")
-    groupedFiles = splitFilesIntoDaysAndCameras(photos, prefix)
-    print("Splitting file groups into volumes...")
-    volumes = splitGroupsIntoVolumes(groupedFiles)
-    print("Copying files over...")
-    copyFilesToVolumePaths(out, volumes)
+    logPath = os.path.join(args.out[0], photo_import.LOG_NAME)
+    if args.log != None:
+        logPath = args.log[0]
+    progress = photo_import.Progress(logPath, args.verbose, args.progress_interval)
+    if copyEngine is not None:
+        progress.watchCopies(copyEngine)
+    print("Logging each photo to", logPath)
+    return progress
 
+def openProfiler(args):
+    """
+    Starts measuring the import if asked to
+
+    returns:- a photo_import.Profiler, or None
+    """
+    if args.profile == None:
+        return None
+    return photo_import.Profiler(args.profile[0], ['score'] if args.profile_scoring else [])
 
-def sortSharpFromUnsharp(files, predictor):
+def runImportPipeline(discovery, args, index, predictor, copyEngine, journal=None, hashIndex=None, planWriter=None, profiler=None,
+                      progress=None):
     """
-    Sorts sharp images from unsharp images
+    Reads, scores, plans and copies the photos as a pipeline, so that the first photos are copied
+    while the later ones are still being found and scored. The stages which read the photos take them
+    as they are found, so several card readers are read at once; they are put back in sorted order
+    before the AF point carry-over and the volume split, which depend on it.
 
-    files:- a list of files to sort
-    returns:- sharp, unsharp; lists of files
+    discovery:- the photo_import.Discovery finding the files to import
+    index:- the FeatureIndex to reuse metadata and features from, or None
+    predictor:- the model to score the images with; they are only scored if args.sharpness is set
+    copyEngine:- the CopyEngine to queue the copies on
+    journal:- the Journal to record each photo's progress in (and to resume from), or None
+    hashIndex:- the HashIndex to skip duplicates with, or None
+    planWriter:- the PlanWriter to write where the photos go to instead of copying them, or None
+    profiler:- the Profiler to measure the stages with, or None
+    progress:- the Progress to report to, or None to only count
+    returns:- a list of the ImportItem for each file
     """
-    sharp = []
-    unsharp = []
-    questionable = []
+    memoryBudget = getMemoryBudget(args)
+    featureSet = getFeatureSet(args)
+    jobs = image_sharpness.limitJobsToMemory(args.jobs, image_sharpness.getPeakMemory(args.sharpness_source, memoryBudget))
+    hashExecutor = None
+    executor = None
+    if jobs > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
 
+    if progress is None:
+        progress = photo_import.Progress()
+    pipeline = photo_import.Pipeline(args.queue_size, profiler, progress)
+    pipeline.addStage("scan", lambda items: scanStage(items, journal))
+    destinationIndex = photo_import.DestinationIndex(args.out[0])
+    stagingDirectory = os.path.join(args.out[0], photo_import.STAGING_NAME)
+    if args.read_once == 'buffer':
+        # each card is read on its own thread, and the photos are put in order as they come out; a
+        # photo read into memory is heavy, so each card may only read --queue-size photos ahead
+        pipeline.addStage("read", lambda items: photo_import.mapPerInput(items, discovery, readItem, args.queue_size))
+    elif args.read_once == 'copy-first':
+        # a staged photo waits on the out disk rather than in memory, so every card is staged at once
+        os.makedirs(stagingDirectory, exist_ok=True)
+        pipeline.addStage("stage", lambda items: photo_import.mapPerInput(items, discovery,
+                                                                          lambda item: stageItem(item, copyEngine, stagingDirectory, destinationIndex, index),
+                                                                          None, args.copy_jobs_per_source))
+    pipeline.addStage("metadata", lambda items: metadataStage(items, progress, index, photo_import.OrderedWindow(executor, 2 * jobs, profiler, "metadata"),
+                                                              args.sharpness == True))
+    if args.read_once == None:
+        pipeline.addStage("reorder", lambda items: photo_import.reorder(items, discovery))
+    if args.sharpness == True and args.cascade_margin != None:
+        pipeline.addStage("cascade", lambda items: cascadeStage(items, progress, predictor, index, photo_import.OrderedWindow(executor, 2 * jobs, profiler, "cascade"),
+                                                               args.sharpness_source, args.cascade_margin[0], memoryBudget, featureSet, journal))
+    if args.sharpness == True:
+        pipeline.addStage("score", lambda items: scoreStage(items, progress, predictor, index, photo_import.OrderedWindow(executor, 2 * jobs, profiler, "score"),
+                                                           args.sharpness_source, memoryBudget, featureSet, journal))
+    if hashIndex is not None:
+        # before planning, so that duplicates never take a place in a volume
+        hashExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=args.copy_jobs_per_source)
+        pipeline.addStage("dedup", lambda items: dedupStage(items, progress, hashIndex, photo_import.OrderedWindow(hashExecutor, 2 * args.copy_jobs_per_source, profiler, "dedup"),
+                                                           journal))
+    pipeline.addStage("plan", lambda items: planStage(items, args.out[0], photo_import.VolumePlanner(destinationIndex=destinationIndex),
+                                                      journal))
+    if planWriter is not None:
+        pipeline.addStage("write plan", lambda items: writePlanStage(items, progress, planWriter))
+    else:
+        pipeline.addStage("copy", lambda items: copyStage(items, progress, copyEngine, destinationIndex, journal, hashIndex))
+
+    try:
+        return list(pipeline.run(photo_import.ImportItem(path, inputIndex, stat) for inputIndex, path, stat in discovery))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if hashExecutor is not None:
+            hashExecutor.shutdown(cancel_futures=True)
+        if index is not None:
+            index.commit()
+        if os.path.isdir(stagingDirectory) and not os.listdir(stagingDirectory):
+            os.rmdir(stagingDirectory)
+
+def scanStage(items, journal):
+    """
+    Pipeline stage which notes the size and modification time of each photo, and picks up whatever
+    an earlier, interrupted import recorded about it
+
+    items:- new ImportItems
+    journal:- the Journal to resume from and record in, or None
+    yields:- the ImportItems, restored from the journal where possible
+    """
+    for item in items:
+        if item.size is None:
+            stat = os.stat(item.source)
+            item.size = stat.st_size
+            item.mtime = stat.st_mtime_ns
+        entry = journal.lookup(item.source, item.size, item.mtime) if journal is not None else None
+        if entry is not None:
+            item.restore(entry)
+        elif journal is not None:
+            journal.record(item.source, 'scanned', size=item.size, mtime=item.mtime)
+        yield item
+
+def readItem(item):
+    """
+    Reads a photo into memory, so that the metadata, the sharpness tests and the copy all use the
+    one read of the card. Runs on the reading threads of the photo's card (see mapPerInput).
+
+    item:- an ImportItem
+    returns:- the ImportItem, with its data filled in unless an earlier import already copied it
+    """
+    if not item.reached('copied'):
+        with open(item.source, 'rb') as sourceFile:
+            item.data = sourceFile.read()
+    return item
+
+def stageItem(item, copyEngine, stagingDirectory, destinationIndex, index=None):
+    """
+    Copies a photo off the card before anything else reads it, so that the later stages read the copy
+    on the (faster) out disk, and the photo is later just renamed into place. Photos which are
+    already in the photos tree aren't copied, since the copy would only be thrown away. Runs on the
+    staging threads of the photo's card (see mapPerInput).
+
+    item:- an ImportItem
+    copyEngine:- the CopyEngine to copy the photo with
+    stagingDirectory:- the folder under the out folder to copy the photos to
+    destinationIndex:- the DestinationIndex which says what is already in the photos tree
+    index:- a FeatureIndex to look up the photo's metadata in, or None
+    returns:- the ImportItem, once it has been copied, with its readPath pointing at the copy
+    """
+    if item.reached('copied') or isAlreadyImported(item, destinationIndex, index):
+        return item
+    item.stagedPath = photo_import.getStagingPath(stagingDirectory, item.source)
+    # an earlier import may already have copied it off the card
+    if not os.path.exists(item.stagedPath) or os.path.getsize(item.stagedPath) != item.size:
+        copyEngine.submitStaging(item.source, item.stagedPath, item).result()
+    item.readPath = item.stagedPath
+    return item
+
+def isAlreadyImported(item, destinationIndex, index=None):
+    """
+    Checks whether a photo is already in the photos tree, in whichever bucket, reading no more of
+    it than its tags (and, if there is a file of the same name and size, its partial hash)
+
+    item:- the photo's ImportItem
+    destinationIndex:- the DestinationIndex which says what is already in the photos tree
+    index:- a FeatureIndex to look up the photo's metadata in, or None
+    returns:- True if the same photo is already there
+    """
+    record = index.getMetadata(item.source) if index is not None else None
+    if record is None:
+        try:
+            record = image_sharpness.readBasicMetadata(item.source)
+        except (OSError, KeyError, ValueError):
+            return False
+    name = os.path.basename(item.source)
+    for bucket in photo_import.BUCKETS:
+        basePath = getBasePathFromMetadata(record, bucket)
+        volume = destinationIndex.findVolume(basePath, name, item.source, item.size)
+        if volume is not None and destinationIndex.getOwner(basePath, volume, name) == photo_import.ON_DISK:
+            return True
+    return False
+
+def metadataStage(items, progress, index, window, full=True):
+    """
+    Pipeline stage which looks up (or reads, in the worker processes) the Metadata of each photo
+
+    items:- ImportItems in order
+    progress:- the Progress to log the photos to
+    index:- a FeatureIndex to reuse records from (and store new ones in), or None
+    window:- the OrderedWindow to read the files through
+    full:- whether the sharpness tests need the whole record; if not, only the date and model are
+        read, without parsing the MakerNote, and the partial records aren't stored in the index
+    yields:- the ImportItems in the same order, with their metadata filled in
+    """
+    reader = image_sharpness.readMetadata if full else image_sharpness.readBasicMetadata
+    bufferReader = image_sharpness.readMetadataFromBuffer if full else image_sharpness.readBasicMetadataFromBuffer
+    for item in items:
+        record = None
+        if not item.reached('planned') and index is not None:
+            record = index.getMetadata(item.source)
+        if item.reached('planned'):
+            # an earlier import already worked out where it goes
+            window.put((item, False), None)
+        elif record is not None:
+            window.put((item, False), record)
+        elif item.data is None:
+            window.submit((item, full), reader, item.readPath)
+        else:
+            # parsed here rather than in a worker, so the whole file isn't sent to it just for the tags
+            window.put((item, full), bufferReader(item.data))
+        for readItem in withMetadata(window.popFull(), progress, index):
+            yield readItem
+    for readItem in withMetadata(window.popAll(), progress, index):
+        yield readItem
+
+def withMetadata(results, progress, index):
+    """
+    Fills in the metadata of the items coming out of metadataStage's window, storing new records
+    in the index
+    """
+    for (item, isNew), record in results:
+        item.metadata = record
+        if isNew and index is not None:
+            index.putMetadata(item.source, record)
+        if record is not None:
+            progress.log("metadata", item.source, dateTime=record.dateTime, model=record.model)
+        yield item
+
+def scoreStage(items, progress, predictor, index, window, source, memoryBudget, featureSet, journal=None):
+    """
+    Pipeline stage which extracts the features of each photo (in the worker processes, unless they
+    are in the index) and buckets it by sharpness. The AF point carry-over runs over the photos in
+    order, exactly as image_sharpness.extractFeatures does.
+
+    items:- ImportItems in order, with their metadata filled in
+    progress:- the Progress to log the photos and count the buckets in
+    predictor:- the model to score the images with, or None to use the built in one
+    index:- a FeatureIndex to reuse features from (and store new ones in), or None
+    window:- the OrderedWindow to extract the features through
+    source:- what to compute the features from, one of image_sharpness.SOURCES
+    memoryBudget:- roughly how many bytes of temporaries each worker may use
+    featureSet:- the image_sharpness.FeatureSet the model was trained on
+    journal:- the Journal to record the scores in, or None
+    yields:- the ImportItems in the same order, with their sharpness and bucket filled in
+    """
     if predictor == None:
-        print("Warning using crappy model because no model supplied")
-
-    for file in files:
-        isSharp = testImageSharpness(file, predictor)
-        if isSharp == "sharp":
-            sharp.append(file)
-        elif isSharp == "questionable":
-            questionable.append(file)
+        progress.message("Warning using crappy model because no model supplied")
+
+    lastIndex = DEFAULT_AF_POINT_INDEX
+    for item in items:
+        if item.reached('scored') or item.bucket is not None:
+            # an earlier import (or cascadeStage) already scored it, but the AF point still carries
+            # over to the next one
+            lastIndex = item.afPointIndex
+            window.put((item, None, False), None)
+        else:
+            scoreItem(item, lastIndex, window, index, source, memoryBudget, featureSet)
+            lastIndex = item.afPointIndex
+        for scoredItem in withSharpness(window.popFull(), progress, predictor, index, journal):
+            yield scoredItem
+    for scoredItem in withSharpness(window.popAll(), progress, predictor, index, journal):
+        yield scoredItem
+
+def scoreItem(item, lastIndex, window, index, source, memoryBudget, featureSet):
+    """
+    Works out which AF point to use for a photo, and starts its features being extracted (unless
+    they are in the index)
+    """
+    item.afPointIndex = image_sharpness.resolveAfPointIndices([item.metadata.getPrimaryAfPointIndex()], lastIndex)[0]
+    featureKey = image_sharpness.getFeatureKey(item.afPointIndex, source, featureSet)
+    features = index.getFeatures(item.source, featureKey) if index is not None else None
+    if features is not None:
+        window.put((item, featureKey, False), features)
+    else:
+        window.submit((item, featureKey, True), image_sharpness.getFeatures, item.readPath, item.metadata, item.afPointIndex,
+                      source, memoryBudget, image_sharpness.FEATURE_NAMES, item.data, featureSet)
+
+def withSharpness(results, progress, predictor, index, journal):
+    """
+    Scores and buckets the items coming out of scoreStage's window, storing new features in the index
+    """
+    for (item, featureKey, isNew), features in results:
+        if features is None:
+            yield item
+            continue
+        item.features = features
+        if isNew and index is not None:
+            index.putMetadata(item.source, item.metadata)
+            index.putFeatures(item.source, featureKey, features)
+        item.sharpness = scoreSharpness(features, predictor)
+        recordSharpness(item, progress, journal, featureKey)
+        yield item
+
+def recordSharpness(item, progress, journal, featureKey):
+    """
+    Buckets a scored item, and counts, logs and journals it
+    """
+    item.bucket = bucketForScore(item.sharpness)
+    progress.countBucket(item.bucket)
+    progress.log("score", item.source, sharpness=float(item.sharpness), bucket=item.bucket, afPointIndex=item.afPointIndex,
+                 featureKey=featureKey)
+    if journal is not None:
+        journal.record(item.source, 'scored', afPointIndex=item.afPointIndex, sharpness=float(item.sharpness), bucket=item.bucket)
+
+def cascadeStage(items, progress, predictor, index, window, source, margin, memoryBudget, featureSet, journal=None):
+    """
+    Pipeline stage which scores each photo from its embedded preview first, which costs a fraction
+    of the full decode, and buckets the ones whose score is clear of the thresholds straight away.
+    The photos which score within margin of a threshold are left for scoreStage to score again from
+    source. Photos whose features from that source are already in the index are left for scoreStage
+    too, as they cost nothing to score.
+
+    items:- ImportItems in order, with their metadata filled in
+    progress:- the Progress to log the photos and count the buckets in
+    predictor:- the model to score the images with, or None to use the built in one
+    index:- a FeatureIndex to reuse features from (and store new ones in), or None
+    window:- the OrderedWindow to extract the preview features through
+    source:- what scoreStage computes the features from, one of image_sharpness.SOURCES
+    margin:- how close to a threshold a preview score has to be for the photo to be scored again
+    memoryBudget:- roughly how many bytes of temporaries each worker may use
+    featureSet:- the image_sharpness.FeatureSet the model was trained on
+    journal:- the Journal to record the scores in, or None
+    yields:- the ImportItems in the same order, with their sharpness and bucket filled in if the
+        preview decided them
+    """
+    lastIndex = DEFAULT_AF_POINT_INDEX
+    for item in items:
+        if item.reached('scored'):
+            lastIndex = item.afPointIndex
+            window.put((item, None, False), None)
+        else:
+            item.afPointIndex = image_sharpness.resolveAfPointIndices([item.metadata.getPrimaryAfPointIndex()], lastIndex)[0]
+            lastIndex = item.afPointIndex
+            escalatedKey = image_sharpness.getFeatureKey(item.afPointIndex, source, featureSet)
+            featureKey = image_sharpness.getFeatureKey(item.afPointIndex, CASCADE_SOURCE, featureSet)
+            features = index.getFeatures(item.source, featureKey) if index is not None else None
+            if index is not None and index.getFeatures(item.source, escalatedKey) is not None:
+                window.put((item, None, False), None)
+            elif features is not None:
+                window.put((item, featureKey, False), features)
+            else:
+                window.submit((item, featureKey, True), image_sharpness.getFeatures, item.readPath, item.metadata, item.afPointIndex,
+                              CASCADE_SOURCE, memoryBudget, image_sharpness.FEATURE_NAMES, item.data, featureSet)
+        for cascadedItem in withCascadedSharpness(window.popFull(), progress, predictor, index, journal, margin):
+            yield cascadedItem
+    for cascadedItem in withCascadedSharpness(window.popAll(), progress, predictor, index, journal, margin):
+        yield cascadedItem
+
+def withCascadedSharpness(results, progress, predictor, index, journal, margin):
+    """
+    Scores the items coming out of cascadeStage's window, and buckets the ones which are clearly on
+    one side of the thresholds
+    """
+    for (item, featureKey, isNew), features in results:
+        if features is not None:
+            if isNew and index is not None:
+                index.putMetadata(item.source, item.metadata)
+                index.putFeatures(item.source, featureKey, features)
+            sharpness = scoreSharpness(features, predictor)
+            if isNearThreshold(sharpness, margin):
+                progress.log("escalate", item.source, sharpness=float(sharpness))
+            else:
+                item.features = features
+                item.sharpness = sharpness
+                recordSharpness(item, progress, journal, featureKey)
+        yield item
+
+def planStage(items, out, planner, journal=None):
+    """
+    Pipeline stage which works out where each photo goes
+
+    items:- ImportItems in order, with their metadata (and, if scored, their bucket) filled in
+    out:- the base out path
+    planner:- the VolumePlanner which numbers the volumes, carrying on from the ones already in out
+    journal:- the Journal to record the destinations in, or None
+    yields:- the ImportItems in the same order, with their destination filled in unless they are
+        duplicates, which aren't given a place in a volume
+    """
+    for item in items:
+        if item.duplicateOf is not None:
+            yield item
+            continue
+        name = os.path.basename(item.source)
+        if item.reached('planned'):
+            # keep the destination an earlier import chose, but count it so the volumes fill the same way
+            planner.keep(item.basePath, item.volume, name, item.source)
+            yield item
+            continue
+        if item.bucket is None:
+            # not scored, so everything is treated as sharp
+            item.bucket = "sharp"
+        item.basePath = getBasePathFromMetadata(item.metadata, item.bucket)
+        item.volume = planner.plan(item.basePath, name, item.source, item.size, item.partialHash)
+        item.destination = os.path.join(out, item.basePath, str(item.volume), name)
+        if journal is not None:
+            journal.record(item.source, 'planned', bucket=item.bucket, basePath=item.basePath, volume=item.volume,
+                           destination=item.destination)
+        yield item
+
+def dedupStage(items, progress, hashIndex, window, journal=None):
+    """
+    Pipeline stage which skips photos whose contents are already in the photos tree (or earlier in
+    this import), whatever they are called. The partial hashes are worked out on a pool of threads.
+
+    items:- ImportItems in order, with their metadata filled in
+    progress:- the Progress to log the duplicates to
+    hashIndex:- the HashIndex of the photos tree
+    window:- the OrderedWindow to hash the photos through
+    journal:- the Journal to record the duplicates in, or None
+    yields:- the ImportItems in the same order, with duplicateOf filled in for duplicates
+    """
+    for item in items:
+        if item.reached('copied') or item.duplicateOf is not None:
+            window.put(item, None)
+        else:
+            window.submit(item, photo_import.partialHash, item.readPath, item.size, item.data)
+        for checkedItem in withDuplicates(window.popFull(), progress, hashIndex, journal):
+            yield checkedItem
+    for checkedItem in withDuplicates(window.popAll(), progress, hashIndex, journal):
+        yield checkedItem
+
+def withDuplicates(results, progress, hashIndex, journal):
+    """
+    Looks up the items coming out of dedupStage's window in the hash index, reserving the ones which
+    aren't duplicates so that later copies of them are caught too
+    """
+    for item, partial in results:
+        if partial is not None:
+            item.partialHash = partial
+            item.duplicateOf = hashIndex.findDuplicate(item.readPath, item.size, partial, item.data)
+            if item.duplicateOf is not None:
+                progress.log("duplicate", item.source, duplicateOf=item.duplicateOf)
+                item.state = 'verified'
+                if journal is not None:
+                    journal.record(item.source, 'verified', sync=True, duplicateOf=item.duplicateOf)
+            else:
+                hashIndex.reserve(item.source, item.size, partial)
+        yield item
+
+def writePlanStage(items, progress, planWriter):
+    """
+    Pipeline stage which writes where each photo goes to a plan, rather than copying it
+
+    items:- ImportItems with their destination filled in
+    progress:- the Progress to log the photos to
+    planWriter:- the PlanWriter to write to
+    yields:- the ImportItems, with their data released
+    """
+    for item in items:
+        progress.log("plan", item.source, destination=item.destination)
+        planWriter.write(item)
+        item.data = None
+        yield item
+
+def checkPlanStage(items, progress, destinationIndex, journal):
+    """
+    Pipeline stage which checks that each photo in a plan is still the file that was planned, and
+    picks up whatever an earlier, interrupted run of the plan recorded about it
+
+    items:- ImportItems read from a plan
+    progress:- the Progress to log the photos which are skipped to
+    destinationIndex:- the DestinationIndex to claim each photo's destination in
+    journal:- the Journal to resume from and record in
+    yields:- the ImportItems which haven't changed
+    """
+    for item in items:
+        try:
+            stat = os.stat(item.source)
+        except FileNotFoundError:
+            stat = None
+        if stat is None or stat.st_size != item.size or stat.st_mtime_ns != item.mtime:
+            progress.log("skip", item.source, reason="changed since the plan was made")
+            continue
+        entry = journal.lookup(item.source, item.size, item.mtime)
+        if entry is not None:
+            item.restore(entry)
+        elif item.duplicateOf is None:
+            journal.record(item.source, 'planned', size=item.size, mtime=item.mtime, bucket=item.bucket,
+                           basePath=item.basePath, volume=item.volume, destination=item.destination)
+        if item.duplicateOf is None:
+            destinationIndex.claim(item.basePath, item.volume, os.path.basename(item.destination), item.source)
+        yield item
+
+def copyStage(items, progress, copyEngine, destinationIndex, journal=None, hashIndex=None):
+    """
+    Pipeline stage which queues the copy of each photo, unless there is already a file where it is going
+    (or an earlier photo is going there) or it is a duplicate. Photos which an earlier import copied
+    are only checked, and any temporary file an interrupted copy left behind is removed.
+
+    items:- ImportItems with their destination filled in
+    progress:- the Progress to log the photos to
+    copyEngine:- the CopyEngine to queue the copies on; it blocks this stage when too many are queued
+    destinationIndex:- the DestinationIndex the photos were planned with, which says what is
+        already in the photos tree
+    journal:- the Journal to record the copies in, or None
+    hashIndex:- the HashIndex to add the copies to, or None
+    yields:- the ImportItems, with their copy future filled in if one was queued, and their data
+        released
+    """
+    for item in items:
+        if item.duplicateOf is not None:
+            progress.log("skip", item.source, reason="duplicate", duplicateOf=item.duplicateOf)
+            if item.stagedPath is not None and os.path.exists(item.stagedPath):
+                os.remove(item.stagedPath)
+            item.data = None
+            yield item
+            continue
+        owner = destinationIndex.getOwner(item.basePath, item.volume, os.path.basename(item.destination))
+        if item.reached('copied') and owner == photo_import.ON_DISK:
+            if item.reached('verified') or verifyCopy(item, progress, journal):
+                progress.log("skip", item.source, reason="already copied", destination=item.destination)
+                yield item
+                continue
+            os.remove(item.destination)
+            owner = item.source
+        elif item.state is not None:
+            photo_import.removePartialCopies(item.destination)
+
+        destinationIndex.makeDirectory(item.basePath, item.volume)
+        if owner != item.source:
+            progress.log("skip", item.source, reason="a file is already there", destination=item.destination)
+            if item.stagedPath is not None:
+                os.remove(item.stagedPath)
+        elif item.stagedPath is not None:
+            # already copied off the card, so it only needs renaming into place
+            progress.log("move", item.source, destination=item.destination)
+            copyEngine.moveStaged(item.stagedPath, item.destination)
+            recordCopy(item, None, progress, journal, hashIndex)
         else:
-            unsharp.append(file)
-    
-    return sharp, questionable, unsharp
+            progress.log("copy", item.source, destination=item.destination)
+            if item.data is not None:
+                item.copied = copyEngine.submitBuffer(item.data, item.destination, item)
+            else:
+                item.copied = copyEngine.submit(item.source, item.destination, item)
+            if journal is not None or hashIndex is not None:
+                item.copied.add_done_callback(lambda future, item=item: recordCopy(item, future, progress, journal, hashIndex))
+        item.data = None
+        yield item
+
+def recordCopy(item, future, progress, journal, hashIndex):
+    """
+    Journals a finished copy, checks it, and adds it to the hash index. Runs on the copy engine's
+    thread, unless the copy was just a rename.
+
+    future:- the copy's future, or None if it was renamed into place
+    """
+    if future is not None and (future.cancelled() or future.exception() is not None):
+        return
+    if journal is not None:
+        journal.record(item.source, 'copied', sync=True)
+    if verifyCopy(item, progress, journal) and hashIndex is not None and item.partialHash is not None:
+        hashIndex.add(item.destination, item.partialHash)
+
+def verifyCopy(item, progress, journal):
+    """
+    Checks that a copied photo is all there, and journals it as verified if it is
 
+    returns:- True if the copy is good
+    """
+    if os.path.getsize(item.destination) != item.size:
+        progress.message("\tWarning %s is not the same size as %s" % (item.destination, item.source))
+        return False
+    item.state = 'verified'
+    if journal is not None:
+        journal.record(item.source, 'verified', sync=True)
+    return True
 
-def testImageSharpness(file, predictor):
+def loadPredictor(args):
     """
-    Tests and image to see if it is sharp
+    Loads the sharpness model given on the command line (or model.json), checking that it was trained
+    on the feature set given on the command line
 
-    file:- an image to test for sharpness
-    returns:- true if the image is sharp, otherwise false
+    returns:- a RuntimePredictor
     """
-    global lastIndex
-    photo = image_sharpness.Image(file)
-    wiVarSharpness = photo.getWholeImageVarianceSharpness()
-    afVarSharpness = photo.getVarianceSharpnessForPrimaryAfPoint(lastIndex)
-    wiGradSharpness = photo.getWholeImageGradientSharpness()
-    afGradSharpness = photo.getGradientSharpnessForPrimaryAfPoint(lastIndex)
-    focalLength = photo.getFocalLength().values[0]
-    focalDistance = photo.getFocalDistance()
-    avg0, avg1, avg2, avg3 = photo.getFourierValues(lastIndex)
+    modelPath = 'model.json'
+    if args.model != None:
+        modelPath = args.model[0]
+
+    with open(modelPath, 'r') as modelFile:
+        s = modelFile.read()
+        modelObj = json.loads(s)
 
-    sharpness = 0
+    # models written before there were feature set versions were all trained on version 1
+    modelFeatureSet = image_sharpness.makeFeatureSet(modelObj.get('featureSetVersion', image_sharpness.LEGACY_FEATURE_SET_VERSION),
+                                                     modelObj.get('pyramidLevel', image_sharpness.DEFAULT_PYRAMID_LEVEL))
+    featureSet = getFeatureSet(args)
+    if modelFeatureSet != featureSet:
+        raise ValueError("%s was trained on %s features, but %s features were asked for; use --feature-set-version and --pyramid-level to match it" %
+                         (modelPath, image_sharpness.describeFeatureSet(modelFeatureSet), image_sharpness.describeFeatureSet(featureSet)))
+    return generic_predictor.RuntimePredictor(modelObj['featureNames'], modelObj['coefficients'], modelObj['intercept'])
+
+def getFeatureSet(args):
+    """
+    Returns the image_sharpness.FeatureSet given on the command line
+    """
+    return image_sharpness.makeFeatureSet(args.feature_set_version, args.pyramid_level)
+
+def getMemoryBudget(args):
+    """
+    Returns the per worker memory budget given on the command line, in bytes
+    """
+    return args.memory_budget * 1024 * 1024
+
+def readAllMetadata(files, jobs=1, index=None):
+    """
+    Parses the EXIF data of every file exactly once, so that it can be shared by the sharpness
+    tests and the grouping
+
+    files:- the files to read
+    jobs:- the number of worker processes to spread the parsing across
+    index:- a FeatureIndex to reuse records from (and store new ones in), or None
+    returns:- a dictionary of <file, Metadata>
+    """
+    metadata = {}
+    if index is not None:
+        for file in files:
+            record = index.getMetadata(file)
+            if record is not None:
+                metadata[file] = record
+
+    missing = [file for file in files if file not in metadata]
+    metadata.update(zip(missing, image_sharpness.mapInWorkers(image_sharpness.readMetadata, jobs, missing)))
+
+    if index is not None:
+        for file in missing:
+            index.putMetadata(file, metadata[file])
+        index.commit()
+    return metadata
+
+
+def compareSharpnessSources(files, metadata, predictor, reportPath, jobs=1, index=None, memoryBudget=image_sharpness.DEFAULT_MEMORY_BUDGET,
+                            featureSet=image_sharpness.LEGACY_FEATURE_SET):
+    """
+    Scores every file from each of the sharpness sources, and writes a csv report of the scores
+    and buckets side by side. A summary of how often each source agrees with the full decode is
+    printed at the end.
+
+    files:- the files to score
+    metadata:- a dictionary of <file, Metadata> covering every file
+    predictor:- the model to score the images with, or None to use the built in one
+    reportPath:- the csv file to write
+    jobs:- the number of worker processes to spread the scoring across
+    index:- a FeatureIndex to reuse features from (and store new ones in), or None
+    memoryBudget:- roughly how many bytes of temporaries each worker may use
+    featureSet:- the image_sharpness.FeatureSet the model was trained on
+    """
+    sources = image_sharpness.SOURCES
+    scores = {}
+    for source in sources:
+        startTime = time.perf_counter()
+        featureMatrix, _ = image_sharpness.extractFeatures(files, metadata, lastIndex=DEFAULT_AF_POINT_INDEX, source=source,
+                                                           jobs=jobs, memoryBudget=memoryBudget, index=index, featureSet=featureSet)
+        elapsed = time.perf_counter() - startTime
+        scores[source] = scoreAllSharpness(image_sharpness.featureArray(featureMatrix), predictor)
+        print("\t%s: %.1fs (%.3fs per file, including index hits)" % (source, elapsed, elapsed / max(len(files), 1)))
+
+    header = ["filename"]
+    for source in sources:
+        header += [source + "_score", source + "_bucket"]
+    with open(reportPath, 'w', newline='') as reportFile:
+        w = csv.writer(reportFile)
+        w.writerow(header)
+        for i, file in enumerate(files):
+            row = [file]
+            for source in sources:
+                row += [scores[source][i], bucketForScore(scores[source][i])]
+            w.writerow(row)
+
+    for source in sources[1:]:
+        agreements = {}
+        for full, other in zip(scores['full'], scores[source]):
+            key = (bucketForScore(full), bucketForScore(other))
+            agreements[key] = agreements.get(key, 0) + 1
+        agreed = sum(count for (full, other), count in agreements.items() if full == other)
+        print("\t%s agrees with full on %d of %d files" % (source, agreed, len(files)))
+        for (full, other), count in sorted(agreements.items()):
+            if full != other:
+                print("\t\tfull %s, %s %s: %d" % (full, source, other, count))
+
+    # what --cascade-margin would have done: the files near a threshold are scored from the full
+    # decode, the rest keep their preview bucket
+    for margin in CASCADE_MARGINS:
+        escalated = 0
+        agreed = 0
+        for full, cheap in zip(scores['full'], scores[CASCADE_SOURCE]):
+            if isNearThreshold(cheap, margin):
+                escalated += 1
+                agreed += 1
+            elif bucketForScore(cheap) == bucketForScore(full):
+                agreed += 1
+        print("\t--cascade-margin %g decodes %d of %d files in full, and agrees with full on %d" % (margin, escalated, len(files), agreed))
+
+
+def scoreSharpness(features, predictor):
+    """
+    Scores a set of features with the model
+
+    features:- a list with a value for each of image_sharpness.FEATURE_NAMES
+    predictor:- the model to score the image with, or None to use the built in one
+    returns:- the sharpness score
+    """
+    return scoreAllSharpness([features], predictor)[0]
+
+
+def scoreAllSharpness(featureSets, predictor):
+    """
+    Scores many sets of features with the model in one vectorised call
+
+    featureSets:- an (n_files x n_features) array (or list of lists) of image_sharpness.FEATURE_NAMES
+    predictor:- the model to score the images with, or None to use the built in one
+    returns:- a numpy array of sharpness scores
+    """
+    if len(featureSets) == 0:
+        return np.zeros(0)
+    X = np.asarray(featureSets, dtype=np.float64)
     if predictor == None:
-        coefWv = -3.88599991e+00
-        coefAg = 2.86841821e-01
-        coefF = -4.75593447e-03
-        coefA0 = 9.47094800e-05
-        coefA1 = -8.92048122e-04
-        coefA3 = -7.00857457e-04
-        C = 3.3100968292972452
-        sharpness = coefWv * wiVarSharpness + coefAg * afGradSharpness + coefF * focalLength + coefA0 * avg0 + coefA1 * avg1 + coefA3 * avg3 + C
-    else:
-        dataPoint = [1, wiVarSharpness, afVarSharpness, wiGradSharpness, afGradSharpness, focalLength, focalDistance, avg0, avg1, avg2, avg3]
-        sharpness = predictor.predict(dataPoint)
+        return X @ DEFAULT_COEFFICIENTS + DEFAULT_INTERCEPT
+    dataPoints = np.hstack([np.ones((X.shape[0], 1)), X])
+    return predictor.predict_batch(dataPoints)
+
+
+def bucketForScore(sharpness):
+    """
+    Decides which bucket a sharpness score belongs in
 
-    if sharpness < 2.5:
-        print (file, "- unsharp", sharpness)
+    sharpness:- the score from scoreSharpness
+    returns:- one of "sharp", "questionable" or "unsharp"
+    """
+    if sharpness < UNSHARP_THRESHOLD:
         return "unsharp"
-    elif sharpness >= 2.5 and sharpness < 3.0:
-        print (file, "- questionable", sharpness)
+    elif sharpness >= UNSHARP_THRESHOLD and sharpness < SHARP_THRESHOLD:
         return "questionable"
     else:
-        print (file, "- sharp", sharpness)
         return "sharp"
 
 
-
-
-def getAllNefFiles(inputLocations):
+def isNearThreshold(sharpness, margin):
     """
-    Uses the recursive search functionality to return a list of NEF files
+    Decides whether a sharpness score is too close to a bucket threshold to be trusted
 
-    inputLocations:- a list of locations to search below
-    returns:- a list of all the NEF files found below each of the search locations
+    sharpness:- the score from scoreSharpness
+    margin:- how close counts as too close
     """
-    searcher = python_batch_processing.RecursiveSearch.RecursiveSearch(
-        lambda path: path.lower().endswith(".nef"))
-    files = searcher.search_many(inputLocations)
-    return sorted(files)
+    return abs(sharpness - UNSHARP_THRESHOLD) < margin or abs(sharpness - SHARP_THRESHOLD) < margin
 
 
 
-def splitFilesIntoDaysAndCameras(nefFiles, prefix):
-    """
-    Takes the list of files, and creates a dictionary where they keys are
-    the base paths (ie Year/Month/Day/Camera).
 
-    nefFiles:- the full list of NEF files
-    returns:- a dictionary of <base path, nef file>
+def getAllNefFiles(inputLocations):
     """
-    groupedImages = {}
-    for path in nefFiles:
-        tags = getTagsFromFile(path)
-        basePath = getBasePathFromTags(tags, prefix)
-        if basePath not in groupedImages:
-            groupedImages[basePath] = []
-        groupedImages[basePath].append(path)
-        print("\tProcessed metadata for", path)
-    return groupedImages
+    Walks the input locations in parallel to return a sorted list of NEF files
 
-def getTagsFromFile(nefFilePath):
+    inputLocations:- a list of locations to search below
+    returns:- a list of all the NEF files found below each of the search locations
     """
-    Retrieve the tags from an NEF file
+    return [path for _, path, _ in photo_import.Discovery(inputLocations)]
+
 
-    nefFilePath:- the path of the file to read
-    returns:= a list of the EXIF tags in the file
-    """
-    tags = []
-    with open(nefFilePath, 'rb') as nefFile:
-        tags = exifread.process_file(nefFile)
-    return tags
 
-def getBasePathFromTags(tags, prefix):
+def getBasePathFromMetadata(metadata, prefix):
     """
     Uses the 'Image DateTime' and 'Image Model' tags to build a base path
     under which to store images.
 
-    tags:- the tags extracted from the image
+    metadata:- the Metadata record for the image
     returns:- a partial path
     """
-    camera = str(tags[CAMERA_TAG]).replace(" ", "_")
-    dateString = str(tags[DATE_TAG])
-    dateMatches = DATETIME_RE.match(dateString)
+    camera = metadata.model.replace(" ", "_")
+    dateMatches = DATETIME_RE.match(metadata.dateTime)
     year = dateMatches.group(1)
     month = dateMatches.group(2)
     day = dateMatches.group(3)
@@ -205,64 +1008,29 @@ def getBasePathFromTags(tags, prefix):
     basePath = os.path.join(prefix, year, month, day, camera)
     return basePath
 
-def splitGroupsIntoVolumes(groupedFiles):
-    """
-    Takes the list of files grouped into base paths, and splits each group into
-    volumes of at most 250 images
-
-    groupedFiles:- a dictionary in the form <base path, file list>
-    returns:- a dictionary in the form<base path, list of file lists>
-    """
-    volumes = {}
-    for group in groupedFiles:
-        if group not in volumes:
-            volumes[group] = []
-        numFilesInGroup = len(groupedFiles[group])
-        if numFilesInGroup < 250:
-            volumes[group].append(groupedFiles[group])
-        else:
-            numVolumes = int((numFilesInGroup / 250)) + 1
-            for volumeIndex in range(1, numVolumes + 1):
-                startIndex = (volumeIndex - 1) * 250
-                endIndex = startIndex + 250
-                if volumeIndex == 1:
-                    volumes[group].append(groupedFiles[group][:endIndex])
-                elif volumeIndex == numVolumes:
-                    volumes[group].append(groupedFiles[group][startIndex:])
-                else:
-                    volumes[group].append(groupedFiles[group][startIndex:endIndex])
-    return volumes
-
-def copyFilesToVolumePaths(outDir, volumes):
-    """
-    Iterates through the collection of volumes and does the actual
-    file copying
-
-    outDir:- the base out path
-    volumes:- the collection of files grouped by day and camera, and split into volumes
-    """
-    for group in volumes:
-        baseOutPath = os.path.join(outDir, group)
-        volumeIndex = 1
-        for volume in volumes[group]:
-            volumeString = str(volumeIndex)
-            volumePath = os.path.join(baseOutPath, volumeString)
-            os.makedirs(volumePath, exist_ok=True)
-            for photo in volume:
-                photoBaseName = os.path.basename(photo)
-                photoOutPath = os.path.join(volumePath, photoBaseName)
-                if not os.path.exists(photoOutPath):
-                    print("\tCopy", photo, "to", photoOutPath)
-                    shutil.copyfile(photo, photoOutPath)
-                else:
-                    print("\tIgnoring", photo, "because there is already a file at", photoOutPath)
-
-            volumeIndex += 1
-
 if __name__ == "__main__":
     parser = python_batch_processing.StandardisedArguments.create_basic_parser(
         "Import digital photos from a memory card into a nice structure")
     parser = image_sharpness.StandardisedArguments.add_sharpness_arguments(parser)
+    parser = image_sharpness.StandardisedArguments.add_parallel_arguments(parser)
+    parser = image_sharpness.StandardisedArguments.add_index_arguments(parser)
+    parser = image_sharpness.StandardisedArguments.add_source_arguments(parser)
+    parser = image_sharpness.StandardisedArguments.add_feature_set_arguments(parser)
     parser = generic_predictor.StandardisedArguments.add_arguments(parser)
+    parser = photo_import.StandardisedArguments.add_copy_arguments(parser)
+    parser = photo_import.StandardisedArguments.add_pipeline_arguments(parser)
+    parser = photo_import.StandardisedArguments.add_journal_arguments(parser)
+    parser = photo_import.StandardisedArguments.add_dedup_arguments(parser)
+    parser = photo_import.StandardisedArguments.add_plan_arguments(parser)
+    parser = photo_import.StandardisedArguments.add_profile_arguments(parser)
+    parser = photo_import.StandardisedArguments.add_progress_arguments(parser)
     arguments = parser.parse_args()
+    if arguments.execute == None and not arguments.input:
+        parser.error("--input is required unless a plan is being executed")
+    if arguments.plan_only != None and arguments.read_once == 'copy-first':
+        parser.error("--read-once copy-first copies the photos, so it can't be used with --plan-only")
+    if arguments.pyramid_level < 0:
+        parser.error("--pyramid-level can't be negative")
+    if arguments.cascade_margin != None and arguments.sharpness_source == 'preview':
+        parser.error("--cascade-margin escalates from the preview to --sharpness-source, so that can't be the preview too")
     main(arguments)
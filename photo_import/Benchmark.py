@@ -0,0 +1,202 @@
+# pylint: disable=C0103
+"""
+A small harness for timing the parts of an import, and the synthetic fixtures to time them on, so
+that a change can be measured without a card full of real photos
+"""
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+
+import numpy as np
+
+# a D610 sized image, which is what the AF point boxes are laid out for
+SYNTHETIC_WIDTH = 6016
+SYNTHETIC_HEIGHT = 4016
+
+TIFF_MODEL_TAG = 0x0110
+TIFF_DATETIME_TAG = 0x0132
+
+
+class Benchmark:
+    """
+    Times named pieces of work and collects the results, along with what they were run on, as a
+    dictionary which can be written out as json and compared with a run from another commit
+    """
+    def __init__(self, repeat=5):
+        """
+        Constructs a benchmark with no results
+
+        repeat:- how many times to time each piece of work by default
+        """
+        self.repeat = repeat
+        self.results = {}
+
+    def time(self, name, function, items=1, repeat=None, setup=None):
+        """
+        Times a piece of work several times, keeping the best and median times
+
+        name:- what to call the result
+        function:- the work to time, which is called with no arguments
+        items:- how many things (eg files) one call of the function processes
+        repeat:- how many times to time it, or None for the default
+        setup:- a function to call, untimed, before each call of the function, or None
+        returns:- what the function returned the last time it was called
+        """
+        timings = []
+        result = None
+        for _ in range(repeat if repeat is not None else self.repeat):
+            if setup is not None:
+                setup()
+            startTime = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - startTime)
+        self.record(name, timings, items)
+        return result
+
+    def record(self, name, timings, items=1):
+        """
+        Stores the timings of a piece of work which was timed some other way
+        """
+        best = min(timings)
+        median = float(np.median(timings))
+        self.results[name] = {
+            'seconds': median,
+            'best': best,
+            'repeat': len(timings),
+            'items': items,
+            'secondsPerItem': median / max(items, 1)
+        }
+        print("\t%s: %.4fs (best %.4fs), %.3fms per item" % (name, median, best, 1000 * median / max(items, 1)))
+
+    def skip(self, name, reason):
+        """
+        Notes that a piece of work couldn't be timed on this machine
+        """
+        self.results[name] = {'skipped': reason}
+        print("\t%s: skipped, %s" % (name, reason))
+
+    def getReport(self):
+        """
+        returns:- a dictionary of the results and of what they were measured on
+        """
+        return {
+            'commit': getGitCommit(),
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'results': self.results
+        }
+
+
+def getGitCommit():
+    """
+    Finds the commit of the checkout this file is in, with '-dirty' added if it has been changed
+
+    returns:- the commit hash, or None if it isn't in a git checkout
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True,
+                                check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if status.strip() != "" else "")
+
+
+def compareReports(report, baseline):
+    """
+    Compares the results of two benchmark runs
+
+    report:- the report of the run being looked at
+    baseline:- the report of the run to compare it with
+    returns:- a list of (name, baseline seconds, seconds, speedup) for the results both runs have
+    """
+    rows = []
+    for name, result in report['results'].items():
+        base = baseline['results'].get(name)
+        if base is None or 'seconds' not in base or 'seconds' not in result:
+            continue
+        rows.append((name, base['seconds'], result['seconds'], base['seconds'] / max(result['seconds'], 1e-12)))
+    return rows
+
+
+def makeSyntheticImage(width=SYNTHETIC_WIDTH, height=SYNTHETIC_HEIGHT, seed=0):
+    """
+    Makes an rgb image with some detail in it, to stand in for a decoded photo
+
+    returns:- a (height x width x 3) uint8 numpy array
+    """
+    generator = np.random.default_rng(seed)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, np.newaxis]
+    x = np.linspace(0, 1, width, dtype=np.float32)[np.newaxis, :]
+    base = 96 + 64 * np.sin(40 * x) * np.cos(30 * y)
+    rgb = np.empty((height, width, 3), dtype=np.uint8)
+    for channel in range(3):
+        noise = generator.integers(0, 32, size=(height, width), dtype=np.uint8)
+        rgb[:, :, channel] = np.clip(base + noise, 0, 255).astype(np.uint8)
+    return rgb
+
+
+def writeSyntheticTiff(path, model="NIKON D610", dateTime="2021:05:06 10:11:12", padding=0):
+    """
+    Writes the smallest little-endian TIFF that carries a Model and a DateTime tag, which is all the
+    grouping code reads, optionally followed by padding to give it a photo-like size
+
+    path:- the file to write
+    padding:- how many extra bytes to put at the end of the file
+    """
+    entries = [(TIFF_MODEL_TAG, model.encode('ascii') + b'\x00'), (TIFF_DATETIME_TAG, dateTime.encode('ascii') + b'\x00')]
+    ifdOffset = 8
+    valueOffset = ifdOffset + 2 + 12 * len(entries) + 4
+    ifd = len(entries).to_bytes(2, 'little')
+    values = b''
+    for tag, value in entries:
+        ifd += tag.to_bytes(2, 'little') + (2).to_bytes(2, 'little') + len(value).to_bytes(4, 'little')
+        ifd += (valueOffset + len(values)).to_bytes(4, 'little')
+        values += value
+    ifd += (0).to_bytes(4, 'little')
+    with open(path, 'wb') as tiffFile:
+        tiffFile.write(b'II' + (42).to_bytes(2, 'little') + ifdOffset.to_bytes(4, 'little'))
+        tiffFile.write(ifd + values)
+        if padding > 0:
+            tiffFile.write(os.urandom(padding))
+
+
+def makeSyntheticTree(root, folders=10, filesPerFolder=100, padding=0):
+    """
+    Writes a card-like tree of synthetic NEFs, spread over a couple of days
+
+    root:- the folder to write them under
+    folders:- how many DCIM style folders to make
+    filesPerFolder:- how many files to put in each
+    padding:- how many extra bytes to put in each file
+    returns:- a sorted list of the files written
+    """
+    files = []
+    for folder in range(folders):
+        directory = os.path.join(root, "DCIM", "%03dD610" % (100 + folder))
+        os.makedirs(directory, exist_ok=True)
+        for number in range(filesPerFolder):
+            path = os.path.join(directory, "DSC_%04d.NEF" % number)
+            writeSyntheticTiff(path, dateTime="2021:05:%02d 10:11:12" % (1 + folder % 2), padding=padding)
+            files.append(path)
+    return sorted(files)
+
+
+def writeReport(report, out):
+    """
+    Writes a report into a folder, named after the commit it was run on
+
+    returns:- the path written
+    """
+    os.makedirs(out, exist_ok=True)
+    path = os.path.join(out, "benchmark-%s.json" % (report['commit'] or "unknown"))
+    with open(path, 'w') as reportFile:
+        json.dump(report, reportFile, indent=2)
+    return path
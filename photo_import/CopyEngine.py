@@ -0,0 +1,405 @@
+# pylint: disable=C0103
+"""
+Copies files with bounded concurrency per source and per destination device, using kernel side copies
+where the platform has them, and writing through a temporary file so a destination path only ever
+holds a complete file
+"""
+import os
+import glob
+import errno
+import hashlib
+import time
+import threading
+import concurrent.futures
+from .Profiling import measureCall
+
+DEFAULT_JOBS_PER_SOURCE = 2
+DEFAULT_JOBS_PER_DESTINATION = 4
+DEFAULT_MAX_PENDING = 64
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# the temporary name a file is copied to before being renamed into place
+PARTIAL_NAME = ".%s.%d.%d.partial"
+
+# the folder, under the out folder, that photos are copied to first when they are copied before being sorted
+STAGING_NAME = ".photo-import-staging"
+
+# errors that mean a kernel copy method isn't supported for this pair of files, rather than a real failure
+UNSUPPORTED_ERRNOS = set([errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSUP])
+
+class CopyEngine:
+    """
+    Runs copies on a pool of threads. Each copy holds a slot on its source device and a slot on its
+    destination device while it runs, so a slow card reader isn't hit by more readers than it can serve
+    while a fast destination still gets enough writers to stay busy.
+    """
+    def __init__(self, jobsPerSource=DEFAULT_JOBS_PER_SOURCE, jobsPerDestination=DEFAULT_JOBS_PER_DESTINATION, sync=True,
+                 maxPending=DEFAULT_MAX_PENDING):
+        """
+        Constructs a copy engine
+
+        jobsPerSource:- how many files may be read from one device at once
+        jobsPerDestination:- how many files may be written to one device at once
+        sync:- whether to fsync each file before renaming it into place
+        maxPending:- how many copies may be queued or running before submit blocks, or None for no limit
+        """
+        self.jobsPerSource = jobsPerSource
+        self.jobsPerDestination = jobsPerDestination
+        self.sync = sync
+        self.lock = threading.Lock()
+        self.semaphores = {}
+        self.pending = threading.BoundedSemaphore(maxPending) if maxPending is not None else None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=4 * max(jobsPerSource, jobsPerDestination))
+        # the copies which haven't finished yet, and the first error a copy hit
+        self.futures = set()
+        self.error = None
+        self.bytesCopied = 0
+        self.filesCopied = 0
+        self.startTime = None
+        self.endTime = None
+        # called with (item, name, metrics) after each copy made for an item, when copies are measured
+        self.recordCall = None
+
+    def measureCopies(self, recordCall):
+        """
+        Measures each copy made for an item (its wall and CPU time and the bytes it read and wrote) on
+        the thread that makes it
+
+        recordCall:- a function taking (item, name, metrics), like Profiler.recordCall
+        """
+        self.recordCall = recordCall
+
+    def submit(self, source, destination, item=None, name="copy"):
+        """
+        Queues a copy. Anything already at the destination is replaced, so callers should check first.
+        Blocks while maxPending copies are already queued or running.
+
+        source:- the file to copy
+        destination:- the path to copy it to; its directory must already exist
+        item:- the ImportItem the copy is made for, to measure it against, or None
+        name:- what the copy is measured as
+        returns:- a future which resolves to the number of bytes copied
+        """
+        return self.start(self.copy, source, destination, item, name)
+
+    def start(self, function, *args):
+        """
+        Runs a copy on the pool, once there is room for it. Raises the error of any copy which has
+        already failed instead, so an import stops at the first failed copy (eg a full or failing
+        destination) rather than queuing the rest of the card behind it.
+        """
+        with self.lock:
+            if self.error is not None:
+                raise self.error
+            if self.startTime is None:
+                self.startTime = time.perf_counter()
+        if self.pending is not None:
+            self.pending.acquire()
+        future = self.executor.submit(function, *args)
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self.finished)
+        return future
+
+    def finished(self, future):
+        """
+        Forgets a copy which has finished, keeping its error if it is the first to fail
+        """
+        if self.pending is not None:
+            self.pending.release()
+        with self.lock:
+            self.futures.discard(future)
+            if self.error is None and not future.cancelled() and future.exception() is not None:
+                self.error = future.exception()
+
+    def submitBuffer(self, data, destination, item=None, name="copy"):
+        """
+        Queues the write of a file which has already been read into memory, so the source isn't
+        read again. Only a slot on the destination device is held while it is written.
+
+        data:- the contents of the file, as bytes
+        destination:- the path to write it to; its directory must already exist
+        item:- the ImportItem the write is made for, to measure it against, or None
+        name:- what the write is measured as
+        returns:- a future which resolves to the number of bytes written
+        """
+        return self.start(self.write, data, destination, item, name)
+
+    def submitStaging(self, source, destination, item=None):
+        """
+        Queues the copy of a photo to the staging folder. It isn't counted as copied until it is
+        moved into place with moveStaged, so a staged copy which is thrown away (eg because the
+        photo turned out to be a duplicate) never counts as imported.
+
+        source:- the photo to copy
+        destination:- its path in the staging folder
+        item:- the ImportItem the copy is made for, to measure it against, or None
+        returns:- a future which resolves to the number of bytes copied
+        """
+        return self.start(self.copy, source, destination, item, "stage", False)
+
+    def moveStaged(self, stagedPath, destination):
+        """
+        Renames a staged photo into place, and counts it as copied
+
+        stagedPath:- the photo's path in the staging folder
+        destination:- where it goes; on the same filesystem as the staging folder
+        """
+        os.replace(stagedPath, destination)
+        self.count(os.path.getsize(destination))
+
+    def wait(self):
+        """
+        Waits for every queued copy to finish, raising the first error any of them hit
+        """
+        with self.lock:
+            futures = list(self.futures)
+        concurrent.futures.wait(futures)
+        with self.lock:
+            self.endTime = time.perf_counter()
+            if self.error is not None:
+                raise self.error
+
+    def close(self):
+        """
+        Waits for the queued copies and stops the worker threads
+        """
+        try:
+            self.wait()
+        finally:
+            self.executor.shutdown()
+
+    def copy(self, source, destination, item=None, name="copy", counted=True):
+        """
+        Copies one file, holding a slot on both devices while it does
+
+        counted:- whether to add the copy to the totals
+        returns:- the number of bytes copied
+        """
+        sourceDevice = os.stat(source).st_dev
+        destinationDevice = os.stat(os.path.dirname(os.path.abspath(destination))).st_dev
+        with self.getSemaphore('source', sourceDevice, self.jobsPerSource):
+            with self.getSemaphore('destination', destinationDevice, self.jobsPerDestination):
+                copied = self.measure(copyFileAtomically, (source, destination, self.sync), item, name)
+
+        if counted:
+            self.count(copied)
+        return copied
+
+    def write(self, data, destination, item=None, name="copy"):
+        """
+        Writes one file from memory, holding a slot on the destination device while it does
+
+        returns:- the number of bytes written
+        """
+        destinationDevice = os.stat(os.path.dirname(os.path.abspath(destination))).st_dev
+        with self.getSemaphore('destination', destinationDevice, self.jobsPerDestination):
+            written = self.measure(writeBufferAtomically, (data, destination, self.sync), item, name)
+        self.count(written)
+        return written
+
+    def measure(self, function, args, item, name):
+        """
+        Makes a copy, measuring it against its item if copies are being measured. Only the copy itself
+        is measured, not the wait for a slot on the devices.
+
+        returns:- whatever function returns
+        """
+        recordCall = self.recordCall
+        if recordCall is None or item is None:
+            return function(*args)
+        result, metrics = measureCall(function, args)
+        metrics['bytesCopied'] = result
+        recordCall(item, name, metrics)
+        return result
+
+    def count(self, copied):
+        """
+        Adds a finished copy to the totals
+        """
+        with self.lock:
+            self.bytesCopied += copied
+            self.filesCopied += 1
+
+    def getSemaphore(self, role, device, jobs):
+        """
+        Returns the semaphore limiting concurrent copies on a device, creating it on first use
+        """
+        with self.lock:
+            key = (role, device)
+            if key not in self.semaphores:
+                self.semaphores[key] = threading.BoundedSemaphore(jobs)
+            return self.semaphores[key]
+
+    def getSummary(self):
+        """
+        Describes how much was copied and how fast
+
+        returns:- a one line string
+        """
+        with self.lock:
+            elapsed = 0.0
+            if self.startTime is not None:
+                elapsed = (self.endTime or time.perf_counter()) - self.startTime
+            megabytes = self.bytesCopied / (1024 * 1024)
+            rate = megabytes / elapsed if elapsed > 0 else 0.0
+            return "Copied %d files (%.1f MB) in %.1fs, %.1f MB/s" % (self.filesCopied, megabytes, elapsed, rate)
+
+
+def copyFileAtomically(source, destination, sync=True):
+    """
+    Copies a file to a temporary name next to the destination, then renames it into place, so that an
+    interrupted copy never leaves a partial file at the destination
+
+    source:- the file to copy
+    destination:- the path to copy it to
+    sync:- whether to fsync the file before renaming it
+    returns:- the number of bytes copied
+    """
+    def write(destinationFd):
+        with open(source, 'rb') as sourceFile:
+            size = os.fstat(sourceFile.fileno()).st_size
+            copied = copyFileDescriptor(sourceFile.fileno(), destinationFd, size)
+        if copied != size:
+            raise IOError("Short copy of %s: %d of %d bytes" % (source, copied, size))
+        return copied
+    return writeAtomically(destination, write, sync)
+
+
+def writeBufferAtomically(data, destination, sync=True):
+    """
+    Writes a file which has already been read into memory to a temporary name next to the
+    destination, then renames it into place
+
+    data:- the contents of the file, as bytes
+    destination:- the path to write it to
+    sync:- whether to fsync the file before renaming it
+    returns:- the number of bytes written
+    """
+    def write(destinationFd):
+        view = memoryview(data)
+        while view:
+            written = os.write(destinationFd, view[:CHUNK_SIZE])
+            view = view[written:]
+        return len(data)
+    return writeAtomically(destination, write, sync)
+
+
+def writeAtomically(destination, write, sync=True):
+    """
+    Writes a file under a temporary name next to the destination, then renames it into place
+
+    destination:- the path the file should end up at
+    write:- a function which writes the file to the file descriptor it is given, and returns the
+        number of bytes it wrote
+    sync:- whether to fsync the file before renaming it
+    returns:- whatever write returns
+    """
+    directory, name = os.path.split(os.path.abspath(destination))
+    tempPath = os.path.join(directory, PARTIAL_NAME % (name, os.getpid(), threading.get_ident()))
+    try:
+        with open(tempPath, 'wb') as destinationFile:
+            written = write(destinationFile.fileno())
+            if sync:
+                os.fsync(destinationFile.fileno())
+        os.replace(tempPath, destination)
+    except BaseException:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+        raise
+    return written
+
+
+def getStagingPath(stagingDirectory, source):
+    """
+    Returns where a photo is copied to before it is sorted. The name is the same every time for the
+    same source path, so an interrupted import can find what it already copied, and photos with the
+    same name on different cards don't collide.
+
+    stagingDirectory:- the folder photos are copied to first
+    source:- the path of the photo
+    """
+    digest = hashlib.sha1(os.path.abspath(source).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(stagingDirectory, "%s-%s" % (digest, os.path.basename(source)))
+
+
+def removePartialCopies(destination):
+    """
+    Removes the temporary files that interrupted copies to a destination left behind
+
+    destination:- the path the copies were going to
+    returns:- the number of files removed
+    """
+    directory, name = os.path.split(os.path.abspath(destination))
+    pattern = os.path.join(glob.escape(directory), "." + glob.escape(name) + ".*.partial")
+    removed = 0
+    for path in glob.glob(pattern):
+        os.remove(path)
+        removed += 1
+    return removed
+
+
+def copyFileDescriptor(sourceFd, destinationFd, size):
+    """
+    Copies size bytes between two open files, trying copy_file_range, then sendfile, then plain
+    reads and writes
+
+    returns:- the number of bytes copied
+    """
+    for method in (copyWithCopyFileRange, copyWithSendfile):
+        try:
+            return method(sourceFd, destinationFd, size)
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS or os.lseek(destinationFd, 0, os.SEEK_CUR) != 0:
+                raise
+            os.lseek(sourceFd, 0, os.SEEK_SET)
+    return copyWithReadWrite(sourceFd, destinationFd, size)
+
+
+def copyWithCopyFileRange(sourceFd, destinationFd, size):
+    """
+    Copies using copy_file_range, which can avoid moving the data through user space entirely (and
+    is a reflink on filesystems which support it)
+    """
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError(errno.ENOSYS, "copy_file_range is not available")
+    copied = 0
+    while copied < size:
+        count = os.copy_file_range(sourceFd, destinationFd, min(size - copied, 1 << 30))
+        if count == 0:
+            break
+        copied += count
+    return copied
+
+
+def copyWithSendfile(sourceFd, destinationFd, size):
+    """
+    Copies using sendfile, which keeps the data in the kernel
+    """
+    if not hasattr(os, 'sendfile'):
+        raise OSError(errno.ENOSYS, "sendfile is not available")
+    copied = 0
+    while copied < size:
+        count = os.sendfile(destinationFd, sourceFd, copied, min(size - copied, 1 << 30))
+        if count == 0:
+            break
+        copied += count
+    return copied
+
+
+def copyWithReadWrite(sourceFd, destinationFd, size):
+    """
+    Copies with plain reads and writes of a large buffer
+    """
+    copied = 0
+    while copied < size:
+        data = os.read(sourceFd, min(CHUNK_SIZE, size - copied))
+        if not data:
+            break
+        view = memoryview(data)
+        while view:
+            written = os.write(destinationFd, view)
+            view = view[written:]
+        copied += len(data)
+    return copied
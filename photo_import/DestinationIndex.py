@@ -0,0 +1,172 @@
+# pylint: disable=C0103
+"""
+An in-memory picture of the photos tree, so that planning and copying don't have to ask the disk
+about every photo
+"""
+import os
+import threading
+
+from .HashIndex import partialHash
+
+# the owner of a file which was already in the photos tree before this import
+ON_DISK = "on disk"
+
+
+class DestinationIndex:
+    """
+    Knows which volumes exist under each base path (ie Bucket/Year/Month/Day/Camera) of the photos
+    tree, and which files are in them. Each base path is read with one scandir of its folder and one
+    of each of its volumes, the first time a photo is planned into it. Files which this import plans
+    are claimed in the index as well, so it also answers whether an earlier photo in the import is
+    going to the same place. It may be shared between threads.
+    """
+    def __init__(self, root):
+        """
+        Constructs an index which reads the photos tree as it is needed
+
+        root:- the base out path
+        """
+        self.root = root
+        self.lock = threading.Lock()
+        self.volumes = {}
+        self.directories = set()
+        # <(base path, volume, name), (size, partial hash)> of the files this import claimed
+        self.claimed = {}
+
+    def getVolumes(self, basePath):
+        """
+        Gets the volumes under a base path, reading them off the disk if this is the first time
+
+        basePath:- the partial path photos are grouped under
+        returns:- a dictionary of <volume number, dictionary of <file name, owner>>; the owner of a
+            file is ON_DISK if it was already there, or the source of the photo going there
+        """
+        with self.lock:
+            volumes = self.volumes.get(basePath)
+            if volumes is None:
+                volumes = self.scan(basePath)
+                self.volumes[basePath] = volumes
+            return volumes
+
+    def scan(self, basePath):
+        """
+        Reads the volumes of a base path off the disk. Hidden files (eg interrupted copies) and
+        folders which aren't numbered aren't counted.
+        """
+        volumes = {}
+        folder = os.path.join(self.root, basePath)
+        try:
+            with os.scandir(folder) as iterator:
+                volumeEntries = [entry for entry in iterator if entry.name.isdigit() and entry.is_dir()]
+        except FileNotFoundError:
+            return volumes
+        for entry in volumeEntries:
+            with os.scandir(entry.path) as iterator:
+                names = [file.name for file in iterator if not file.name.startswith('.') and file.is_file()]
+            volumes[int(entry.name)] = dict((name, ON_DISK) for name in names)
+            self.directories.add(entry.path)
+        return volumes
+
+    def findVolume(self, basePath, name, source=None, size=None, partial=None):
+        """
+        Finds which volume of a base path a photo is in (or is going to): a file of the same name
+        with the same size and partial hash. A file which only shares the name (eg from a second
+        camera of the same model, or after the file numbers wrapped around) is a different photo.
+        The contents are only hashed when the name and size match.
+
+        name:- the photo's file name
+        source:- the path of the photo, or None to match on the name alone
+        size:- its size in bytes, or None to look it up
+        partial:- its partialHash, if it is already known
+        returns:- the volume number, or None if there is no such file
+        """
+        volumes = self.getVolumes(basePath)
+        with self.lock:
+            candidates = [(volume, volumes[volume][name]) for volume in sorted(volumes) if name in volumes[volume]]
+        for volume, owner in candidates:
+            if source is None:
+                return volume
+            if size is None:
+                size = os.stat(source).st_size
+            existingSize, existingPartial = self.getSizeAndHash(basePath, volume, name, owner)
+            if existingSize != size:
+                continue
+            if partial is None:
+                partial = partialHash(source, size)
+            if existingPartial is None:
+                path = os.path.join(self.root, basePath, str(volume), name) if owner == ON_DISK else owner
+                existingPartial = partialHash(path, existingSize)
+            if existingPartial == partial:
+                return volume
+        return None
+
+    def getSizeAndHash(self, basePath, volume, name, owner):
+        """
+        Gets what is known about the contents of a file at (or going to) a place in the photos tree
+
+        returns:- (size, partial hash), either of which may be None if it isn't known
+        """
+        with self.lock:
+            size, partial = self.claimed.get((basePath, volume, name), (None, None))
+        if size is None:
+            path = os.path.join(self.root, basePath, str(volume), name) if owner == ON_DISK else owner
+            try:
+                size = os.stat(path).st_size
+            except FileNotFoundError:
+                pass
+        return size, partial
+
+    def getLastVolume(self, basePath):
+        """
+        Finds the highest numbered volume of a base path and how many files are in it
+
+        returns:- (volume number, number of files), which is (1, 0) if there are no volumes yet
+        """
+        volumes = self.getVolumes(basePath)
+        with self.lock:
+            if not volumes:
+                return 1, 0
+            volume = max(volumes)
+            return volume, len(volumes[volume])
+
+    def claim(self, basePath, volume, name, owner, size=None, partial=None):
+        """
+        Records that a photo is going to a volume, unless something is already there
+
+        owner:- the source of the photo
+        size:- its size in bytes, if it is known
+        partial:- its partialHash, if it is known
+        returns:- the owner of the file, which is an earlier owner if there was one
+        """
+        volumes = self.getVolumes(basePath)
+        with self.lock:
+            files = volumes.setdefault(volume, {})
+            if name not in files:
+                files[name] = owner
+                self.claimed[(basePath, volume, name)] = (size, partial)
+            return files[name]
+
+    def getOwner(self, basePath, volume, name):
+        """
+        Finds what is at, or going to, a place in the photos tree
+
+        returns:- ON_DISK, the source of the photo which claimed it, or None if nothing is there
+        """
+        volumes = self.getVolumes(basePath)
+        with self.lock:
+            return volumes.get(volume, {}).get(name)
+
+    def makeDirectory(self, basePath, volume):
+        """
+        Makes a volume's folder if it isn't already there, only asking the disk the first time
+
+        returns:- the path of the folder
+        """
+        directory = os.path.join(self.root, basePath, str(volume))
+        with self.lock:
+            if directory in self.directories:
+                return directory
+        os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            self.directories.add(directory)
+        return directory
@@ -0,0 +1,254 @@
+# pylint: disable=C0103
+"""
+Finds the photos below several input locations at once, walking each one on its own thread and
+handing the photos on as they are found
+"""
+import os
+import heapq
+import queue
+import threading
+import collections
+import concurrent.futures
+
+DEFAULT_QUEUE_SIZE = 256
+
+# put on a location's queue by mapPerInput once it has been given all of that location's things
+END_OF_INPUT = object()
+
+
+def isNefFile(path):
+    """
+    The default test for which files to import
+    """
+    return path.lower().endswith(".nef")
+
+
+def walkSorted(location, predicate=isNefFile):
+    """
+    Walks a folder with os.scandir, yielding the matching files in the order sorted() would put
+    their paths in. Entries in each folder are sorted with a '/' after folder names, which is what
+    makes walking the folders depth first give the same order as sorting the full paths.
+
+    location:- the folder to walk (or a single file)
+    predicate:- a function which is given each file's path, and returns whether to yield it
+    yields:- (path, os.stat_result) for each matching file
+    """
+    if not os.path.isdir(location):
+        if predicate(location):
+            yield location, os.stat(location)
+        return
+
+    with os.scandir(location) as iterator:
+        entries = [(entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name, entry) for entry in iterator]
+    entries.sort(key=lambda keyed: keyed[0])
+    for key, entry in entries:
+        if key.endswith('/'):
+            for found in walkSorted(entry.path, predicate):
+                yield found
+        elif predicate(entry.path) and entry.is_file():
+            yield entry.path, entry.stat()
+
+
+class Discovery:
+    """
+    Walks several input locations in parallel. Each location's files come out in sorted order, and
+    the locations are either merged into one sorted stream, or interleaved as they are found so that
+    several card readers can be read at once. In the interleaved case isExhausted tells a consumer
+    when it has seen every file from a location, which is what it needs to put them back in order
+    itself (see reorder).
+    """
+    def __init__(self, inputLocations, ordered=True, predicate=isNefFile, queueSize=DEFAULT_QUEUE_SIZE):
+        """
+        Starts walking the input locations
+
+        inputLocations:- a list of folders to search below
+        ordered:- whether to yield the files in sorted order, rather than as they are found
+        predicate:- a function which is given each file's path, and returns whether to yield it
+        queueSize:- how many found files each walker may get ahead of the consumer
+        """
+        self.inputLocations = list(inputLocations)
+        self.ordered = ordered
+        self.lock = threading.Lock()
+        self.counts = [0] * len(self.inputLocations)
+        self.finished = [False] * len(self.inputLocations)
+        if ordered:
+            self.queues = [queue.Queue(queueSize) for _ in self.inputLocations]
+        else:
+            self.queues = [queue.Queue(queueSize)] * len(self.inputLocations)
+        self.threads = []
+        for inputIndex, location in enumerate(self.inputLocations):
+            thread = threading.Thread(target=self.walk, args=(inputIndex, location, predicate), name="discover", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def walk(self, inputIndex, location, predicate):
+        """
+        Walks one input location, putting (inputIndex, path, stat) on its queue, followed by
+        (inputIndex, None, error or None) when it is done
+        """
+        error = None
+        try:
+            for path, stat in walkSorted(location, predicate):
+                self.queues[inputIndex].put((inputIndex, path, stat))
+                with self.lock:
+                    self.counts[inputIndex] += 1
+        except Exception as e: # pylint: disable=W0703
+            error = e
+        with self.lock:
+            self.finished[inputIndex] = True
+        self.queues[inputIndex].put((inputIndex, None, error))
+
+    def __iter__(self):
+        """
+        yields:- (inputIndex, path, os.stat_result) for each file found
+        """
+        if self.ordered:
+            streams = [self.drain(q, 1) for q in self.queues]
+            return heapq.merge(*streams, key=lambda found: found[1])
+        return self.drain(self.queues[0], len(self.inputLocations))
+
+    def drain(self, fromQueue, walkers):
+        """
+        Yields what is put on a queue until the given number of walkers have finished
+        """
+        while walkers > 0:
+            inputIndex, path, stat = fromQueue.get()
+            if path is None:
+                walkers -= 1
+                if stat is not None:
+                    raise stat
+                continue
+            yield inputIndex, path, stat
+
+    def isExhausted(self, inputIndex, seen):
+        """
+        Tells whether a location has finished being walked, and the consumer has seen all its files
+
+        inputIndex:- which of the input locations to check
+        seen:- how many of its files the consumer has seen
+        """
+        with self.lock:
+            return self.finished[inputIndex] and self.counts[inputIndex] == seen
+
+
+def reorder(items, discovery, key=lambda item: item.source, inputIndex=lambda item: item.inputIndex):
+    """
+    Puts things which came from an unordered Discovery back into sorted order, as early as it can.
+    Each location's things must still be in the order they were found. Something is only handed on
+    once every location which isn't exhausted has a later thing waiting.
+
+    items:- the things to reorder
+    discovery:- the Discovery they came from
+    key:- a function giving the path to sort each thing by
+    inputIndex:- a function giving which location each thing came from
+    yields:- the things in sorted order
+    """
+    waiting = [collections.deque() for _ in discovery.inputLocations]
+    seen = [0] * len(waiting)
+
+    def ready(flush):
+        while True:
+            heads = []
+            for index, pending in enumerate(waiting):
+                if pending:
+                    heads.append((key(pending[0]), index))
+                elif not flush and not discovery.isExhausted(index, seen[index]):
+                    return
+            if not heads:
+                return
+            _, index = min(heads)
+            yield waiting[index].popleft()
+
+    for item in items:
+        index = inputIndex(item)
+        waiting[index].append(item)
+        seen[index] += 1
+        for readyItem in ready(False):
+            yield readyItem
+    for readyItem in ready(True):
+        yield readyItem
+
+
+def mapPerInput(items, discovery, function, readAhead=None, jobsPerInput=1, key=lambda item: item.source,
+                inputIndex=lambda item: item.inputIndex):
+    """
+    Runs a function over things which came from an unordered Discovery, on threads of their own for
+    each location, so that several card readers are read at once, and hands the results on in sorted
+    order. Each location's things must still be in the order they were found. A location may only
+    have readAhead results waiting to be handed on (or being worked out), so that when the results
+    are heavy (eg photos read into memory) the memory they take stays bounded; a location which sorts
+    after another then only gets that far ahead of it.
+
+    items:- the things to map
+    discovery:- the Discovery they came from
+    function:- a function taking a thing and returning its result; it is run on the threads of the
+        thing's location
+    readAhead:- how many results each location may have waiting, or None for no limit
+    jobsPerInput:- how many threads each location has
+    key:- a function giving the path to sort each thing by
+    inputIndex:- a function giving which location each thing came from
+    yields:- the result of function for each thing, in sorted order
+    """
+    inputs = len(discovery.inputLocations)
+    pending = [queue.Queue() for _ in range(inputs)]
+    results = [queue.Queue() for _ in range(inputs)]
+    slots = [threading.BoundedSemaphore(readAhead) if readAhead is not None else None for _ in range(inputs)]
+    executors = [concurrent.futures.ThreadPoolExecutor(max_workers=jobsPerInput) for _ in range(inputs)]
+    errors = []
+
+    def dispatch():
+        # hands each thing to its location's queue; the things themselves are light, so this never blocks
+        try:
+            for item in items:
+                pending[inputIndex(item)].put(item)
+        except BaseException as e: # pylint: disable=W0703
+            errors.append(e)
+        for index in range(inputs):
+            pending[index].put(END_OF_INPUT)
+
+    def feed(index):
+        # starts the work for one location, waiting for room in its read-ahead first
+        while True:
+            item = pending[index].get()
+            if item is END_OF_INPUT:
+                results[index].put(END_OF_INPUT)
+                return
+            if slots[index] is not None:
+                slots[index].acquire()
+            try:
+                future = executors[index].submit(function, item)
+            except RuntimeError:
+                # the consumer has stopped, and shut the executors down
+                return
+            results[index].put((item, future))
+
+    threads = [threading.Thread(target=dispatch, name="dispatch", daemon=True)]
+    threads += [threading.Thread(target=feed, args=(index,), name="read-ahead", daemon=True) for index in range(inputs)]
+    for thread in threads:
+        thread.start()
+    try:
+        heads = [None] * inputs
+        finished = [False] * inputs
+        while True:
+            for index in range(inputs):
+                if heads[index] is None and not finished[index]:
+                    head = results[index].get()
+                    if head is END_OF_INPUT:
+                        finished[index] = True
+                    else:
+                        heads[index] = head
+            waiting = [(key(head[0]), index) for index, head in enumerate(heads) if head is not None]
+            if not waiting:
+                break
+            _, index = min(waiting)
+            _, future = heads[index]
+            heads[index] = None
+            result = future.result()
+            if slots[index] is not None:
+                slots[index].release()
+            yield result
+        if errors:
+            raise errors[0]
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
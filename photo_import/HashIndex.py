@@ -0,0 +1,231 @@
+# pylint: disable=C0103
+"""
+A persistent index of the content hashes of every photo in the photos tree, so that a photo which
+has already been imported is recognised whatever it is called and whichever volume it is in
+"""
+import os
+import sqlite3
+import hashlib
+import threading
+import concurrent.futures
+
+from .Discovery import walkSorted, isNefFile
+
+HASH_INDEX_NAME = ".photo-import-hashes.sqlite"
+
+# how much of each end of a file goes into its partial hash
+PARTIAL_HASH_BYTES = 64 * 1024
+FULL_HASH_CHUNK = 1024 * 1024
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS files (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime INTEGER NOT NULL,
+        partialHash TEXT NOT NULL,
+        fullHash TEXT)""",
+    "CREATE INDEX IF NOT EXISTS filesByPartialHash ON files (size, partialHash)"
+]
+
+
+def partialHash(path, size, data=None):
+    """
+    Hashes the size and the first and last PARTIAL_HASH_BYTES of a file. Two files with different
+    partial hashes are certainly different; two with the same one are probably the same.
+
+    path:- the file to hash
+    size:- its size in bytes
+    data:- its contents, if they have already been read
+    returns:- a hex digest
+    """
+    digest = hashlib.blake2b(size.to_bytes(8, 'little'), digest_size=16)
+    if data is not None:
+        digest.update(data[:PARTIAL_HASH_BYTES])
+        if size > PARTIAL_HASH_BYTES:
+            digest.update(data[max(PARTIAL_HASH_BYTES, size - PARTIAL_HASH_BYTES):])
+        return digest.hexdigest()
+    with open(path, 'rb') as hashFile:
+        digest.update(hashFile.read(PARTIAL_HASH_BYTES))
+        if size > PARTIAL_HASH_BYTES:
+            hashFile.seek(max(PARTIAL_HASH_BYTES, size - PARTIAL_HASH_BYTES))
+            digest.update(hashFile.read(PARTIAL_HASH_BYTES))
+    return digest.hexdigest()
+
+
+def fullHash(path, data=None):
+    """
+    Hashes the whole of a file
+
+    path:- the file to hash
+    data:- its contents, if they have already been read
+    returns:- a hex digest
+    """
+    if data is not None:
+        return hashlib.blake2b(data).hexdigest()
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as hashFile:
+        for chunk in iter(lambda: hashFile.read(FULL_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashIndex:
+    """
+    An SQLite backed index of <path, size, partial hash, full hash> for the photos under a root
+    folder. Looking a file up costs one indexed query on its size and partial hash, so it doesn't
+    get slower as the archive grows; full hashes are only worked out (and then kept) when two files'
+    partial hashes match. It may be shared between threads.
+    """
+    def __init__(self, indexPath, root):
+        """
+        Opens (creating if needed) the index at the given path
+
+        indexPath:- the SQLite file to keep the index in
+        root:- the folder the indexed photos are under; paths are stored relative to it
+        """
+        self.root = root
+        self.lock = threading.RLock()
+        self.reserved = {}
+        directory = os.path.dirname(indexPath)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(indexPath, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def build(self, jobs=4):
+        """
+        Brings the index up to date with the photos tree, hashing new and changed files on a pool of
+        threads and forgetting files which are gone. Hidden files and folders (eg the import's own
+        staging folder) are skipped.
+
+        jobs:- the number of files to hash at once
+        returns:- the number of files which were hashed
+        """
+        def visible(path):
+            relative = os.path.relpath(path, self.root)
+            return isNefFile(path) and not any(part.startswith('.') for part in relative.split(os.sep))
+
+        with self.lock:
+            known = dict((row[0], (row[1], row[2])) for row in self.connection.execute("SELECT path, size, mtime FROM files"))
+        changed = []
+        for path, stat in walkSorted(self.root, visible):
+            relative = os.path.relpath(path, self.root)
+            if known.pop(relative, None) != (stat.st_size, stat.st_mtime_ns):
+                changed.append((relative, stat))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            hashes = executor.map(lambda found: partialHash(os.path.join(self.root, found[0]), found[1].st_size), changed)
+            for (relative, stat), partial in zip(changed, hashes):
+                self.put(relative, stat.st_size, stat.st_mtime_ns, partial)
+
+        with self.lock:
+            self.connection.executemany("DELETE FROM files WHERE path = ?", [(relative,) for relative in known])
+            self.connection.commit()
+        return len(changed)
+
+    def findDuplicate(self, path, size, partial, data=None):
+        """
+        Looks for a photo with the same contents as a file, either in the photos tree or among the
+        files reserved by this import
+
+        path:- the file to look for
+        size:- its size in bytes
+        partial:- its partialHash
+        data:- its contents, if they have already been read
+        returns:- the path of the duplicate in the photos tree (or, for a duplicate of a file reserved
+            by this import, the path that file is being imported from), or None if there isn't one
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT path, mtime, fullHash FROM files WHERE size = ? AND partialHash = ?", (size, partial)).fetchall()
+            reserved = list(self.reserved.get((size, partial), []))
+        if not rows and not reserved:
+            return None
+
+        full = fullHash(path, data)
+        for relative, mtime, candidateHash in rows:
+            candidate = os.path.join(self.root, relative)
+            try:
+                stat = os.stat(candidate)
+            except FileNotFoundError:
+                self.forget(relative)
+                continue
+            if stat.st_size != size or stat.st_mtime_ns != mtime:
+                self.forget(relative)
+                continue
+            if candidateHash is None:
+                candidateHash = fullHash(candidate)
+                with self.lock:
+                    self.connection.execute("UPDATE files SET fullHash = ? WHERE path = ?", (candidateHash, relative))
+            if candidateHash == full:
+                return candidate
+        for source in reserved:
+            if fullHash(source) == full:
+                return source
+        return None
+
+    def reserve(self, source, size, partial):
+        """
+        Notes a file which this import is about to copy, so a later file with the same contents is
+        recognised as a duplicate before it has even been given a destination
+
+        source:- the file being imported
+        size:- its size in bytes
+        partial:- its partialHash
+        """
+        with self.lock:
+            self.reserved.setdefault((size, partial), []).append(source)
+
+    def add(self, path, partial, full=None):
+        """
+        Indexes a file which has been copied into the photos tree
+
+        path:- the file, under the root
+        partial:- its partialHash
+        full:- its fullHash, if it is known
+        """
+        stat = os.stat(path)
+        self.put(os.path.relpath(path, self.root), stat.st_size, stat.st_mtime_ns, partial, full)
+
+    def put(self, relative, size, mtime, partial, full=None):
+        """
+        Stores the hashes of a file, given its path relative to the root
+        """
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime, partialHash, fullHash) VALUES (?, ?, ?, ?, ?)",
+                (relative, size, mtime, partial, full))
+
+    def forget(self, relative):
+        """
+        Removes a file, given its path relative to the root, from the index
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM files WHERE path = ?", (relative,))
+
+    def clear(self):
+        """
+        Forgets every file, so the next build hashes the whole photos tree again
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM files")
+            self.connection.commit()
+
+    def commit(self):
+        """
+        Writes any outstanding changes to disk
+        """
+        with self.lock:
+            self.connection.commit()
+
+    def close(self):
+        """
+        Commits and closes the index
+        """
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
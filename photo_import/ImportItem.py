@@ -0,0 +1,63 @@
+# pylint: disable=C0103
+"""
+The record that follows one photo through the import pipeline
+"""
+from .Journal import STATES
+
+# the fields of an item which are recorded in the journal, and restored from it
+JOURNAL_FIELDS = ['size', 'mtime', 'afPointIndex', 'sharpness', 'bucket', 'basePath', 'volume', 'destination', 'duplicateOf']
+
+
+class ImportItem:
+    """
+    One photo being imported. Each stage of the pipeline fills in more of it.
+    """
+    def __init__(self, source, inputIndex=0, stat=None):
+        """
+        Constructs a record for a photo which has just been found
+
+        source:- the path of the photo
+        inputIndex:- which of the input locations it was found under
+        stat:- its os.stat_result, if the caller already has it
+        """
+        self.source = source
+        self.inputIndex = inputIndex
+        self.readPath = source
+        self.stagedPath = None
+        self.data = None
+        self.size = stat.st_size if stat is not None else None
+        self.mtime = stat.st_mtime_ns if stat is not None else None
+        self.state = None
+        self.metadata = None
+        self.afPointIndex = None
+        self.features = None
+        self.sharpness = None
+        self.bucket = None
+        self.basePath = None
+        self.volume = None
+        self.destination = None
+        self.partialHash = None
+        self.duplicateOf = None
+        self.copied = None
+
+    def restore(self, entry):
+        """
+        Picks up from what an earlier, interrupted import recorded about this photo
+
+        entry:- the fields returned by Journal.lookup
+        """
+        self.state = entry['state']
+        for field in JOURNAL_FIELDS:
+            if field in entry:
+                setattr(self, field, entry[field])
+
+    def reached(self, state):
+        """
+        Tells whether an earlier import already got this photo as far as a state
+
+        state:- one of the journal's STATES
+        """
+        return self.state is not None and STATES.index(self.state) >= STATES.index(state)
+
+    def __repr__(self):
+        return "ImportItem(%r, bucket=%r, destination=%r)" % (self.source, self.bucket, self.destination)
@@ -0,0 +1,90 @@
+# pylint: disable=C0103
+"""
+A file describing where every photo of an import will go, so that deciding (which may mean scoring
+every photo) and copying can be run separately, and the decisions can be looked at in between
+"""
+import os
+import json
+
+from .ImportItem import ImportItem
+
+PLAN_VERSION = 1
+
+# the fields of an item which are written to the plan
+PLAN_FIELDS = ['source', 'size', 'mtime', 'bucket', 'sharpness', 'basePath', 'volume', 'partialHash', 'duplicateOf']
+
+
+class PlanWriter:
+    """
+    Writes an import plan as a json lines file: a header with the settings the plan was made with,
+    then one line per photo with its source, size, bucket, the volume it goes in and what is known
+    about its contents. The destination is given relative to the out folder, so the plan can be
+    carried out into a copy of the photos tree somewhere else. The plan is written to a temporary
+    file and only renamed into place once it is complete.
+    """
+    def __init__(self, path, options):
+        """
+        Starts writing a plan
+
+        path:- the plan file
+        options:- a dictionary of the settings the plan was made with
+        """
+        self.path = path
+        self.partialPath = path + ".partial"
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.partialPath, 'w')
+        self.count = 0
+        self.file.write(json.dumps({'version': PLAN_VERSION, 'options': options}) + "\n")
+
+    def write(self, item):
+        """
+        Writes the plan for one photo
+
+        item:- an ImportItem with its destination (or, for a duplicate, duplicateOf) filled in
+        """
+        entry = dict((field, getattr(item, field)) for field in PLAN_FIELDS if getattr(item, field) is not None)
+        # so the plan can be carried out from anywhere
+        entry['source'] = os.path.abspath(item.source)
+        if item.destination is not None:
+            entry['name'] = os.path.basename(item.destination)
+        self.file.write(json.dumps(entry) + "\n")
+        self.count += 1
+
+    def close(self, finished=True):
+        """
+        Closes the plan
+
+        finished:- whether every photo was planned; an unfinished plan is thrown away
+        """
+        self.file.close()
+        if finished:
+            os.replace(self.partialPath, self.path)
+        else:
+            os.remove(self.partialPath)
+
+
+def readPlan(path, out):
+    """
+    Reads a plan back
+
+    path:- the plan file
+    out:- the base out path to carry the plan out into
+    returns:- (the options the plan was made with, a list of ImportItems with their destinations
+        filled in, other than for duplicates)
+    """
+    with open(path) as planFile:
+        header = json.loads(planFile.readline())
+        if header.get('version') != PLAN_VERSION:
+            raise ValueError("%s is a version %s plan, but only version %d plans can be read" % (path, header.get('version'), PLAN_VERSION))
+        items = []
+        for line in planFile:
+            entry = json.loads(line)
+            item = ImportItem(entry['source'])
+            for field in PLAN_FIELDS:
+                setattr(item, field, entry.get(field))
+            if item.duplicateOf is None:
+                item.destination = os.path.join(out, item.basePath, str(item.volume), entry['name'])
+            items.append(item)
+    return header['options'], items
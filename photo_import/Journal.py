@@ -0,0 +1,133 @@
+# pylint: disable=C0103
+"""
+An append-only record of how far each photo has got through an import, so an interrupted import can
+pick up where it stopped
+"""
+import os
+import json
+import threading
+
+JOURNAL_NAME = ".photo-import-journal.jsonl"
+
+# the states a photo passes through, in order
+STATES = ['scanned', 'scored', 'planned', 'copied', 'verified']
+
+
+class Journal:
+    """
+    A json lines file with one record per state change of a photo. Records are only ever appended,
+    and a record which was cut short by a crash is ignored when the journal is read back, so the
+    journal always describes a state the import really reached. Records about copies are fsynced.
+    """
+    def __init__(self, path, options, resume=True):
+        """
+        Opens a journal, reading back what an earlier import recorded in it
+
+        path:- the journal file
+        options:- a dictionary of the settings which affect where photos end up (eg whether they are
+            sorted by sharpness); an existing journal written with different options isn't resumed
+        resume:- whether to pick up from an existing journal, rather than starting a new one
+        """
+        self.path = path
+        self.options = options
+        self.lock = threading.Lock()
+        self.entries = {}
+        if resume and os.path.exists(path):
+            self.entries = readJournal(path, options)
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'w' if not self.entries else 'a')
+        if not self.entries:
+            self.write({'options': options}, True)
+
+    def lookup(self, source, size, mtime):
+        """
+        Finds what an earlier import recorded about a photo
+
+        source:- the path of the photo
+        size, mtime:- the size and modification time (in ns) the photo has now; an entry recorded
+            for a different version of the file is ignored
+        returns:- a dictionary of the recorded fields including 'state', or None
+        """
+        entry = self.entries.get(source)
+        if entry is None or entry.get('size') != size or entry.get('mtime') != mtime:
+            return None
+        return entry
+
+    def record(self, source, state, sync=False, **fields):
+        """
+        Appends a state change for a photo
+
+        source:- the path of the photo
+        state:- one of STATES
+        sync:- whether to fsync the journal after writing the record
+        fields:- anything else to record about the photo in this state
+        """
+        record = {'source': source, 'state': state}
+        record.update(fields)
+        self.write(record, sync)
+
+    def write(self, record, sync):
+        """
+        Appends one record as a single line
+        """
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+
+    def close(self, finished=False):
+        """
+        Closes the journal
+
+        finished:- whether the import completed; a finished import has nothing to resume, so its
+            journal is removed
+        """
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+        if finished:
+            os.remove(self.path)
+
+
+def readJournal(path, options):
+    """
+    Reads a journal back into the latest fields recorded for each photo. A record cut short by a
+    crash is cut off the end of the file, so that new records can be appended after it.
+
+    path:- the journal file
+    options:- the options of the current import
+    returns:- a dictionary of <source, fields>, which is empty if the journal was written with
+        different options
+    """
+    entries = {}
+    goodLength = 0
+    with open(path, 'rb') as journalFile:
+        for number, line in enumerate(journalFile):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("incomplete record")
+                record = json.loads(line)
+            except ValueError:
+                # a record cut short by a crash can only be the last one
+                break
+            goodLength += len(line)
+            if number == 0:
+                if record.get('options') != options:
+                    print("Not resuming from", path, "because it was written with different options")
+                    return {}
+                continue
+            source = record.pop('source')
+            entry = entries.setdefault(source, {'state': STATES[0]})
+            state = record.pop('state')
+            if STATES.index(state) > STATES.index(entry['state']):
+                entry['state'] = state
+            entry.update(record)
+    if goodLength < os.path.getsize(path):
+        os.truncate(path, goodLength)
+    return entries
+
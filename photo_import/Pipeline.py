@@ -0,0 +1,240 @@
+# pylint: disable=C0103
+"""
+Runs work as a chain of stages, each on its own thread, joined by bounded queues, so that every stage
+works on the early files while the stages before it are still working on the later ones
+"""
+import queue
+import threading
+import collections
+import concurrent.futures
+
+from .Profiling import measureCall
+
+DEFAULT_QUEUE_SIZE = 16
+
+# the ways of reading each photo off the card only once; see add_pipeline_arguments
+READ_ONCE_MODES = ['buffer', 'copy-first']
+
+# how long a blocked stage waits before checking whether the pipeline has been stopped
+POLL_INTERVAL = 0.1
+
+END = object()
+
+
+class PipelineStopped(Exception):
+    """
+    Raised inside a stage when another stage has failed, to unwind its thread
+    """
+
+
+class Pipeline:
+    """
+    A chain of stages. Each stage is a function which takes an iterator of items and returns an
+    iterator of items, so a stage may hold state across items (eg carry something over from one file
+    to the next), and may yield more or fewer items than it is given. Items keep their order unless a
+    stage reorders them itself.
+    """
+    def __init__(self, queueSize=DEFAULT_QUEUE_SIZE, profiler=None, progress=None):
+        """
+        Constructs an empty pipeline
+
+        queueSize:- how many items may wait between one stage and the next; a fast stage blocks when
+            the queue after it is full, so memory use doesn't grow with the number of files
+        profiler:- a Profiler to measure each stage with, or None
+        progress:- a Progress to count the items coming out of each stage in, or None
+        """
+        self.queueSize = queueSize
+        self.profiler = profiler
+        self.progress = progress
+        self.stages = []
+        self.stopped = threading.Event()
+        self.errors = []
+
+    def addStage(self, name, stage):
+        """
+        Appends a stage to the pipeline
+
+        name:- what to call the stage's thread
+        stage:- a function taking an iterator of items and returning an iterator of items
+        returns:- the pipeline, so calls can be chained
+        """
+        if self.profiler is not None:
+            stage = self.profiler.profileStage(name, stage)
+        if self.progress is not None:
+            stage = self.progress.countStage(name, stage)
+        self.stages.append((name, stage))
+        return self
+
+    def run(self, source):
+        """
+        Pushes items through the stages
+
+        source:- an iterable of items for the first stage; it is consumed on its own thread
+        yields:- what the last stage yields, as soon as it yields it. The first error raised by any
+            stage is raised here once the pipeline has wound down.
+        """
+        self.stopped.clear()
+        self.errors = []
+        queues = [queue.Queue(self.queueSize) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self.feed, args=(source, queues[0]), name="feed", daemon=True)]
+        for i, (name, stage) in enumerate(self.stages):
+            threads.append(threading.Thread(target=self.runStage, args=(stage, queues[i], queues[i + 1]), name=name, daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            for item in self.drain(queues[-1]):
+                yield item
+        except PipelineStopped:
+            pass
+        finally:
+            self.stopped.set()
+            for thread in threads:
+                thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+    def feed(self, source, output):
+        """
+        Puts the items of the source onto the first queue
+        """
+        try:
+            for item in source:
+                self.put(output, item)
+            self.put(output, END)
+        except PipelineStopped:
+            pass
+        except BaseException as e: # pylint: disable=W0703
+            self.fail(e)
+
+    def runStage(self, stage, inputQueue, output):
+        """
+        Runs one stage over the items on its input queue, putting what it yields on its output queue
+        """
+        try:
+            for item in stage(self.drain(inputQueue)):
+                self.put(output, item)
+            self.put(output, END)
+        except PipelineStopped:
+            pass
+        except BaseException as e: # pylint: disable=W0703
+            self.fail(e)
+
+    def fail(self, error):
+        """
+        Records a stage's error and tells every other stage to stop
+        """
+        self.errors.append(error)
+        self.stopped.set()
+
+    def put(self, output, item):
+        """
+        Puts an item on a queue, waiting for room unless the pipeline is stopped
+        """
+        while True:
+            if self.stopped.is_set():
+                raise PipelineStopped()
+            try:
+                output.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def drain(self, inputQueue):
+        """
+        Yields the items on a queue until the end marker, unless the pipeline is stopped
+        """
+        while True:
+            if self.stopped.is_set():
+                raise PipelineStopped()
+            try:
+                item = inputQueue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if item is END:
+                return
+            yield item
+
+
+class OrderedWindow:
+    """
+    Keeps up to a fixed number of calls in flight on an executor, and hands their results back in the
+    order the calls were made. Used by stages which farm slow per-file work out to worker processes
+    but must still see the files in order.
+    """
+    def __init__(self, executor, size, profiler=None, name=None):
+        """
+        Constructs a window
+
+        executor:- a concurrent.futures executor to run the calls on, or None to run them in the
+            calling thread
+        size:- how many calls may be in flight at once
+        profiler:- a Profiler to measure each call with, where it runs, or None
+        name:- what to call the calls in the profile
+        """
+        self.executor = executor
+        self.size = max(1, size)
+        self.profiler = profiler
+        self.name = name
+        self.pending = collections.deque()
+
+    def submit(self, item, function, *args):
+        """
+        Starts a call
+
+        item:- something to hand back alongside the result
+        function:- a module level function, if the executor is a process pool
+        args:- the arguments to call it with
+        """
+        measured = self.profiler is not None
+        if measured:
+            function, args = measureCall, (function, args, self.profiler.getCallProfilePath(self.name))
+        if self.executor is None:
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(function(*args))
+            except Exception as e: # pylint: disable=W0703
+                future.set_exception(e)
+        else:
+            future = self.executor.submit(function, *args)
+        self.pending.append((item, future, measured))
+
+    def put(self, item, result):
+        """
+        Adds a result which is already known, so that it is handed back in its place in the order
+        """
+        future = concurrent.futures.Future()
+        future.set_result(result)
+        self.pending.append((item, future, False))
+
+    def putFuture(self, item, future):
+        """
+        Adds a call which was started elsewhere (eg on a CopyEngine), so that its result is handed
+        back in its place in the order
+        """
+        self.pending.append((item, future, False))
+
+    def popFull(self):
+        """
+        Yields (item, result) pairs in order until there is room in the window for another call
+        """
+        while len(self.pending) >= self.size:
+            yield self.popLeft()
+
+    def popAll(self):
+        """
+        Yields every remaining (item, result) pair in order
+        """
+        while self.pending:
+            yield self.popLeft()
+
+    def popLeft(self):
+        """
+        Waits for the oldest call and returns its (item, result)
+        """
+        item, future, measured = self.pending.popleft()
+        if not measured:
+            return item, future.result()
+        result, metrics = future.result()
+        self.profiler.recordCall(item, self.name, metrics)
+        return item, result
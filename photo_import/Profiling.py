@@ -0,0 +1,358 @@
+# pylint: disable=C0103
+"""
+Measures where the time, CPU, I/O and memory of an import go, per pipeline stage and per photo, and
+writes it out as a report at the end
+"""
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import pstats
+import cProfile
+import threading
+import multiprocessing.util
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PROFILE_NAME = "profile.json"
+FILES_NAME = "profile-files.csv"
+CALL_PROFILE_NAME = "%s.prof"
+
+# the measurements of each call written to profile-files.csv
+CALL_FIELDS = ['wall', 'cpu', 'bytesRead', 'bytesWritten', 'peakRss']
+
+# the cProfile of the calls made in each process, with the finalizer which dumps it when the process
+# exits, by (process id, dump path) when the calls of a stage are being profiled; keyed by process id so
+# that a forked worker doesn't carry on its parent's profile
+workerProfiles = {}
+
+
+def readThreadIo():
+    """
+    Reads how many bytes the calling thread has read and written, which is only known on Linux
+
+    returns:- (bytes read, bytes written, bytes read to find out), or None if it isn't known
+    """
+    try:
+        with open("/proc/thread-self/io") as ioFile:
+            text = ioFile.read()
+        counters = dict(line.split(": ") for line in text.splitlines())
+    except (OSError, ValueError):
+        return None
+    return int(counters['rchar']), int(counters['wchar']), len(text)
+
+
+def getThreadIoSince(ioBefore):
+    """
+    Works out how many bytes the calling thread has read and written since readThreadIo was called,
+    leaving out the read of /proc itself
+
+    ioBefore:- what readThreadIo returned, or None
+    returns:- (bytes read, bytes written), or None if it isn't known
+    """
+    ioAfter = readThreadIo()
+    if ioBefore is None or ioAfter is None:
+        return None
+    return ioAfter[0] - ioBefore[0] - ioBefore[2], ioAfter[1] - ioBefore[1]
+
+
+def getWorkerProfile(profilePath):
+    """
+    Gets the cProfile of the calls made in this process, starting it (and arranging for it to be
+    dumped once, when the process exits) if this process hasn't made any yet
+
+    profilePath:- a path with a %d in it for the process id, to dump the profile to
+    returns:- a cProfile.Profile
+    """
+    key = (os.getpid(), profilePath)
+    if key not in workerProfiles:
+        profile = cProfile.Profile()
+        # a Finalize rather than atexit, since worker processes leave with os._exit
+        finalizer = multiprocessing.util.Finalize(None, profile.dump_stats, args=(profilePath % os.getpid(),), exitpriority=10)
+        workerProfiles[key] = (profile, finalizer)
+    return workerProfiles[key][0]
+
+
+def dumpProfiles():
+    """
+    Dumps the cProfiles of the calls made in this process now, rather than when it exits, for when
+    the calls were made in the importer itself
+    """
+    for key in [key for key in workerProfiles if key[0] == os.getpid()]:
+        _, finalizer = workerProfiles.pop(key)
+        finalizer()
+
+
+def getPeakRss(who=None):
+    """
+    Gets the most memory the process (or its finished children) has had resident
+
+    who:- resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN; RUSAGE_SELF if None
+    returns:- the peak resident set size in bytes, or None if it isn't known
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in KB everywhere else
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def measureCall(function, args, profilePath=None):
+    """
+    Runs a call and measures it where it runs, which is in a worker process for the calls a stage
+    farms out
+
+    function:- the function to call
+    args:- a tuple of the arguments to call it with
+    profilePath:- a path with a %d in it for the process id, to keep a cProfile of every call made in
+        this process in, or None
+    returns:- (the result, a dictionary of measurements)
+    """
+    profile = getWorkerProfile(profilePath) if profilePath is not None else None
+    ioBefore = readThreadIo()
+    startWall = time.perf_counter()
+    startCpu = time.thread_time()
+    if profile is not None:
+        profile.enable()
+        try:
+            result = function(*args)
+        finally:
+            profile.disable()
+    else:
+        result = function(*args)
+    metrics = {
+        'wall': time.perf_counter() - startWall,
+        'cpu': time.thread_time() - startCpu,
+        'peakRss': getPeakRss()
+    }
+    io = getThreadIoSince(ioBefore)
+    if io is not None:
+        metrics['bytesRead'], metrics['bytesWritten'] = io
+    return result, metrics
+
+
+class StageStats:
+    """
+    The time a stage spent working, as opposed to waiting for the stage before it or for room in the
+    queue after it. Only touched by the stage's own thread until the stage has finished.
+    """
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.items = 0
+        self.bytesRead = None
+        self.bytesWritten = None
+        self.peakRss = None
+        self.startWall = None
+        self.startCpu = None
+
+    def resume(self):
+        """
+        Starts counting time as working
+        """
+        self.startWall = time.perf_counter()
+        self.startCpu = time.thread_time()
+
+    def pause(self):
+        """
+        Stops counting time as working
+        """
+        self.wall += time.perf_counter() - self.startWall
+        self.cpu += time.thread_time() - self.startCpu
+
+    def toDict(self):
+        """
+        Returns the stats as a dictionary which can be serialised to json
+        """
+        return {'wall': self.wall, 'cpu': self.cpu, 'items': self.items, 'bytesRead': self.bytesRead, 'bytesWritten': self.bytesWritten,
+                'peakRss': self.peakRss}
+
+
+class Profiler:
+    """
+    Collects measurements of an import: how long each pipeline stage spent working, with its CPU
+    time and the bytes its thread read and wrote; how long each photo spent in each stage; and, for
+    the calls stages farm out to workers, what each call cost where it ran. Optionally keeps a
+    cProfile of the calls of some stages.
+    """
+    def __init__(self, directory, profiledCalls=()):
+        """
+        Constructs a profiler with nothing measured
+
+        directory:- the folder to write the report (and any cProfile dumps) to
+        profiledCalls:- the names of the calls (eg 'score') to keep a cProfile of
+        """
+        self.directory = directory
+        self.profiledCalls = set(profiledCalls)
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.files = {}
+        self.startWall = time.perf_counter()
+        self.startCpu = time.process_time()
+        os.makedirs(directory, exist_ok=True)
+        for name in self.profiledCalls:
+            for path in glob.glob(os.path.join(directory, CALL_PROFILE_NAME % (name + "-*"))):
+                os.remove(path)
+
+    def profileStage(self, name, stage):
+        """
+        Wraps a pipeline stage so that its working time, and the time each photo spends in it, are
+        measured
+
+        name:- the name of the stage
+        stage:- a function taking an iterator of items and returning an iterator of items
+        returns:- a function which does the same
+        """
+        def profiled(items):
+            stats = StageStats()
+            with self.lock:
+                self.stages[name] = stats
+            ioBefore = readThreadIo()
+
+            def inputs():
+                iterator = iter(items)
+                while True:
+                    stats.pause()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        stats.resume()
+                    self.getFile(item)['entered'][name] = time.perf_counter()
+                    yield item
+
+            stats.resume()
+            for item in stage(inputs()):
+                stats.items += 1
+                measured = self.getFile(item)
+                now = time.perf_counter()
+                measured['stages'][name] = now - measured['entered'].pop(name, now)
+                stats.pause()
+                yield item
+                stats.resume()
+            stats.pause()
+
+            io = getThreadIoSince(ioBefore)
+            if io is not None:
+                stats.bytesRead, stats.bytesWritten = io
+            stats.peakRss = getPeakRss()
+        return profiled
+
+    def getFile(self, item):
+        """
+        Gets the measurements of one photo, starting them if it hasn't been seen before
+
+        item:- the photo's ImportItem
+        """
+        with self.lock:
+            return self.files.setdefault(item.source, {'entered': {}, 'stages': {}, 'calls': {}})
+
+    def getCallProfilePath(self, name):
+        """
+        Gets where the calls of a stage should keep their cProfile
+
+        name:- the name of the calls
+        returns:- a path with a %d in it for the process id, or None if they aren't being profiled
+        """
+        if name not in self.profiledCalls:
+            return None
+        return os.path.join(self.directory, CALL_PROFILE_NAME % (name + "-%d"))
+
+    def recordCall(self, item, name, metrics):
+        """
+        Stores the measurements of a call made for a photo
+
+        item:- the photo's ImportItem, or a tuple starting with it (as stages hand them to an
+            OrderedWindow)
+        name:- the name of the calls
+        metrics:- the dictionary returned by measureCall
+        """
+        if isinstance(item, tuple):
+            item = item[0]
+        self.getFile(item)['calls'][name] = metrics
+
+    def watchCopies(self, copyEngine):
+        """
+        Measures the copies a CopyEngine makes for each photo, since they run on its own threads
+        rather than in a stage's
+
+        copyEngine:- the CopyEngine the photos are copied with
+        """
+        copyEngine.measureCopies(self.recordCall)
+
+    def getCallTotals(self):
+        """
+        Adds up the measurements of each kind of call over every photo
+
+        returns:- a dictionary of the totals (files, wall, cpu, bytesRead, bytesWritten) by call name,
+            with the largest peakRss of the processes the calls ran in
+        """
+        totals = {}
+        with self.lock:
+            for measured in self.files.values():
+                for name, call in measured['calls'].items():
+                    total = totals.setdefault(name, {'files': 0, 'wall': 0.0, 'cpu': 0.0, 'bytesRead': None, 'bytesWritten': None, 'peakRss': None})
+                    total['files'] += 1
+                    for field in ['wall', 'cpu', 'bytesRead', 'bytesWritten']:
+                        if call.get(field) is not None:
+                            total[field] = (total[field] or 0) + call[field]
+                    if call.get('peakRss') is not None:
+                        total['peakRss'] = max(total['peakRss'] or 0, call['peakRss'])
+        return totals
+
+    def writeReport(self, items, copyEngine=None):
+        """
+        Writes the report: profile.json with the totals and each stage, profile-files.csv with a row
+        per photo, and a merged cProfile dump for each kind of call that was profiled
+
+        items:- the ImportItems of the import
+        copyEngine:- the CopyEngine the photos were copied with, or None
+        returns:- the path of the json report
+        """
+        report = {
+            'wall': time.perf_counter() - self.startWall,
+            'cpu': time.process_time() - self.startCpu,
+            'peakRss': getPeakRss(),
+            'peakRssOfWorkers': getPeakRss(resource.RUSAGE_CHILDREN) if resource is not None else None,
+            'files': len(items),
+            'stages': dict((name, stats.toDict()) for name, stats in self.stages.items()),
+            'calls': self.getCallTotals()
+        }
+        if copyEngine is not None:
+            report['copy'] = {'files': copyEngine.filesCopied, 'bytes': copyEngine.bytesCopied}
+        # the calls made in worker processes were dumped as the workers exited
+        dumpProfiles()
+        for name in self.profiledCalls:
+            dumps = glob.glob(os.path.join(self.directory, CALL_PROFILE_NAME % (name + "-*")))
+            if dumps:
+                pstats.Stats(*dumps).dump_stats(os.path.join(self.directory, CALL_PROFILE_NAME % name))
+                for path in dumps:
+                    os.remove(path)
+                report.setdefault('cProfile', {})[name] = CALL_PROFILE_NAME % name
+
+        stageNames = list(self.stages)
+        callNames = sorted(set(name for measured in self.files.values() for name in measured['calls']))
+        with open(os.path.join(self.directory, FILES_NAME), 'w', newline='') as filesFile:
+            w = csv.writer(filesFile)
+            w.writerow(['source', 'size', 'copied'] + ["%s.seconds" % name for name in stageNames] +
+                       ["%s.%s" % (name, field) for name in callNames for field in CALL_FIELDS])
+            for item in items:
+                measured = self.files.get(item.source, {'stages': {}, 'calls': {}})
+                copied = item.copied is not None and item.copied.done() and not item.copied.cancelled() and item.copied.exception() is None
+                row = [item.source, item.size, item.size if copied else 0]
+                row += [measured['stages'].get(name) for name in stageNames]
+                for name in callNames:
+                    call = measured['calls'].get(name, {})
+                    row += [call.get(field) for field in CALL_FIELDS]
+                w.writerow(row)
+
+        path = os.path.join(self.directory, PROFILE_NAME)
+        with open(path, 'w') as reportFile:
+            json.dump(report, reportFile, indent=2)
+        return path
@@ -0,0 +1,205 @@
+# pylint: disable=C0103
+"""
+Reports how an import is getting on with a status line which is redrawn a few times a second, and
+keeps the per-photo detail in a structured log file instead of printing it
+"""
+import os
+import sys
+import json
+import time
+import threading
+import collections
+
+LOG_NAME = ".photo-import-log.jsonl"
+
+DEFAULT_INTERVAL = 1.0
+
+# how often the status is printed when the output isn't a terminal (eg a log over ssh), so the
+# output stays readable
+UNREDRAWABLE_INTERVAL = 30.0
+
+LOG_BUFFER_SIZE = 1024 * 1024
+
+BUCKETS = ["sharp", "questionable", "unsharp"]
+
+
+class Progress:
+    """
+    Counts the photos through each pipeline stage, the buckets they are sorted into and the bytes
+    copied, and shows them (with rates and an ETA) on a status line which a separate thread redraws at
+    a fixed rate. Per-photo events are written to a json lines log, through a large buffer so that
+    they cost next to nothing, and are only printed if asked to be. With no log file and no status
+    line it just counts, which is what the pipeline uses when nothing is watching.
+    """
+    def __init__(self, logPath=None, verbose=False, interval=None, output=None):
+        """
+        Constructs a progress reporter
+
+        logPath:- the file to append the per-photo events to, or None to not keep them
+        verbose:- whether to print each per-photo event as well, as the importer used to
+        interval:- how often to redraw the status line in seconds, or None for no status line
+        output:- the stream to write to, or None for stdout
+        """
+        self.verbose = verbose
+        self.output = output if output is not None else sys.stdout
+        self.lock = threading.Lock()
+        self.stages = collections.OrderedDict()
+        self.finished = set()
+        self.buckets = collections.Counter()
+        self.copyEngine = None
+        self.startTime = time.perf_counter()
+        self.lineLength = 0
+        self.logFile = None
+        if logPath is not None:
+            directory = os.path.dirname(logPath)
+            if directory != '':
+                os.makedirs(directory, exist_ok=True)
+            self.logFile = open(logPath, 'a', buffering=LOG_BUFFER_SIZE)
+
+        self.redraw = self.output.isatty() if hasattr(self.output, 'isatty') else False
+        self.interval = None
+        if interval is not None and not verbose:
+            self.interval = interval if self.redraw else max(interval, UNREDRAWABLE_INTERVAL)
+        self.stopped = threading.Event()
+        self.thread = None
+        if self.interval is not None:
+            self.thread = threading.Thread(target=self.run, name="progress", daemon=True)
+            self.thread.start()
+
+    def countStage(self, name, stage):
+        """
+        Wraps a pipeline stage so that the photos coming out of it are counted
+
+        name:- the name of the stage
+        stage:- a function taking an iterator of items and returning an iterator of items
+        returns:- a function which does the same
+        """
+        def counted(items):
+            with self.lock:
+                self.stages.setdefault(name, 0)
+            for item in stage(items):
+                with self.lock:
+                    self.stages[name] += 1
+                yield item
+            with self.lock:
+                self.finished.add(name)
+        return counted
+
+    def watchCopies(self, copyEngine):
+        """
+        Shows the files and bytes copied by a CopyEngine in the status line
+        """
+        self.copyEngine = copyEngine
+
+    def countBucket(self, bucket):
+        """
+        Counts a photo sorted into a bucket
+        """
+        with self.lock:
+            self.buckets[bucket] += 1
+
+    def log(self, event, source, **fields):
+        """
+        Records something which happened to a photo
+
+        event:- what happened (eg 'copy' or 'skip')
+        source:- the path of the photo
+        fields:- anything else worth recording about it
+        """
+        record = {'time': round(time.time(), 3), 'event': event, 'source': source}
+        record.update(fields)
+        if self.logFile is not None:
+            line = json.dumps(record) + "\n"
+            with self.lock:
+                self.logFile.write(line)
+        if self.verbose:
+            self.message("\t" + " ".join([event, source] + ["%s=%s" % (key, value) for key, value in fields.items()]))
+
+    def message(self, text):
+        """
+        Prints a line without it getting mixed up with the status line
+        """
+        with self.lock:
+            self.clearLine()
+            print(text, file=self.output)
+
+    def run(self):
+        """
+        Redraws the status line until the reporter is closed
+        """
+        while not self.stopped.wait(self.interval):
+            self.draw()
+
+    def draw(self, final=False):
+        """
+        Writes the status line, over the last one if the output is a terminal
+        """
+        line = self.getStatus()
+        with self.lock:
+            if self.redraw and not final:
+                self.output.write("\r" + line.ljust(self.lineLength))
+                self.lineLength = len(line)
+            else:
+                self.clearLine()
+                self.output.write(line + "\n")
+            self.output.flush()
+
+    def clearLine(self):
+        """
+        Blanks the status line, if one is showing on a terminal; the lock must be held
+        """
+        if self.redraw and self.lineLength > 0:
+            self.output.write("\r" + " " * self.lineLength + "\r")
+            self.lineLength = 0
+
+    def getStatus(self):
+        """
+        Describes how far the import has got
+
+        returns:- a one line string
+        """
+        elapsed = time.perf_counter() - self.startTime
+        with self.lock:
+            stages = list(self.stages.items())
+            finished = set(self.finished)
+            buckets = dict(self.buckets)
+        parts = ["%s %d" % (name, count) for name, count in stages]
+        if self.copyEngine is not None:
+            megabytes = self.copyEngine.bytesCopied / (1024 * 1024)
+            parts.append("copied %d files %.0f MB %.1f MB/s" % (self.copyEngine.filesCopied, megabytes, megabytes / max(elapsed, 1e-6)))
+        if buckets:
+            parts.append(" ".join("%s %d" % (bucket, buckets.get(bucket, 0)) for bucket in BUCKETS))
+        if stages:
+            done = stages[-1][1]
+            parts.append("%.1f files/s" % (done / max(elapsed, 1e-6)))
+            if stages[0][0] in finished:
+                # everything has been found, so the total is known
+                remaining = stages[0][1] - done
+                parts.append("ETA %s" % (formatDuration(remaining * elapsed / done) if done > 0 else "?"))
+        return "[%s] %s" % (formatDuration(elapsed), " | ".join(parts))
+
+    def close(self):
+        """
+        Stops redrawing, prints the final status and flushes the log
+        """
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.draw(True)
+        if self.logFile is not None:
+            with self.lock:
+                self.logFile.close()
+
+
+def formatDuration(seconds):
+    """
+    Formats a number of seconds like 1h02m03s
+    """
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours > 0:
+        return "%dh%02dm%02ds" % (hours, minutes, seconds)
+    if minutes > 0:
+        return "%dm%02ds" % (minutes, seconds)
+    return "%ds" % seconds
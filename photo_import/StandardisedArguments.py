@@ -0,0 +1,136 @@
+# pylint: disable=C0103
+"""
+Functions which help standardise how commandline arguments are structured
+
+"""
+import argparse
+
+from .CopyEngine import DEFAULT_JOBS_PER_SOURCE, DEFAULT_JOBS_PER_DESTINATION
+from .Pipeline import DEFAULT_QUEUE_SIZE, READ_ONCE_MODES
+from .Progress import DEFAULT_INTERVAL
+
+
+def add_copy_arguments(parser):
+    """
+    Adds extra arguments to a parser for controlling how files are copied
+
+    parser:- an argparse parser object to add the arguments to
+    Return value:- the parser object that was passed in
+    """
+    parser.add_argument('--copy-jobs-per-source', type=int, default=DEFAULT_JOBS_PER_SOURCE, help="How many files may be read from one source device at once")
+    parser.add_argument('--copy-jobs-per-destination', type=int, default=DEFAULT_JOBS_PER_DESTINATION, help="How many files may be written to one destination device at once")
+    parser.add_argument('--no-sync', action='store_true', help="If this argument is present, copied files aren't fsynced before being renamed into place")
+
+    return parser
+
+
+def add_pipeline_arguments(parser):
+    """
+    Adds extra arguments to a parser for tuning the import pipeline
+
+    parser:- an argparse parser object to add the arguments to
+    Return value:- the parser object that was passed in
+    """
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help="How many photos may wait between one stage of the import and the next")
+    parser.add_argument('--read-once', choices=READ_ONCE_MODES, help="Read each photo off the card only once, either into memory ('buffer') or by copying it to the out folder before sorting it ('copy-first')")
+
+    return parser
+
+
+def add_journal_arguments(parser):
+    """
+    Adds extra arguments to a parser for controlling the import journal
+
+    parser:- an argparse parser object to add the arguments to
+    Return value:- the parser object that was passed in
+    """
+    parser.add_argument('--journal', nargs=1, help="The file to journal the import's progress in. Defaults to a hidden file in the out folder")
+    parser.add_argument('--no-resume', action='store_true', help="If this argument is present, an interrupted import is started again rather than resumed")
+
+    return parser
+
+
+def add_dedup_arguments(parser):
+    """
+    Adds extra arguments to a parser for skipping photos which have already been imported
+
+    parser:- an argparse parser object to add the arguments to
+    Return value:- the parser object that was passed in
+    """
+    parser.add_argument('--dedup', action='store_true', help="If this argument is present, photos whose contents are already somewhere in the out folder are skipped")
+    parser.add_argument('--rebuild-dedup-index', action='store_true', help="If this argument is present, the whole out folder is hashed again before importing, rather than only the photos which are new or have changed since the last --dedup import")
+
+    return parser
+
+
+def add_plan_arguments(parser):
+    """
+    Adds extra arguments to a parser for planning an import and carrying the plan out separately.
+    --input isn't needed to carry out a plan, so it stops being required; the caller has to check it.
+
+    parser:- an argparse parser object to add the arguments to
+    Return value:- the parser object that was passed in
+    """
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--plan-only', nargs=1, help="Work out where every photo goes and write it to the given plan file, without copying anything")
+    group.add_argument('--execute', nargs=1, help="Copy the photos to where the given plan file says they go, instead of searching --input")
+
+    return make_input_optional(parser)
+
+
+def add_profile_arguments(parser):
+    """
+    Adds extra arguments to a parser for measuring where an import's time goes
+
+    parser:- an argparse parser object to add the arguments to
+    Return value:- the parser object that was passed in
+    """
+    parser.add_argument('--profile', nargs=1, help="Measure the time, CPU, I/O and memory of each stage and each photo, and write a report to the given folder")
+    parser.add_argument('--profile-scoring', action='store_true', help="If this argument is present along with --profile, a cProfile of the scoring is written as well")
+
+    return parser
+
+
+def add_progress_arguments(parser):
+    """
+    Adds extra arguments to a parser for controlling how progress is reported
+
+    parser:- an argparse parser object to add the arguments to
+    Return value:- the parser object that was passed in
+    """
+    parser.add_argument('--log', nargs=1, help="The file to log what happened to each photo to, as json lines. Defaults to a hidden file in the out folder")
+    parser.add_argument('--verbose', action='store_true', help="If this argument is present, what happens to each photo is printed as well as logged, instead of showing a status line")
+    parser.add_argument('--progress-interval', type=float, default=DEFAULT_INTERVAL, help="How often to redraw the status line, in seconds")
+
+    return parser
+
+
+def add_benchmark_arguments(parser):
+    """
+    Adds extra arguments to a parser for benchmarking the import. The benchmarks run on synthetic
+    files, so --input stops being required; any NEFs given with it are used for the decode benchmarks.
+
+    parser:- an argparse parser object to add the arguments to
+    Return value:- the parser object that was passed in
+    """
+    parser.add_argument('--repeat', type=int, default=5, help="How many times to time each benchmark")
+    parser.add_argument('--files', type=int, default=1000, help="How many synthetic files to discover, parse and plan")
+    parser.add_argument('--copy-files', type=int, default=20, help="How many synthetic files to copy")
+    parser.add_argument('--copy-size', type=int, default=24, help="The size of each synthetic file to copy, in MB")
+    parser.add_argument('--compare', nargs=1, help="A benchmark json file from another commit to compare the results with")
+
+    return make_input_optional(parser)
+
+
+def make_input_optional(parser):
+    """
+    Stops the --input argument of a basic parser being required
+
+    parser:- an argparse parser object made by create_basic_parser
+    Return value:- the parser object that was passed in
+    """
+    for action in parser._actions: # pylint: disable=W0212
+        if action.dest == 'input':
+            action.required = False
+
+    return parser
@@ -0,0 +1,72 @@
+# pylint: disable=C0103
+"""
+Decides which volume each photo goes in as the photos arrive, rather than after the whole card has
+been grouped
+"""
+
+VOLUME_SIZE = 250
+
+
+class VolumePlanner:
+    """
+    Counts the photos planned under each base path (ie Bucket/Year/Month/Day/Camera) and splits them
+    into numbered volumes of at most VOLUME_SIZE photos. Photos given in sorted order end up in the
+    same volumes as grouping the whole card and then splitting each group would put them.
+
+    Given a DestinationIndex, the planner carries on from the volumes already in the photos tree:
+    new photos go into the last volume until it is full, and a photo which is already in one of the
+    volumes (the same name, size and partial hash) is planned into that volume,
+    so importing a card twice finds the first copies. A different photo which only shares its name
+    with one there is planned as a new photo, into a volume which doesn't have that name in it.
+    """
+    def __init__(self, volumeSize=VOLUME_SIZE, destinationIndex=None):
+        """
+        Constructs a planner with nothing planned
+
+        volumeSize:- the most photos to put in one volume
+        destinationIndex:- the DestinationIndex of the photos tree, or None to number the volumes
+            from 1 as if it were empty
+        """
+        self.volumeSize = volumeSize
+        self.destinationIndex = destinationIndex
+        self.counts = {}
+
+    def plan(self, basePath, name=None, source=None, size=None, partial=None):
+        """
+        Assigns the next photo under a base path to a volume
+
+        basePath:- the partial path the photo is grouped under
+        name:- the photo's file name, needed when there is a destination index
+        source:- the path of the photo, which is claimed in the destination index
+        size:- its size in bytes; a file of the same name is only the same photo if its size and
+            partial hash match too
+        partial:- its partialHash, if it is already known
+        returns:- the volume number, counting from 1
+        """
+        if self.destinationIndex is None:
+            count = self.counts.get(basePath, 0)
+            self.counts[basePath] = count + 1
+            return count // self.volumeSize + 1
+
+        volume = self.destinationIndex.findVolume(basePath, name, source, size, partial)
+        if volume is None:
+            volume, count = self.destinationIndex.getLastVolume(basePath)
+            if count >= self.volumeSize or self.destinationIndex.getOwner(basePath, volume, name) is not None:
+                volume += 1
+            self.destinationIndex.claim(basePath, volume, name, source, size, partial)
+        return volume
+
+    def keep(self, basePath, volume, name, source):
+        """
+        Counts a photo which an earlier, interrupted import planned into a volume, so the volumes
+        fill the same way as they would have
+
+        basePath:- the partial path the photo is grouped under
+        volume:- the volume it was planned into
+        name:- the photo's file name
+        source:- the path of the photo
+        """
+        if self.destinationIndex is None:
+            self.plan(basePath)
+        else:
+            self.destinationIndex.claim(basePath, volume, name, source)
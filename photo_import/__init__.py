@@ -0,0 +1,16 @@
+"""
+The machinery which gets photos off the card and into the photos tree
+"""
+from . import StandardisedArguments
+from .Benchmark import Benchmark, compareReports, getGitCommit, makeSyntheticImage, makeSyntheticTree, writeReport, writeSyntheticTiff
+from .CopyEngine import CopyEngine, STAGING_NAME, getStagingPath, removePartialCopies
+from .DestinationIndex import DestinationIndex, ON_DISK
+from .Discovery import Discovery, mapPerInput, reorder, walkSorted
+from .HashIndex import HashIndex, HASH_INDEX_NAME, partialHash, fullHash
+from .ImportItem import ImportItem
+from .ImportPlan import PlanWriter, readPlan, PLAN_VERSION
+from .Journal import Journal, JOURNAL_NAME
+from .Progress import Progress, LOG_NAME, BUCKETS
+from .Profiling import Profiler, measureCall
+from .Pipeline import Pipeline, OrderedWindow, READ_ONCE_MODES
+from .VolumePlanner import VolumePlanner, VOLUME_SIZE
@@ -4,3 +4,6 @@ p = generic_predictor.RuntimePredictor(['1', 'x0^2', 'x0 x1', 'x0 x1^2', 'x0 x1
 dataPoint = [1, 2, 3]
 result = p.predict(dataPoint)
 print(result)
+
+batch = p.predict_batch([[1, 2, 3], [1, 0, 0], [2, 1, 1]])
+print(batch)
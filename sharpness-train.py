@@ -16,11 +16,15 @@ files = None
 nefImage = None
 lastIndex = 1
 currentRecord = []
-results = [["filename", "wv", "pv", "wg", "pg", "f", "d", "a0", "a1", "a2", "a3", "s"]]
+featureSet = image_sharpness.LEGACY_FEATURE_SET
+results = [["filename"] + image_sharpness.FEATURE_NAMES + ["s"]]
 
 
 def main(args):
-    global files, filesIterator, photoImage, label, lastIndex
+    global files, filesIterator, photoImage, label, lastIndex, featureSet
+    featureSet = image_sharpness.makeFeatureSet(args.feature_set_version, args.pyramid_level)
+    print("Computing %s features; record \"featureSetVersion\": %d and \"pyramidLevel\": %d in the model.json fitted to them" %
+          (image_sharpness.describeFeatureSet(featureSet), featureSet.version, featureSet.pyramidLevel))
     print("Finding NEF files...")
     files = getAllNefFiles(args.input)
     filesIterator = iter(files)
@@ -82,17 +86,11 @@ def nextImage():
     global files, filesIterator, photoImage, label, lastIndex, currentRecord
     label.pack_forget()
     nefImagePath = next(filesIterator)
-    isImage = image_sharpness.Image(nefImagePath)
-    wiVarSharpness = isImage.getWholeImageVarianceSharpness()
-    afVarSharpness = isImage.getVarianceSharpnessForPrimaryAfPoint(lastIndex)
-    wiGradSharpness = isImage.getWholeImageGradientSharpness()
-    afGradSharpness = isImage.getGradientSharpnessForPrimaryAfPoint(lastIndex)
-    focalLength = isImage.getFocalLength()
-    focalDistance = isImage.getFocalDistance()
-    avg0, avg1, avg2, avg3 = isImage.getFourierValues(lastIndex)
-    currentRecord = [nefImagePath, wiVarSharpness, afVarSharpness, wiGradSharpness, afGradSharpness, focalLength, focalDistance, avg0, avg1, avg2, avg3]
-    tileImage = pilImage.fromarray(isImage.getPrimaryAfPointTile('rgb', lastIndex))
-    lastIndex = isImage.getPrimaryAfPointIndex(lastIndex)
+    isImage = image_sharpness.Image(nefImagePath, featureSet=featureSet)
+    afPointIndex = isImage.getPrimaryAfPointIndex(lastIndex)
+    currentRecord = [nefImagePath] + image_sharpness.getFeaturesForImage(isImage, afPointIndex)
+    tileImage = pilImage.fromarray(isImage.getAfPointTile(afPointIndex, 'rgb'))
+    lastIndex = afPointIndex
     photoImage = tkImage.PhotoImage(tileImage)
     label.config(image = photoImage)
     label.pack()
@@ -116,5 +114,6 @@ if __name__ == "__main__":
     parser = python_batch_processing.StandardisedArguments.create_basic_parser(
         "Import digital photos from a memory card into a nice structure")
     parser = image_sharpness.StandardisedArguments.add_sharpness_arguments(parser)
+    parser = image_sharpness.StandardisedArguments.add_feature_set_arguments(parser)
     arguments = parser.parse_args()
     main(arguments)
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+Compares how long it takes to get the date and camera model out of a directory of NEFs with
+exifread (as readMetadata does), with exifread told to skip the MakerNote, and with the minimal
+TIFF tag reader used for grouping. Also checks that they all agree.
+"""
+# pylint: disable=C0103
+import os
+import csv
+import time
+
+import exifread
+
+import python_batch_processing
+import image_sharpness
+
+
+def main(args):
+    """
+        The main function of the program. Orchestrates the work
+    """
+    files = getAllNefFiles(args.input)
+    print("Benchmarking on", len(files), "files")
+
+    # one untimed pass so every reader sees a warm page cache
+    for file in files:
+        readWithTiffTags(file)
+
+    readers = [
+        ("exifread", readWithExifread),
+        ("exifread details=False", readWithExifreadNoDetails),
+        ("TiffTags", readWithTiffTags)
+    ]
+    results = {}
+    rows = []
+    for name, reader in readers:
+        startTime = time.perf_counter()
+        results[name] = [reader(file) for file in files]
+        elapsed = time.perf_counter() - startTime
+        perFile = elapsed / max(len(files), 1)
+        print("\t%s: %.3fs, %.2fms per file" % (name, elapsed, 1000 * perFile))
+        rows.append([name, len(files), elapsed, perFile])
+
+    for name, _ in readers[1:]:
+        disagreements = [file for file, a, b in zip(files, results["exifread"], results[name]) if a != b]
+        print("\t%s disagrees with exifread on %d files" % (name, len(disagreements)))
+        for file in disagreements[:10]:
+            print("\t\t", file)
+
+    os.makedirs(args.out[0], exist_ok=True)
+    with open(os.path.join(args.out[0], "tag-reader-benchmark.csv"), 'w', newline='') as resultsFile:
+        w = csv.writer(resultsFile)
+        w.writerow(["reader", "files", "seconds", "secondsPerFile"])
+        w.writerows(rows)
+
+
+def readWithExifread(file):
+    """
+    Reads the date and model with a full exifread parse, MakerNote and all
+    """
+    with open(file, 'rb') as nefFile:
+        tags = exifread.process_file(nefFile)
+    return str(tags["Image DateTime"]), str(tags["Image Model"])
+
+
+def readWithExifreadNoDetails(file):
+    """
+    Reads the date and model with exifread, skipping the MakerNote
+    """
+    with open(file, 'rb') as nefFile:
+        tags = exifread.process_file(nefFile, details=False)
+    return str(tags["Image DateTime"]), str(tags["Image Model"])
+
+
+def readWithTiffTags(file):
+    """
+    Reads the date and model with the minimal TIFF tag reader
+    """
+    metadata = image_sharpness.readBasicMetadata(file)
+    return metadata.dateTime, metadata.model
+
+
+def getAllNefFiles(inputLocations):
+    """
+    Uses the recursive search functionality to return a list of NEF files
+
+    inputLocations:- a list of locations to search below
+    returns:- a list of all the NEF files found below each of the search locations
+    """
+    searcher = python_batch_processing.RecursiveSearch.RecursiveSearch(
+        lambda path: path.lower().endswith(".nef"))
+    files = searcher.search_many(inputLocations)
+    return sorted(files)
+
+
+if __name__ == "__main__":
+    parser = python_batch_processing.StandardisedArguments.create_basic_parser(
+        "Benchmark reading the date and camera model of NEF files")
+    arguments = parser.parse_args()
+    main(arguments)